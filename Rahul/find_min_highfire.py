@@ -1,3 +1,5 @@
+import numpy as np
+
 def find_min_highfire(a):
     idx_range = np.arange(len(a))
     for idx in idx_range[::-1][1:-1]:
@@ -63,7 +63,7 @@ def get_highfire_starts(sdf,pre_stim_time,min_start_time):#final
         if not np.isnan(out_idx):
             #get the index in the middle of the detected starting trough and immediate next peak for greater accuracy
             idx_temp=argrelextrema(sdf_stim[out_idx:],np.greater_equal,order=2)[0][0]
-            out_idx=out_idx+(idx_temp/2);
+            out_idx=out_idx+(idx_temp//2);
             out_idx=out_idx+min_start_time;#adjust for the minimum baseline time not considered
     #####negative side -- adapting the same algorithm above for negative sdf
     sdf_stim=-sdf[(int(1000*(pre_stim_time))+min_start_time):]
@@ -103,7 +103,7 @@ def get_highfire_starts(sdf,pre_stim_time,min_start_time):#final
         
         if not np.isnan(out_idx2):
             idx_temp=argrelextrema(sdf_stim[out_idx2:],np.greater_equal,order=2)[0][0]
-            out_idx2=out_idx2+(idx_temp/2);
+            out_idx2=out_idx2+(idx_temp//2);
             out_idx2=out_idx2+min_start_time;
     l1=out_idx
     l2=out_idx2
@@ -0,0 +1,166 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Same detection as get_highfire_starts, without rescanning the sdf
+
+The trough walk in get_highfire_starts only ever looks at prefixes of the
+post-stimulus sdf, and troughs and local maxima of a prefix are those of the
+whole sdf except at its last two points. So troughs and extrema are found
+once per sdf and every find_min_highfire / argrelextrema call in the walk
+becomes a lookup in those index arrays.
+"""
+import numpy as np
+from scipy.stats import iqr
+
+
+def get_extrema_index(sdf_stim):
+    '''
+    Precomputes what the trough walk needs from one post-stimulus sdf.
+    Input : sdf after stimulus onset (+ minimum start time)
+    Output : dict with
+             'left', 'right' : sdf[i] >= both neighbours on that side (order 2, clipped at the ends)
+             'extrema' : indices of argrelextrema(sdf_stim, np.greater_equal, order=2)
+             'troughs' : indices find_min_highfire can stop at (a[i]<a[i+1] and a[i]<=a[i-1])
+    '''
+    n = len(sdf_stim)
+    prev1 = sdf_stim[np.maximum(np.arange(n) - 1, 0)]
+    prev2 = sdf_stim[np.maximum(np.arange(n) - 2, 0)]
+    next1 = sdf_stim[np.minimum(np.arange(n) + 1, n - 1)]
+    next2 = sdf_stim[np.minimum(np.arange(n) + 2, n - 1)]
+    left = (sdf_stim >= prev1) & (sdf_stim >= prev2)
+    right = (sdf_stim >= next1) & (sdf_stim >= next2)
+    troughs = np.flatnonzero((sdf_stim[1:-1] < sdf_stim[2:]) & (sdf_stim[1:-1] <= sdf_stim[:-2])) + 1
+    return {'left': left, 'right': right, 'extrema': np.flatnonzero(left & right), 'troughs': troughs}
+
+
+def find_min_highfire_indexed(troughs, length):
+    '''
+    find_min_highfire(sdf_stim[:length]) from the trough indices of sdf_stim
+    '''
+    # Last trough with both neighbours inside the prefix, 1 if there is none
+    t_ind = np.searchsorted(troughs, length - 2, side='right') - 1
+    idx = troughs[t_ind] if t_ind >= 0 else 1
+    if idx == 2:
+        idx = 1
+    return idx
+
+
+def last_prefix_extremum(sdf_stim, index, length):
+    '''
+    argrelextrema(sdf_stim[:length], np.greater_equal, order=2)[0][-1]
+    '''
+    # The last two points of a prefix are compared to its (clipped) end
+    if index['left'][length - 1]:
+        return length - 1
+    if length > 1 and index['left'][length - 2] and sdf_stim[length - 2] >= sdf_stim[length - 1]:
+        return length - 2
+    e_ind = np.searchsorted(index['extrema'], length - 3, side='right') - 1
+    if e_ind < 0:
+        return None
+    return index['extrema'][e_ind]
+
+
+def first_suffix_extremum(sdf_stim, index, start):
+    '''
+    argrelextrema(sdf_stim[start:], np.greater_equal, order=2)[0][0]
+    '''
+    # The first two points of a suffix are compared to its (clipped) start
+    if index['right'][start]:
+        return 0
+    if start + 1 < len(sdf_stim) and index['right'][start + 1] and sdf_stim[start + 1] >= sdf_stim[start]:
+        return 1
+    e_ind = np.searchsorted(index['extrema'], start + 2, side='left')
+    return index['extrema'][e_ind] - start
+
+
+def walk_to_highfire_start(sdf_stim, index, thresh0, min_start_time):
+    '''
+    The trough walk of get_highfire_starts on one side (positive or negated sdf).
+    Output : start index (adjusted as in get_highfire_starts), nan if no peak
+             passes thresh0, None if there are no local maxima at all
+    '''
+    extrema = index['extrema']
+    if len(extrema) == 0:
+        return None
+    if np.all(sdf_stim[extrema] < thresh0):
+        return np.nan
+
+    sdf_max_idx = np.argmax(sdf_stim)
+    subset_length = sdf_max_idx
+    out_idx = sdf_max_idx
+    while subset_length >= 3:
+        trough_idx = find_min_highfire_indexed(index['troughs'], subset_length)
+        if out_idx - trough_idx >= 75:
+            break
+        out_idx = trough_idx
+        # Trough has to be in the 75 percentile band of the sdf before it
+        if sdf_stim[out_idx] < np.percentile(sdf_stim[:out_idx], 75):
+            break
+        last_max = last_prefix_extremum(sdf_stim, index, out_idx)
+        if last_max is None:
+            break
+        subset_length = last_max
+
+    # Middle of the starting trough and the next peak
+    idx_temp = first_suffix_extremum(sdf_stim, index, out_idx)
+    return out_idx + idx_temp//2 + min_start_time
+
+
+def get_spread(baseline):
+    '''
+    stats.variation(np.abs(baseline))*iqr(np.log(np.abs(baseline))) per row
+    '''
+    abs_baseline = np.abs(baseline)
+    variation = np.std(abs_baseline, axis=1)/np.mean(abs_baseline, axis=1)
+    # iqr and not np.percentile: with zero bins (log = -inf) iqr gives inf
+    # where the percentiles interpolate to nan
+    return variation*iqr(np.log(abs_baseline), axis=1)
+
+
+def get_highfire_starts_batch(sdfs, pre_stim_time, min_start_time):
+    '''
+    get_highfire_starts for many sdfs at once.
+    Input : An array (sdfs x time) of spike density functions (one per millisecond),
+            Time (in seconds) until stimulus onset,
+            Minimum latency (in ms) after stimulus onset
+    Output : Array of high-firing start indices after stimulus (nan where none is found)
+    '''
+    sdfs = np.atleast_2d(np.asarray(sdfs, dtype=float))
+    onset = int(1000*(pre_stim_time))
+
+    # Thresholds of all sdfs at once, both signs
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        baseline = sdfs[:, onset - 15:onset + 15]
+        pos_thresh = np.percentile(baseline, 50, axis=1)*np.exp(25*get_spread(baseline))
+        no_baseline = np.mean(baseline, axis=1) == 0
+        baseline = -sdfs[:, onset - 20:onset + 20]
+        neg_thresh = np.percentile(baseline, 50, axis=1)*np.exp(-25*get_spread(baseline))
+
+    latencies = np.full(len(sdfs), np.nan)
+    for s_ind, sdf in enumerate(sdfs):
+        if no_baseline[s_ind] or np.isnan(pos_thresh[s_ind]):
+            continue
+        sdf_stim = sdf[onset + min_start_time:]
+        l1 = walk_to_highfire_start(sdf_stim, get_extrema_index(sdf_stim), pos_thresh[s_ind], min_start_time)
+        if l1 is None:
+            l1 = np.nan
+        if np.isnan(neg_thresh[s_ind]):
+            continue
+        sdf_stim = -sdf_stim
+        l2 = walk_to_highfire_start(sdf_stim, get_extrema_index(sdf_stim), neg_thresh[s_ind], min_start_time)
+        # As in get_highfire_starts, a side without a passing peak takes the
+        # positive side's result. get_highfire_starts then adjusts it a second
+        # time, which can only make it later (min picks l1 anyway), or raises
+        # IndexError when that lands past the last peak; here it is l1 as is
+        if l2 is None or np.isnan(l2):
+            l2 = l1
+        if not (np.isnan(l1) and np.isnan(l2)):
+            latencies[s_ind] = np.nanmin([l1, l2])
+    return latencies
+
+
+def get_highfire_starts_fast(sdf, pre_stim_time, min_start_time):
+    '''
+    Drop-in replacement for get_highfire_starts (same inputs and output)
+    '''
+    return get_highfire_starts_batch(sdf[None, :], pre_stim_time, min_start_time)[0]
@@ -33,7 +33,10 @@ sys.path.append('D:/resources/mindreading/Sara/')
 from neuropixel_data import open_experiment, check_folder, get_depth
 
 sys.path.append('D:/resources/mindreading/Sebastien/')
-from SDF import SDF
+from SDF import SDF_stats
+
+sys.path.append('D:/resources/mindreading/Shared/')
+from precision import get_raster_dtype
 
 #%% IMPORT DATA IF NEEDED
 drive_path = os.path.normpath('d:/visual_coding_neuropixels/')
@@ -105,7 +108,7 @@ for region in region_list:
         
         for unit in units_on_probe_in_structure: # Loop through units on probe
             
-            raster_matrix = np.zeros((num_trials, window_length))            
+            raster_matrix = np.zeros((num_trials, window_length), dtype=get_raster_dtype())            
             unit_spikes = probe_spikes[unit]
             
             #Loop through every presentation of any image to create raster matrix
@@ -118,10 +121,8 @@ for region in region_list:
                 #Add list of spikes to main list
                 raster_matrix[i,spike_timestamps] = 1
             
-            # Compute SDF on raster matrix    
-            sdf = SDF(raster_matrix,5)    
-            mean_SDF = sdf.mean(axis=0)
-            std_SDF = sdf.std(axis=0)
+            # Compute SDF statistics on raster matrix, 100 trials at a time
+            mean_SDF, std_SDF = SDF_stats(raster_matrix, 5)
             SEM_SDF = std_SDF/np.sqrt(num_trials)
             CI95_SDF = SEM_SDF*1.96
             CI99_SDF = SEM_SDF*2.58
@@ -33,7 +33,7 @@ sys.path.append('D:/resources/mindreading_repo/mindreading/Sebastien/')
 from SDF import SDF
 
 sys.path.append('D:/resources/mindreading/Rahul/')
-from get_highfire_starts import get_highfire_starts
+from get_highfire_starts_fast import get_highfire_starts_fast as get_highfire_starts
 from find_min_highfire import find_min_highfire
 
 #%% IMPORT DATA IF NEEDED
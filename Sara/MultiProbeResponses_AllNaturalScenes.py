@@ -16,13 +16,16 @@ import matplotlib.pyplot as plt
 
 # Settings
 pre_time = 0.1
+post_time = 0.25
 bin_width = 0.005
-bins = [x*bin_width for x in range(-20,51)]
 scale_psth = 1  # multiplier to PSTHs for visibility
 
 drive_path = os.path.normpath('d:/visual_coding_neuropixels')
 sys.path.append(os.path.normpath('d:/resources/swdb_2018_neuropixels/'))
 from swdb_2018_neuropixels.ephys_nwb_adapter import NWB_adapter
+sys.path.append(os.path.normpath('d:/resources/mindreading/sara/'))
+from neuropixel_heatmap import get_session_heatmaps, get_region_heatmap
+from neuropixel_plots import probe_heatmap
 manifest_file = os.path.join(drive_path,'ephys_manifest.csv')
 
 # Create experiment dataframe
@@ -41,40 +44,19 @@ data_set = NWB_adapter(nwb_file)
 probe_list = data_set.probe_list
 print('Neuropixel probes: ', probe_list)
 
-# Get the stimulus type table
-ns_table = data_set.get_stimulus_table('natural_scenes')
+# Depth-sorted PSTHs of every unit on every probe (cached after the first run)
+heatmaps = get_session_heatmaps(data_set, 'natural_scenes', pre_time, post_time, bin_width)
 
 for probe_name in data_set.probe_list:
     print('Starting analysis for: {}'.format(probe_name))
     fig_name = '/Probe{}_AllImages'.format(probe_name[-1])
+    heatmap = heatmaps[probe_name]
+    edges = heatmap['edges']
     
-    # Get the spikes from one neuropixel probe
-    probe_spikes = data_set.spike_times[probe_name]
-
-    all_trains = {}
-    # Subset of dataframe corresponding to chosen probe
-    probe_df = data_set.unit_df[(data_set.unit_df['probe']==probe_name)]
-    # Sort by depth so iterrows runs in depth order (idk if this works)
-    probe_df.sort_values('depth', ascending=False)
-    
-    # Get the spikes around each stimulus presentation
-    for i, unit_row in probe_df.iterrows():
-        spike_train = probe_spikes[unit_row['unit_id']]
-        stim_train = []
-        for image_id in np.unique(ns_table['frame']):
-            frame_table = ns_table[ns_table.frame == image_id]
-            for j, stim_row in frame_table.iterrows():
-                current_train = spike_train[(spike_train > stim_row['start'] - pre_time) & (spike_train <= stim_row['end'])] - stim_row['start']
-                stim_train.append(current_train)
-        all_trains[unit_row['unit_id']] = stim_train  
-    
-    # PSTH calculation & plotting
-    all_counts = []
+    # PSTH plotting
     fig,ax = plt.subplots(1,1,figsize=(15,20))
-    for i, unit_row in probe_df.iterrows():
-        counts, edges = np.histogram(np.hstack(all_trains[unit_row['unit_id']]), bins=bins)
-        plt.plot(edges[1:], unit_row['depth']+scale_psth * counts)
-        all_counts.append(counts)        
+    for counts, depth in zip(heatmap['counts'], heatmap['depth']):
+        plt.plot(edges[1:], depth + scale_psth * counts)
     ax.set_ylabel('Depth')
     ax.axvspan(-0.2,0,color='gray',alpha=0.2);
     ax.set_xlim([-0.1, 0.25])
@@ -82,13 +64,12 @@ for probe_name in data_set.probe_list:
     fig.savefig(os.path.normpath(image_path + fig_name + '_psth.png'))	
            
     # Heat map
-    fig,ax = plt.subplots(1,1,figsize=(15,20))
-    plt.imshow(np.vstack(all_counts))
+    fig, ax = probe_heatmap(heatmap['counts'], heatmap['depth'], edges, pre_time)
     ax.set_title(fig_name)
     fig.savefig(os.path.normpath(image_path + fig_name + '_heatmap.png'))
     
     # Split by brain region
-    all_regions = probe_df['structure'].unique()
+    all_regions = pd.unique(heatmap['structure'])
     print('Probe{} has {} structures: '.format(probe_name[-1], len(all_regions)))
     print(all_regions)
     
@@ -98,14 +79,11 @@ for probe_name in data_set.probe_list:
     region_counts = {}
     region_depths = {}
     for i, region_name in enumerate(all_regions):
-        region_counts[region_name] = []
-        region_depths[region_name] = []
-        region_df = probe_df[probe_df['structure'] == region_name]
-        for j, row in region_df.iterrows():
-            counts, edges = np.histogram(np.hstack(all_trains[row['unit_id']]), bins=bins)
-            ax[i].plot(edges[1:], row['depth'] + counts, linewidth=0.7)
-            region_counts[region_name].append(counts)
-            region_depths[region_name].append(row['depth'])
+        region_heatmap = get_region_heatmap(heatmap, region_name)
+        region_counts[region_name] = region_heatmap['counts']
+        region_depths[region_name] = region_heatmap['depth']
+        for counts, depth in zip(region_counts[region_name], region_depths[region_name]):
+            ax[i].plot(edges[1:], depth + counts, linewidth=0.7)
         
         ax[i].set_title('Probe{} - {} PSTH'.format(probe_name[-1], region_name))
         ax[i].set_ylabel('Depth')
@@ -133,6 +111,6 @@ for probe_name in data_set.probe_list:
     for i, region_name in enumerate(all_regions):
         fig_name = 'Probe{}_{}'.format(probe_name[-1], region_name)
         fig, ax = plt.subplots(1, 1, figsize=(10,10))
-        ax.imshow(np.vstack(region_counts[region_name]))
+        ax.imshow(region_counts[region_name])
         ax.set_title('Probe{} - {} PSTH'.format(probe_name[-1], region_name))
         fig.savefig(os.path.normpath(image_path + fig_name + '_psth.png'))
@@ -15,7 +15,6 @@ from __future__ import print_function
 
 import os
 import sys
-import pickle
 
 import numpy as np
 import pandas as pd
@@ -30,8 +29,8 @@ sns.plotting_context(rc={'font.size': 18})
 #%% SPECIFIC IMPORTS
 sys.path.append('d:/resources/mindreading/sara')
 from neuropixel_plots import probe_heatmap, region_cmap, receptive_field_map
-from neuropixel_spikes import get_avg_psth
-from neuropixel_data import open_experiment
+from neuropixel_rf import get_rf_cube, get_region_rf_maps, normalize_rf_maps
+from neuropixel_data import open_experiment, load_rf_cube, save_rf_cube
 
 #%% SET PATHS
 drive_path = os.path.normpath('d:/visual_coding_neuropixels')
@@ -81,53 +80,23 @@ for probe_name in probe_list:
     region_list = probe_df['structure'].unique()
     print('{} regions: '.format(len(region_list)), region_list)
     
-    # AVERAGE PSTHs 
-    # Calculated each unique combination of x, y and orientation
-    # Or load pre-calculated from an existing .pkl file
-    file_name = os.path.join(rf_path, '{}_{}_gabor_rf.pkl'.format(expt_index, probe_name))
-    if os.path.exists(file_name):
-        data = pickle.load(open(file_name))
-        print('Loaded from {}'.format(file_name))
-        save_flag = False
-    else:
-        data = []
-        for unit in unit_list:
-            unit_spikes = probe_spikes[unit]
-            region_name = probe_df[probe_df['unit_id']==unit]['structure'].values[0]
-            for i, x in enumerate(x_list):
-                for j, y in enumerate(y_list):
-                    for k, t in enumerate(ori_list):
-                        tmp_df = gabors[(gabors['pos_x']==x) & (gabors['pos_y']==y) & (gabors['orientation']==t)]
-                        psth, centers = get_avg_psth(tmp_df, unit_spikes)
-                        resp = np.sum(psth[centers > 0])
-                        ind = str(i) + str(j) + str(k)
-                        data.append([ind, unit, region_name, x, y, t, psth, resp])
-        gabor_analysis = pd.DataFrame(data, columns=['stim_id', 'unit_id', 'structure', 'x', 'y', 't', 'psth', 'resp'])
-        save_flag = True  # Save the output
-    
-    # SAVE
-    if save_flag:
-        print('Saving as: {}'.format(file_name))
-        f = open(file_name, 'wb')
-        pickle.dump(gabor_analysis, f)
-        f.close()
+    # AVERAGE PSTHs
+    # Calculated for each unique combination of x, y and orientation
+    # Or load pre-calculated from an existing .npz file
+    rf_cube = load_rf_cube(expt_index, probe_name)
+    if rf_cube is None:
+        rf_cube = get_rf_cube(gabors, probe_spikes, probe_df)
+        save_rf_cube(rf_cube, expt_index, probe_name)
     
     # RECEPTIVE FIELD MAPS
-    # Init empty map (orientation * x * y)
-    rf_map = np.finfo(float).eps + np.zeros(shape=[3, len(x_list), len(y_list)])
+    # Mean map per region (region * orientation * x * y)
+    rf_maps, region_list = get_region_rf_maps(rf_cube, region_list)
+    # Normalize receptive fields by the maximum value
+    norm_maps = normalize_rf_maps(rf_maps)
     
-    # Map per region
-    for region in region_list:
-        region_analysis = gabor_analysis[gabor_analysis['structure'] == region]
-        for i, x in enumerate(x_list):
-            for j, y in enumerate(y_list):
-                for k, t in enumerate(ori_list):
-                    ind = np.where(region_analysis['stim_id'] == str(i)+str(j)+str(k))
-                    rf_map[k, i, j] = np.mean(region_analysis['resp'].values[ind])
+    for region, rf_map, norm_map in zip(region_list, rf_maps, norm_maps):
         if rf_map.max() == 0:
             continue
-        # Normalize receptive fields by the maximum value
-        norm_map = rf_map/rf_map.max()
         
         # Average RF per orientation
         fig, ax = receptive_field_map(norm_map, cmap=region_cmap(region))
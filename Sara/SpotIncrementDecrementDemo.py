@@ -34,6 +34,7 @@ sys.path.append(os.path.normpath('d:/resources/swdb_2018_neuropixels/'))
 from swdb_2018_neuropixels.ephys_nwb_adapter import NWB_adapter
 sys.path.append(os.path.normpath('d:/resources/mindreading_repo/mindreading/sara/'))
 from neuropixel_plots import probe_heatmap
+from neuropixel_data import LazyNWBDataset
 
 manifest_file = os.path.join(drive_path,'ephys_manifest.csv')
 
@@ -48,7 +49,8 @@ nwb_file = os.path.join(drive_path, multi_probe_filename)
 print('Importing data file from {}'.format(nwb_file))
 
 
-data_set = NWB_adapter(nwb_file)
+# Only probeE is analyzed, so only its spike times are loaded
+data_set = LazyNWBDataset(nwb_file)
 probe_list = data_set.probe_list
 print('Neuropixel probes: ', probe_list)
 
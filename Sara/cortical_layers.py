@@ -13,15 +13,30 @@ import numpy as np
 import scipy.signal 
 from scipy.stats import binned_statistic
 
-import matplotlib.pyplot as plt 
-import seaborn as sns
-sns.set_context('talk', font_scale=1.6, rc={'lines.markeredgewidth': 2})
-sns.plotting_context(rc={'font.size': 18})
-sns.set_style('white')
-sns.set_palette('deep')
-
 sys.path.append(os.path.normpath('d:/resources/mindreading/sara/'))
-from neuropixel_plots import region_color
+
+_plotting = {}
+
+def get_plotting():
+    """
+    Import matplotlib and seaborn (and set the figure style) the first time
+    a figure is made, so the analysis functions import without them
+
+    Returns
+    -------
+    plt : matplotlib.pyplot
+    sns : seaborn
+    """
+    if not _plotting:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        sns.set_context('talk', font_scale=1.6, rc={'lines.markeredgewidth': 2})
+        sns.plotting_context(rc={'font.size': 18})
+        sns.set_style('white')
+        sns.set_palette('deep')
+        _plotting['plt'] = plt
+        _plotting['sns'] = sns
+    return _plotting['plt'], _plotting['sns']
 
 def units_by_depth(depth_df):
     """
@@ -56,6 +71,7 @@ def plot_units_by_depth(depth_df, ax=[], save_path=[], **kwargs):
     -------
     ax : axis handle
     """
+    plt, sns = get_plotting()
     if not ax:
         ax = sns.countplot(x='depth', data=depth_df, **kwargs)
     else:
@@ -74,6 +90,7 @@ def plot_units_by_depth(depth_df, ax=[], save_path=[], **kwargs):
 
 def plot_latency_by_depth(depth_df, show_data=False, save_path=[], ax=[]):
     
+    plt, sns = get_plotting()
     if not ax:
         fig, ax = plt.subplots()
     else:
@@ -109,6 +126,7 @@ def latency_by_depth_hist(depth_df, bin_size=50, use_median=False, ax=[], show_d
         Plot label for legend (default = [])
     """
 
+    plt, sns = get_plotting()
     if not ax:
         fig, ax = plt.subplots()
     stim_dict = {}
@@ -172,6 +190,7 @@ def latency_depth_binstat(depth_df, color='k',shade=[], bin_size=50, ax=[]):
         Size of depth bins in microns
     """
     
+    plt, sns = get_plotting()
     if not ax:
         _, ax = plt.subplots()
     
@@ -228,6 +247,7 @@ def latency_by_depth(depth_df, sg_window=5, sg_bins=20, sg_order=2, use_median=F
     stim_dict : dict of depths, latencies and smoothed/binned plotted values
     """
     
+    plt, sns = get_plotting()
     if not ax:
         fig, ax = plt.subplots()
     stim_dict = {}
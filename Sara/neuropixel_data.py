@@ -8,13 +8,19 @@ Created on Sun Aug 26 16:12:53 2018
 """
 import os
 import pickle
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 from swdb_2018_neuropixels.ephys_nwb_adapter import NWB_adapter
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from experiment_cache import get_cached_experiment
 
 rf_path = os.path.normpath('D:/RFMaps/')
 latency_path = os.path.normpath('D:/Latencies/')
+heatmap_path = os.path.normpath('D:/Heatmaps/')
 
-def open_experiment(drive_path, expt_num=0, multi_probe=True):
+def open_experiment(drive_path, expt_num=0, multi_probe=True, lazy=False, memory_budget=2e9):
     """
     Open a neuropixel probe experiment, return dataset object
     
@@ -26,6 +32,11 @@ def open_experiment(drive_path, expt_num=0, multi_probe=True):
         Import multiprobe data (true) or single probe data (false)
     expt_num : optional, default = 0
         Experiment number to load
+    lazy : optional, false
+        Return a LazyNWBDataset, spikes are loaded per probe as needed
+    memory_budget : optional, default = 2e9 (bytes)
+        Spike time memory budget of the LazyNWBDataset, set when the file is
+        first opened (a cached dataset keeps its budget)
     
     Returns
     -------
@@ -43,8 +54,11 @@ def open_experiment(drive_path, expt_num=0, multi_probe=True):
     nwb_file = os.path.join(drive_path, multi_probe_filename)
     print('Importing data file from {}'.format(nwb_file))
 
-    # Import the data file
-    data_set = NWB_adapter(nwb_file)
+    # Import the data file (or reuse it, if opened before in this session)
+    if lazy:
+        data_set = get_cached_experiment(nwb_file, LazyNWBDataset, {'memory_budget': memory_budget})
+    else:
+        data_set = get_cached_experiment(nwb_file, NWB_adapter)
     
     # Print experiment info
     print('Regions: ', data_set.region_list)
@@ -58,6 +72,220 @@ def open_experiment(drive_path, expt_num=0, multi_probe=True):
     return data_set
 
 
+class LazyNWBDataset(object):
+    """
+    Stand-in for NWB_adapter that reads spike times one probe at a time
+
+    Parameters
+    ----------
+    nwb_path : str
+        Path to the .nwb file
+    memory_budget : optional, default = 2e9 (bytes)
+        Once the loaded spike times exceed this, the least recently used
+        probes are dropped (and re-read from disk if needed again)
+
+    Notes
+    -----
+    unit_df, probe_list and region_list are read when the dataset is
+    opened. Spike times are read from processing/<probe>/UnitTimes the
+    first time data_set.spike_times[probe] is accessed. Stimulus tables are
+    read from stimulus/presentation the first time one is requested (from
+    NWB_adapter only for files without that group).
+    """
+    def __init__(self, nwb_path, memory_budget=2e9):
+        self.nwb_path = nwb_path
+        self.memory_budget = memory_budget
+        self.spike_times = _LazySpikeTimes(self)
+        self.stim_tables = _LazyStimTables(self)
+        self._stim_tables = None
+
+        import h5py
+        with h5py.File(nwb_path, 'r') as f:
+            self.probe_list = list(f['processing'].keys())
+            try:
+                self.unit_df = _read_unit_df(f, self.probe_list)
+            except KeyError:
+                self.unit_df = None
+        if self.unit_df is None:
+            self._load_adapter_tables()
+        self.region_list = list(self.unit_df['structure'].unique())
+
+    def get_stimulus_table(self, stim_name):
+        """
+        Parameters
+        ----------
+        stim_name : str
+            Stimulus name
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        return self.stim_tables[stim_name]
+
+    def memory_usage(self):
+        """
+        Returns
+        -------
+        dict
+            Bytes of spike times held per loaded probe, and of the stimulus
+            tables ('stim_tables') once read
+        """
+        usage = dict(self.spike_times._nbytes)
+        if self._stim_tables is not None:
+            usage['stim_tables'] = sum(int(stim_table.memory_usage(deep=True).sum()) for stim_table in self._stim_tables.values())
+        return usage
+
+    def _load_stim_tables(self):
+        if self._stim_tables is None:
+            import h5py
+            with h5py.File(self.nwb_path, 'r') as f:
+                try:
+                    self._stim_tables = _read_stim_tables(f)
+                except KeyError:
+                    self._stim_tables = None
+            if self._stim_tables is None:
+                self._load_adapter_tables()
+        return self._stim_tables
+
+    def _load_adapter_tables(self):
+        # Files the h5 readers don't cover: the NWB_adapter parses them (and
+        # reads every probe's spikes, which are dropped)
+        adapter = NWB_adapter(self.nwb_path)
+        if self._stim_tables is None:
+            self._stim_tables = dict(adapter.stim_tables)
+        if self.unit_df is None:
+            self.unit_df = adapter.unit_df
+        del adapter
+
+
+class _LazySpikeTimes(object):
+    """spike_times[probe][unit], probes read on first access (LRU evicted)"""
+    def __init__(self, dataset):
+        self._dataset = dataset
+        self._probes = OrderedDict()
+        self._nbytes = {}
+
+    def __getitem__(self, probe_name):
+        if probe_name in self._probes:
+            # Most recently used last
+            probe_spikes = self._probes.pop(probe_name)
+        else:
+            import h5py
+            if probe_name not in self._dataset.probe_list:
+                raise KeyError(probe_name)
+            with h5py.File(self._dataset.nwb_path, 'r') as f:
+                probe_spikes = _read_probe_spikes(f, probe_name)
+            self._nbytes[probe_name] = sum(train.nbytes for train in probe_spikes.values())
+        self._probes[probe_name] = probe_spikes
+        self._evict(keep=probe_name)
+        return probe_spikes
+
+    def _evict(self, keep):
+        while sum(self._nbytes[probe] for probe in self._probes) > self._dataset.memory_budget:
+            probe_name = next(iter(self._probes))
+            if probe_name == keep:
+                break
+            del self._probes[probe_name]
+            del self._nbytes[probe_name]
+
+    def __contains__(self, probe_name):
+        return probe_name in self._dataset.probe_list
+
+    def __iter__(self):
+        return iter(self._dataset.probe_list)
+
+    def __len__(self):
+        return len(self._dataset.probe_list)
+
+    def keys(self):
+        return list(self._dataset.probe_list)
+
+    def has_key(self, probe_name):
+        return probe_name in self
+
+    def loaded(self):
+        """Probes currently in memory, least recently used first"""
+        return list(self._probes.keys())
+
+
+class _LazyStimTables(object):
+    """stim_tables[stim_name], read the first time any table is requested"""
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def _tables(self):
+        return self._dataset._load_stim_tables()
+
+    def __getitem__(self, stim_name):
+        return self._tables()[stim_name]
+
+    def __contains__(self, stim_name):
+        return stim_name in self._tables()
+
+    def __iter__(self):
+        return iter(self._tables())
+
+    def keys(self):
+        return list(self._tables().keys())
+
+    def items(self):
+        return self._tables().items()
+
+    def has_key(self, stim_name):
+        return stim_name in self
+
+
+def _read_probe_spikes(f, probe_name):
+    # Every group under UnitTimes is a unit holding its spike 'times'
+    unit_times = f['processing'][probe_name]['UnitTimes']
+    probe_spikes = {}
+    for unit in unit_times.keys():
+        if hasattr(unit_times[unit], 'keys') and 'times' in unit_times[unit]:
+            probe_spikes[unit] = unit_times[unit]['times'][()]
+    return probe_spikes
+
+
+def _read_stim_tables(f):
+    # One table per stimulus/presentation group: its 'features' columns of
+    # 'data' plus start and end from 'timestamps' (names without the
+    # '_stimulus' suffix, as NWB_adapter)
+    stim_tables = {}
+    presentation = f['stimulus']['presentation']
+    for stim_group in presentation.keys():
+        group = presentation[stim_group]
+        if not (hasattr(group, 'keys') and 'timestamps' in group):
+            continue
+        timestamps = np.asarray(group['timestamps'][()], dtype=float).reshape(-1, 2)
+        stim_table = pd.DataFrame(index=range(len(timestamps)))
+        if 'data' in group and 'features' in group:
+            features = [feature.decode() if isinstance(feature, bytes) else str(feature) for feature in group['features'][()]]
+            data = np.asarray(group['data'][()]).reshape(len(timestamps), -1)
+            for c, feature in enumerate(features):
+                stim_table[feature] = data[:, c]
+        stim_table['start'] = timestamps[:, 0]
+        stim_table['end'] = timestamps[:, 1]
+        stim_name = stim_group[:-len('_stimulus')] if stim_group.endswith('_stimulus') else stim_group
+        stim_tables[stim_name] = stim_table
+    return stim_tables
+
+
+def _read_unit_df(f, probe_list):
+    # Unit metadata only, without reading any spike times
+    rows = []
+    for probe_name in probe_list:
+        unit_times = f['processing'][probe_name]['UnitTimes']
+        for unit in unit_times.keys():
+            if not (hasattr(unit_times[unit], 'keys') and 'times' in unit_times[unit]):
+                continue
+            structure = unit_times[unit]['ccf_structure'][()]
+            if isinstance(structure, bytes):
+                structure = structure.decode()
+            rows.append({'probe': probe_name, 'structure': structure, 'unit_id': unit,
+                         'depth': unit_times[unit]['depth'][()]})
+    return pd.DataFrame(rows, columns=['probe', 'structure', 'unit_id', 'depth'])
+
+
 def check_folder(file_path):
     """
     Check if a folder exists, if not create a new one
@@ -99,6 +327,57 @@ def open_gabor_analysis(exp_num, probe_name):
     return gabor_analysis
 
 
+def save_rf_cube(rf_cube, exp_num, probe_name):
+    """
+    Save a gabor RF cube (from neuropixel_rf.get_rf_cube) as compressed .npz
+
+    Parameters
+    ----------
+    rf_cube : dict
+        Gabor RF cube
+    exp_num : char
+        Experiment number
+    probe_name : char
+        Which probe (A-F)
+    """
+    check_folder(rf_path)
+    fname = os.path.join(rf_path, '{}_{}_gabor_rf.npz'.format(exp_num, probe_name))
+    print('Saving as: {}'.format(fname))
+    # Responses don't need double precision on disk
+    cube = dict(rf_cube)
+    cube['resp'] = cube['resp'].astype('float32')
+    cube['psth'] = cube['psth'].astype('float32')
+    # Store labels as fixed-width strings so loading doesn't need pickle
+    cube['unit_id'] = cube['unit_id'].astype(str)
+    cube['structure'] = cube['structure'].astype(str)
+    np.savez_compressed(fname, **cube)
+
+
+def load_rf_cube(exp_num, probe_name):
+    """
+    Load a gabor RF cube saved by save_rf_cube
+
+    Parameters
+    ----------
+    exp_num : char
+        Experiment number
+    probe_name : char
+        Which probe (A-F)
+
+    Returns
+    -------
+    rf_cube : dict, None if no file exists (unit_id and structure come back
+        as str arrays)
+    """
+    fname = os.path.join(rf_path, '{}_{}_gabor_rf.npz'.format(exp_num, probe_name))
+    if not os.path.isfile(fname):
+        return None
+    print('Loaded from {}'.format(fname))
+    with np.load(fname) as f:
+        rf_cube = {key: f[key] for key in f.files}
+    return rf_cube
+
+
 def load_depth_df(expt_index, stim_name, region, json=False):
     """
     Parameters
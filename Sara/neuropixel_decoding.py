@@ -8,7 +8,6 @@ Created on Fri Aug 31 00:42:40 2018
 """
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from neuropixel_running import get_running_speed, get_running_speed_by_frame
 
 def get_frames_name(stim_type):
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Depth-sorted PSTH matrices for probe and region heatmaps
+
+Every unit on a probe is aligned to every presentation in one vectorized
+pass, and the summed counts are cached per (experiment, stimulus, window,
+bin width) so probe_heatmap can be redrawn without touching the spike times
+again.
+"""
+import os
+import numpy as np
+
+from neuropixel_data import heatmap_path, check_folder
+from neuropixel_spikes import align_spike_trains, estfr_batch
+
+# In-memory cache: (experiment, stim_type, bin_width, pre_time, post_time) -> heatmaps
+_heatmap_cache = {}
+
+
+def get_heatmap_matrix(dataset, probe_name, stim_df, pre_time=0.1, post_time=0.25, bin_width=0.005):
+    """
+    Summed PSTH of every unit on a probe, sorted by depth
+
+    Parameters
+    ----------
+    dataset : NWB dataset
+        Neuropixel dataset
+    probe_name : str
+        Which probe
+    stim_df : pandas.DataFrame
+        Stimulus table, all presentations are summed together
+    pre_time : optional, default = 0.1 (seconds)
+        Time before stimulus onset
+    post_time : optional, default = 0.25 (seconds)
+        Time after stimulus onset
+    bin_width : optional, default = 0.005 (seconds)
+        Bin size
+
+    Returns
+    -------
+    heatmap : dict
+        'counts' ([units x time bins], deepest unit last), 'depth',
+        'unit_id', 'structure' and 'edges' (bin edges in seconds)
+    """
+    probe_spikes = dataset.spike_times[probe_name]
+    probe_df = dataset.unit_df[dataset.unit_df['probe'] == probe_name]
+    probe_df = probe_df[probe_df['unit_id'].isin(list(probe_spikes.keys()))]
+    probe_df = probe_df.sort_values('depth', ascending=False, kind='mergesort')
+
+    n_bins = int(np.round((pre_time + post_time)/bin_width))
+    edges = -pre_time + bin_width*np.arange(n_bins + 1)
+
+    spike_trains = [probe_spikes[unit] for unit in probe_df['unit_id']]
+    # Window runs past the stimulus end if post_time does
+    tail_time = max(post_time - np.min(stim_df['end'].values - stim_df['start'].values), 0)
+    unit_idx, _, spike_times = align_spike_trains(stim_df, spike_trains, pre_time, tail_time)
+
+    bin_idx = np.searchsorted(edges, spike_times, side='right') - 1
+    bin_idx[spike_times == edges[-1]] = n_bins - 1
+    valid = (bin_idx >= 0) & (bin_idx < n_bins)
+    counts = np.bincount(unit_idx[valid]*n_bins + bin_idx[valid], minlength=len(spike_trains)*n_bins)
+
+    heatmap = {}
+    heatmap['counts'] = counts.reshape(len(spike_trains), n_bins)
+    heatmap['depth'] = np.asarray(probe_df['depth'].values)
+    heatmap['unit_id'] = np.asarray(probe_df['unit_id'].values)
+    heatmap['structure'] = np.asarray(probe_df['structure'].values)
+    heatmap['edges'] = edges
+    return heatmap
+
+
+def get_session_heatmaps(dataset, stim_type='natural_scenes', pre_time=0.1, post_time=0.25, bin_width=0.005, use_cache=True):
+    """
+    Heatmap matrices for all probes in an experiment
+
+    Parameters
+    ----------
+    dataset : NWB dataset
+        Neuropixel dataset
+    stim_type : optional, str
+        Stimulus table to align to (default = 'natural_scenes')
+    pre_time, post_time, bin_width : optional
+        See get_heatmap_matrix
+    use_cache : optional, bool
+        Reuse matrices computed earlier in this session or saved to
+        heatmap_path (default = True)
+
+    Returns
+    -------
+    heatmaps : dict
+        Output of get_heatmap_matrix for each probe
+    """
+    expt_name = os.path.splitext(os.path.basename(dataset.nwb_path))[0]
+    key = (expt_name, stim_type, bin_width, pre_time, post_time)
+    # Same key as in memory, times in ms
+    fname = os.path.join(heatmap_path, '{}_{}_pre{}ms_post{}ms_{}ms_heatmap.npz'.format(
+        expt_name, stim_type, int(np.round(pre_time*1e3)), int(np.round(post_time*1e3)), int(np.round(bin_width*1e3))))
+
+    if use_cache and key in _heatmap_cache:
+        return _heatmap_cache[key]
+    if use_cache and os.path.isfile(fname):
+        heatmaps = load_heatmaps(fname)
+        if _heatmaps_match(heatmaps, dataset.probe_list, pre_time, post_time, bin_width):
+            _heatmap_cache[key] = heatmaps
+            return heatmaps
+
+    stim_df = dataset.get_stimulus_table(stim_type)
+    heatmaps = {}
+    for probe_name in dataset.probe_list:
+        heatmaps[probe_name] = get_heatmap_matrix(dataset, probe_name, stim_df, pre_time, post_time, bin_width)
+
+    if use_cache:
+        _heatmap_cache[key] = heatmaps
+        save_heatmaps(heatmaps, fname)
+    return heatmaps
+
+
+def _heatmaps_match(heatmaps, probe_list, pre_time, post_time, bin_width):
+    # Saved heatmaps cover every probe with the bins get_heatmap_matrix would use
+    if sorted(heatmaps.keys()) != sorted(probe_list):
+        return False
+    n_bins = int(np.round((pre_time + post_time)/bin_width))
+    edges = -pre_time + bin_width*np.arange(n_bins + 1)
+    return all(len(heatmaps[probe_name]['edges']) == len(edges) and np.allclose(heatmaps[probe_name]['edges'], edges)
+               for probe_name in probe_list)
+
+
+def get_region_heatmap(heatmap, region):
+    """
+    Rows of a probe heatmap belonging to one region
+
+    Parameters
+    ----------
+    heatmap : dict
+        Output of get_heatmap_matrix
+    region : str
+        Brain region
+
+    Returns
+    -------
+    region_heatmap : dict
+        Same keys as heatmap, only units in region (still depth-sorted)
+    """
+    ind = heatmap['structure'] == region
+    region_heatmap = {key: heatmap[key][ind] for key in ['counts', 'depth', 'unit_id', 'structure']}
+    region_heatmap['edges'] = heatmap['edges']
+    return region_heatmap
+
+
+def get_depth_grid_matrix(heatmap, probe_spacing=20):
+    """
+    Place a heatmap on a regular depth grid (empty sites are zeros)
+
+    Parameters
+    ----------
+    heatmap : dict
+        Output of get_heatmap_matrix
+    probe_spacing : optional, int
+        Distance between grid rows in microns (default = 20)
+
+    Returns
+    -------
+    count_matrix : np.array
+        Counts per depth ([depths x time bins]), units at the same depth summed
+    xdepth : np.array
+        Depth of each row
+    """
+    xdepth = np.arange(np.min(heatmap['depth']), 0, probe_spacing)
+    count_matrix = np.zeros([len(xdepth), heatmap['counts'].shape[1]])
+    rows = np.searchsorted(xdepth, heatmap['depth'])
+    on_grid = (rows < len(xdepth)) & (xdepth[np.minimum(rows, len(xdepth)-1)] == heatmap['depth'])
+    np.add.at(count_matrix, rows[on_grid], heatmap['counts'][on_grid])
+    return count_matrix, xdepth
+
+
+def smooth_heatmap(heatmap, sigma=0.01):
+    """
+    Smoothed firing rate for each row of a heatmap
+
+    Parameters
+    ----------
+    heatmap : dict
+        Output of get_heatmap_matrix
+    sigma : optional, float
+        The width of the Gaussian filter, in seconds (default = 0.01)
+
+    Returns
+    -------
+    rates : np.array
+        Smoothed counts per second ([units x time bins])
+    """
+    edges = heatmap['edges']
+    centers = edges[:-1] + np.diff(edges)/2
+    return estfr_batch(heatmap['counts'], centers, sigma)
+
+
+def save_heatmaps(heatmaps, fname):
+    """
+    Save the output of get_session_heatmaps as a compressed .npz
+
+    Parameters
+    ----------
+    heatmaps : dict
+        Heatmap per probe
+    fname : str
+        File to save to
+    """
+    check_folder(os.path.dirname(fname))
+    arrays = {}
+    for probe_name, heatmap in heatmaps.items():
+        for key, value in heatmap.items():
+            # Labels as fixed-width strings so loading doesn't need pickle
+            if value.dtype == object:
+                value = value.astype(str)
+            arrays['{}__{}'.format(probe_name, key)] = value
+    np.savez_compressed(fname, **arrays)
+
+
+def load_heatmaps(fname):
+    """
+    Load heatmaps saved by save_heatmaps
+
+    Parameters
+    ----------
+    fname : str
+        Saved .npz file
+
+    Returns
+    -------
+    heatmaps : dict
+        Heatmap per probe
+    """
+    heatmaps = {}
+    with np.load(fname) as f:
+        for name in f.files:
+            probe_name, key = name.split('__')
+            heatmaps.setdefault(probe_name, {})[key] = f[name]
+    return heatmaps
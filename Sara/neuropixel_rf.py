@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Receptive field mapping from the gabor stimulus, stored as numeric cubes
+
+Each unit's response to each (orientation, x, y) gabor condition is kept in
+an array indexed by integer condition indices, so region maps come from one
+grouped reduction instead of string matching on stim_id.
+"""
+
+import numpy as np
+from neuropixel_spikes import get_psth_tensor, get_condition_psth
+
+
+def get_condition_indices(stim_df, x_list=None, y_list=None, ori_list=None):
+    """
+    Map each gabor presentation to integer (orientation, x, y) indices
+
+    Parameters
+    ----------
+    stim_df : pandas.DataFrame
+        Gabor stimulus table with pos_x, pos_y and orientation columns
+    x_list, y_list, ori_list : optional, array_like
+        Tested values (default = unique values in stim_df)
+
+    Returns
+    -------
+    cond_idx : np.array
+        Flat condition index per presentation ([trials])
+    x_list, y_list, ori_list : np.array
+        Values corresponding to each index
+    """
+    if x_list is None:
+        x_list = np.unique(stim_df['pos_x'])
+    if y_list is None:
+        y_list = np.unique(stim_df['pos_y'])
+    if ori_list is None:
+        ori_list = np.unique(stim_df['orientation'])
+
+    i = np.searchsorted(x_list, stim_df['pos_x'].values)
+    j = np.searchsorted(y_list, stim_df['pos_y'].values)
+    k = np.searchsorted(ori_list, stim_df['orientation'].values)
+    cond_idx = np.ravel_multi_index((k, i, j), (len(ori_list), len(x_list), len(y_list)))
+
+    return cond_idx, x_list, y_list, ori_list
+
+
+def get_rf_cube(stim_df, probe_spikes, probe_df, pre_time=.1, tail_time=0):
+    """
+    Average PSTH and response of each unit to each gabor condition
+
+    Parameters
+    ----------
+    stim_df : pandas.DataFrame
+        Gabor stimulus table
+    probe_spikes : dict
+        Spike times for each unit on the probe
+    probe_df : pandas.DataFrame
+        Units to include (unit_id and structure columns)
+    pre_time : optional, default = .1 (seconds)
+        Time before stimulus to include in PSTH
+    tail_time : optional, default = 0
+        Time after stimulus presentation to include in PSTH
+
+    Returns
+    -------
+    rf_cube : dict
+        'resp' ([units x orientation x X x Y]), 'psth' ([units x orientation
+        x X x Y x time]), 'centers', 'unit_id', 'structure', 'x', 'y', 'ori'
+    """
+    cond_idx, x_list, y_list, ori_list = get_condition_indices(stim_df)
+    cube_shape = (len(ori_list), len(x_list), len(y_list))
+
+    unit_list = probe_df['unit_id'].values
+    bin_width = 0.005
+    counts, centers = get_psth_tensor(stim_df, [probe_spikes[unit] for unit in unit_list],
+                                      pre_time, tail_time, bin_width)
+    # Mean over the presentations of each condition in one reduction
+    cond_psth, cond_list = get_condition_psth(counts, cond_idx, bin_width)
+    psth = np.zeros((len(unit_list), np.prod(cube_shape), len(centers)))
+    psth[:, cond_list, :] = cond_psth
+
+    resp = psth[:, :, centers > 0].sum(axis=2)
+
+    rf_cube = {}
+    rf_cube['resp'] = resp.reshape((len(unit_list),) + cube_shape)
+    rf_cube['psth'] = psth.reshape((len(unit_list),) + cube_shape + (len(centers),))
+    rf_cube['centers'] = centers
+    rf_cube['unit_id'] = np.asarray(unit_list)
+    rf_cube['structure'] = np.asarray(probe_df['structure'].values)
+    rf_cube['x'] = x_list
+    rf_cube['y'] = y_list
+    rf_cube['ori'] = ori_list
+    return rf_cube
+
+
+def get_region_rf_maps(rf_cube, region_list=None):
+    """
+    Mean receptive field map over the units of each region
+
+    Parameters
+    ----------
+    rf_cube : dict
+        Output of get_rf_cube (or load_rf_cube)
+    region_list : optional, list
+        Regions to map (default = all regions in rf_cube, in order recorded)
+
+    Returns
+    -------
+    rf_maps : np.array
+        Mean response per region ([regions x orientation x X x Y])
+    region_list : np.array
+        Region corresponding to each map
+    """
+    structure = rf_cube['structure']
+    if region_list is None:
+        _, first = np.unique(structure, return_index=True)
+        region_list = structure[np.sort(first)]
+    region_list = np.asarray(region_list)
+
+    # One-hot region membership, normalized so the product is a mean
+    membership = (region_list[:, None] == structure[None, :]).astype(float)
+    membership /= np.maximum(membership.sum(axis=1, keepdims=True), 1)
+
+    resp = rf_cube['resp']
+    rf_maps = np.dot(membership, resp.reshape(resp.shape[0], -1))
+    return rf_maps.reshape((len(region_list),) + resp.shape[1:]), region_list
+
+
+def normalize_rf_maps(rf_maps):
+    """
+    Normalize each receptive field map by its maximum value
+
+    Parameters
+    ----------
+    rf_maps : np.array
+        Receptive field maps ([regions x orientation x X x Y])
+
+    Returns
+    -------
+    norm_maps : np.array
+        Same shape as rf_maps, all zeros where a map has no response
+    """
+    axes = tuple(range(1, rf_maps.ndim))
+    map_max = rf_maps.max(axis=axes, keepdims=True)
+    return np.where(map_max > 0, rf_maps / np.where(map_max > 0, map_max, 1), 0)
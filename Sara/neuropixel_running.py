@@ -57,8 +57,12 @@ def get_running_speed(dataset):
     
     Notes
     -----
-    Copied from Shawn's function in swdb_2018_tools
+    Copied from Shawn's function in swdb_2018_tools. Datasets without an
+    NWB file (e.g. SyntheticSession) return their own running trace
     """
+    if hasattr(dataset, 'running_speed'):
+        return dataset.running_timestamps, dataset.running_speed
+
     f = h5py.File(dataset.nwb_path, 'r') 
     
     try:
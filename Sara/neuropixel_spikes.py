@@ -9,9 +9,12 @@ Created on Sun Aug 26 15:33:52 2018
 @author: sarap
 """
 
+import os
+import sys
 import numpy as np
-from scipy import signal
-from neuropixel_plots import plot_psth
+from scipy import signal, fftpack
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from precision import get_sdf_dtype
 
 
 def get_psth(stim_df, unit_spikes, pre_time=.1, tail_time=0, bin_width=0.005, return_edges=False):
@@ -83,10 +86,322 @@ def get_avg_psth(stim_df, unit_spikes, pre_time=.1, tail_time=0, showme=False):
     fr_per_trial, centers = get_psth(stim_df, unit_spikes, pre_time, tail_time)
     mean_fr = np.mean(fr_per_trial, axis=0)
     if showme:
+        # Plotting (matplotlib, seaborn) only imported when a figure is asked for
+        from neuropixel_plots import plot_psth
         plot_psth(mean_fr, centers)
     return mean_fr, centers
 
 
+def align_spike_trains(stim_df, spike_trains, pre_time=.1, tail_time=0):
+    """
+    Align the spikes of many units to every presentation in a stimulus table
+
+    Parameters
+    ----------
+    stim_df : pandas.DataFrame
+        Stimulus table
+    spike_trains : list
+        Sorted spike times for each unit
+    pre_time : optional, default = .1 (seconds)
+        Time before stimulus to include
+    tail_time : optional, default = 0
+        Time after stimulus presentation to include
+
+    Returns
+    -------
+    unit_idx : np.array
+        Index into spike_trains of each aligned spike
+    trial_idx : np.array
+        Row of stim_df each aligned spike falls in
+    spike_times : np.array
+        Spike times relative to stimulus onset (seconds)
+
+    Notes
+    -----
+    Same window as get_psth: start-pre_time < spike < end+tail_time
+    """
+    starts = stim_df['start'].values
+    ends = stim_df['end'].values
+    lo, hi, all_spikes = _get_window_bounds(spike_trains, starts - pre_time, ends + tail_time)
+    return _gather_aligned_spikes(lo, hi, all_spikes, starts)
+
+
+def _get_window_bounds(spike_trains, window_starts, window_ends):
+    # First and last spike of each (unit, trial) window in the flat array of
+    # all spikes: start < spike < end
+    lengths = np.array([len(x) for x in spike_trains], dtype=int)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    lo = np.zeros((len(spike_trains), len(window_starts)), dtype=int)
+    hi = np.zeros((len(spike_trains), len(window_starts)), dtype=int)
+    for u, unit_spikes in enumerate(spike_trains):
+        lo[u] = offsets[u] + np.searchsorted(unit_spikes, window_starts, side='right')
+        hi[u] = offsets[u] + np.searchsorted(unit_spikes, window_ends, side='left')
+    if len(spike_trains):
+        all_spikes = np.concatenate([np.asarray(x, dtype=float) for x in spike_trains])
+    else:
+        all_spikes = np.zeros(0)
+    return lo, hi, all_spikes
+
+
+def _gather_aligned_spikes(lo, hi, all_spikes, starts):
+    # Gather every aligned spike with a single index array
+    n_trials = lo.shape[1]
+    n_spikes = np.maximum(hi - lo, 0).ravel()
+    window_id = np.repeat(np.arange(n_spikes.size), n_spikes)
+    first = np.cumsum(n_spikes) - n_spikes
+    flat_idx = lo.ravel()[window_id] + np.arange(window_id.size) - first[window_id]
+
+    unit_idx, trial_idx = np.divmod(window_id, n_trials)
+    return unit_idx, trial_idx, all_spikes[flat_idx] - starts[trial_idx]
+
+
+def align_spike_trains_all_stimuli(stim_tables, spike_trains, pre_time=.1, tail_time=0):
+    """
+    Align the spikes of many units to the presentations of several stimulus
+    tables in one pass per unit
+
+    Parameters
+    ----------
+    stim_tables : dict
+        Stimulus type -> stimulus table (e.g. dataset.stim_tables)
+    spike_trains : list
+        Sorted spike times for each unit
+    pre_time : optional, default = .1 (seconds)
+        Time before stimulus to include
+    tail_time : optional, default = 0
+        Time after stimulus presentation to include
+
+    Returns
+    -------
+    aligned : dict
+        Stimulus type -> (unit_idx, trial_idx, spike_times), as
+        align_spike_trains(stim_tables[stim_type], spike_trains, ...) returns
+
+    Notes
+    -----
+    The presentations of all tables are merged into one table sorted by
+    start, so the window edges of every unit come from a single search of
+    its sorted spike train for the sorted window edges, instead of one per
+    stimulus type. The spikes of each type are then gathered from those
+    edges in the order of its own table.
+    """
+    stim_types = list(stim_tables.keys())
+    starts = np.concatenate([stim_tables[stim_type]['start'].values for stim_type in stim_types])
+    ends = np.concatenate([stim_tables[stim_type]['end'].values for stim_type in stim_types])
+    order = np.argsort(starts, kind='mergesort')
+
+    # Window edges of all presentations in start order, one search per unit
+    lo, hi, all_spikes = _get_window_bounds(spike_trains, starts[order] - pre_time, ends[order] + tail_time)
+
+    # Column of each table row in the merged order
+    merged_col = np.empty(len(order), dtype=int)
+    merged_col[order] = np.arange(len(order))
+    aligned = {}
+    first_row = 0
+    for stim_type in stim_types:
+        n_trials = len(stim_tables[stim_type])
+        cols = merged_col[first_row:first_row + n_trials]
+        aligned[stim_type] = _gather_aligned_spikes(lo[:, cols], hi[:, cols], all_spikes, starts[first_row:first_row + n_trials])
+        first_row += n_trials
+    return aligned
+
+
+def split_aligned_spike_trains(unit_idx, trial_idx, spike_times, n_units, n_trials):
+    """
+    Ragged per unit, per trial spike trains from the output of align_spike_trains
+
+    Parameters
+    ----------
+    unit_idx, trial_idx, spike_times : np.array
+        As returned by align_spike_trains
+    n_units : int
+        Number of spike trains aligned
+    n_trials : int
+        Rows of the stimulus table
+
+    Returns
+    -------
+    trains : list
+        trains[unit][trial] is the array of aligned spike times
+    """
+    # Spikes are ordered by unit then trial, so every (unit, trial) is one slice
+    bounds = np.searchsorted(unit_idx*n_trials + trial_idx, np.arange(1, n_units*n_trials))
+    windows = np.split(spike_times, bounds)
+    return [windows[u*n_trials:(u + 1)*n_trials] for u in range(n_units)]
+
+
+def get_psth_tensor(stim_df, spike_trains, pre_time=.1, tail_time=0, bin_width=0.005, return_edges=False):
+    """
+    Spike counts of many units to every presentation in a stimulus table
+
+    Parameters
+    ----------
+    stim_df : pandas.DataFrame
+        Stimulus table
+    spike_trains : list
+        Sorted spike times for each unit
+    pre_time : optional, default = .1 (seconds)
+        Time before stimulus to include in PSTH
+    tail_time : optional, default = 0
+        Time after stimulus presentation to include in PSTH
+    bin_width : optional, 0.005 seconds
+        Bin size
+    return_edges : optional, false
+        Return the bin left edges rather than bin centers
+
+    Returns
+    -------
+    counts : np.array
+        Spike counts ([units x trials x time bins])
+    centers : centers or edges of PSTH time bins
+
+    Notes
+    -----
+    Bins match get_psth, so counts[u]/bin_width equals get_psth for unit u
+    """
+    total_time = (stim_df['end'].values[0] - stim_df['start'].values[0]) + tail_time
+    edges = np.arange(-pre_time, total_time+bin_width, bin_width)
+    n_bins = len(edges) - 1
+
+    unit_idx, trial_idx, spike_times = align_spike_trains(stim_df, spike_trains, pre_time, tail_time)
+    # Bin all aligned spikes at once (right edge closed like np.histogram)
+    bin_idx = np.searchsorted(edges, spike_times, side='right') - 1
+    bin_idx[spike_times == edges[-1]] = n_bins - 1
+    valid = (bin_idx >= 0) & (bin_idx < n_bins)
+
+    n_trials = len(stim_df)
+    flat_idx = (unit_idx[valid]*n_trials + trial_idx[valid])*n_bins + bin_idx[valid]
+    counts = np.bincount(flat_idx, minlength=len(spike_trains)*n_trials*n_bins)
+    counts = counts.reshape(len(spike_trains), n_trials, n_bins).astype(np.int32)
+
+    if return_edges:
+        centers = edges[:-1]
+    else:
+        centers = edges[:-1] + np.diff(edges)/2
+
+    return counts, centers
+
+
+def get_probe_psth(dataset, probe_name, stim_df, region=None, pre_time=.1, tail_time=0, bin_width=0.005):
+    """
+    PSTH tensor for every unit on a probe (or in one region of it)
+
+    Parameters
+    ----------
+    dataset : NWB dataset
+        Neuropixel dataset
+    probe_name : str
+        Which probe
+    stim_df : pandas.DataFrame
+        Stimulus table
+    region : optional, str
+        Only include units in this structure (default = all units)
+    pre_time, tail_time, bin_width : optional
+        See get_psth_tensor
+
+    Returns
+    -------
+    counts : np.array
+        Spike counts ([units x trials x time bins])
+    centers : centers of PSTH time bins
+    unit_df : pandas.DataFrame
+        Rows of dataset.unit_df corresponding to the first axis of counts
+    """
+    probe_spikes = dataset.spike_times[probe_name]
+    unit_df = dataset.unit_df[dataset.unit_df['probe'] == probe_name]
+    if region is not None:
+        unit_df = unit_df[unit_df['structure'] == region]
+    # Skip units without spike times (e.g. the noise unit)
+    unit_df = unit_df[unit_df['unit_id'].isin(list(probe_spikes.keys()))]
+
+    spike_trains = [probe_spikes[unit] for unit in unit_df['unit_id']]
+    counts, centers = get_psth_tensor(stim_df, spike_trains, pre_time, tail_time, bin_width)
+    return counts, centers, unit_df
+
+
+def get_avg_psth_from_tensor(counts, bin_width=0.005):
+    """
+    Trial-averaged PSTH of each unit
+
+    Parameters
+    ----------
+    counts : np.array
+        Spike counts from get_psth_tensor ([units x trials x time bins])
+    bin_width : optional, 0.005 seconds
+        Bin size used for counts
+
+    Returns
+    -------
+    mean_fr : np.array
+        Average PSTH (spikes/sec) of each unit ([units x time bins])
+    """
+    return counts.mean(axis=1)/bin_width
+
+
+def get_condition_psth(counts, conditions, bin_width=0.005):
+    """
+    Average PSTH of each unit for each stimulus condition
+
+    Parameters
+    ----------
+    counts : np.array
+        Spike counts from get_psth_tensor ([units x trials x time bins])
+    conditions : array_like
+        Condition label of each trial (e.g. stim_df['frame'])
+    bin_width : optional, 0.005 seconds
+        Bin size used for counts
+
+    Returns
+    -------
+    mean_fr : np.array
+        Average PSTH (spikes/sec) ([units x conditions x time bins])
+    condition_list : np.array
+        Condition corresponding to the second axis of mean_fr
+    """
+    condition_list, cond_idx = np.unique(np.asarray(conditions), return_inverse=True)
+    # Trials x conditions averaging matrix
+    weights = np.zeros((len(cond_idx), len(condition_list)))
+    weights[np.arange(len(cond_idx)), cond_idx] = 1
+    weights /= weights.sum(axis=0, keepdims=True)
+
+    mean_fr = np.tensordot(counts, weights, axes=([1], [0])).transpose(0, 2, 1)
+    return mean_fr/bin_width, condition_list
+
+
+# Gaussian filters (and their FFTs) reused across calls, keyed by (sigma, dt, dtype)
+_filter_cache = {}
+
+
+def _gaussian_filter(sigma, dt, nfft=None, dtype=np.float64):
+    """
+    Normalized Gaussian filter for estfr, cached per (sigma, dt, dtype)
+    
+    Parameters
+    ----------
+    sigma : float
+        The width of the Gaussian filter, in seconds
+    dt : float
+        Time resolution, in seconds
+    nfft : optional, int
+        Also return the real FFT of the filter zero-padded to nfft points
+    dtype : optional, default = float64
+        Filter dtype (built in float64, then cast), its FFT is complex of the
+        same precision
+    """
+    key = (float(sigma), float(dt), np.dtype(dtype).str)
+    if key not in _filter_cache:
+        # Construct Gaussian filter, make sure it is normalized
+        tau = np.arange(-5 * sigma, 5 * sigma, dt)
+        filt = np.exp(-0.5 * (tau/sigma) ** 2)
+        _filter_cache[key] = {'filt': (filt / np.sum(filt)).astype(dtype)}
+    cached = _filter_cache[key]
+    if nfft is None:
+        return cached['filt']
+    if nfft not in cached:
+        cached[nfft] = np.fft.rfft(cached['filt'], nfft)
+    return cached['filt'], cached[nfft]
+
+
 def estfr(bspk, time, sigma=0.01):
     """
     Estimate the instantaneous firing rate
@@ -106,16 +421,50 @@ def estfr(bspk, time, sigma=0.01):
     # Estimate the time resolution
     dt = float(np.mean(np.diff(time)))
     
-    # Construct Gaussian filter, make sure it is normalized
-    tau = np.arange(-5 * sigma, 5 * sigma, dt)
-    filt = np.exp(-0.5 * (tau/sigma) ** 2)
-    filt = filt / np.sum(filt)
+    filt = _gaussian_filter(sigma, dt)
     size = int(np.round(filt.size/2))
     
     # Filter binned spike times
     return signal.fftconvolve(filt, bspk, mode='full')[size:size + time.size]/dt
 
 
+def estfr_batch(bspk, time, sigma=0.01):
+    """
+    Estimate the instantaneous firing rate of many binned spike trains
+    
+    Parameters
+    ----------
+    bspk : array_like
+        Binned spike counts, time along the last axis 
+        (e.g. [trials x bins] or [units x trials x bins])
+    
+    time : array_like
+        Array of time points corresponding to bin centers
+    
+    sigma : float, optional
+        The width of the Gaussian filter, in seconds
+    
+    Returns
+    -------
+    fr : np.array
+        Same shape as bspk, matches estfr applied to each train (float32 in
+        the float32 precision mode, see Shared/precision.py)
+    """
+    sdf_dtype = get_sdf_dtype()
+    bspk = np.asarray(bspk, dtype=sdf_dtype)
+    dt = float(np.mean(np.diff(time)))
+    
+    filt = _gaussian_filter(sigma, dt, dtype=sdf_dtype)
+    nfft = fftpack.next_fast_len(bspk.shape[-1] + filt.size - 1)
+    filt, filt_fft = _gaussian_filter(sigma, dt, nfft, sdf_dtype)
+    size = int(np.round(filt.size/2))
+    
+    # Real-FFT convolution of every train with the same filter
+    full = np.fft.irfft(np.fft.rfft(bspk, nfft, axis=-1) * filt_fft, nfft, axis=-1)
+    # numpy < 2 does the FFTs in double precision
+    return (full[..., size:size + time.size]/dt).astype(sdf_dtype, copy=False)
+
+
 def binspikes(spk, time):
     """
     Bin spike times at the given resolution
@@ -137,6 +486,52 @@ def binspikes(spk, time):
     return np.histogram(spk, bins=bin_edges)[0].astype(float)
 
 
+def binspikes_batch(spks, time):
+    """
+    Bin many spike trains at the given resolution
+
+    Parameters
+    ----------
+    spks : list
+        Spike times of each train, or a list (e.g. units) of lists 
+        (e.g. trials) of spike times
+    
+    time : array_like
+        The left edges of the time bins
+    
+    Returns
+    -------
+    bspk : np.array
+        Binned spike times ([trains x bins] or [units x trials x bins]),
+        matches binspikes applied to each train
+    """
+    nested = len(spks) > 0 and not np.isscalar(spks[0]) and len(spks[0]) > 0 \
+        and not np.isscalar(spks[0][0])
+    if nested:
+        shape = (len(spks), len(spks[0]))
+        trains = [train for unit_trains in spks for train in unit_trains]
+    else:
+        shape = (len(spks),)
+        trains = spks
+    
+    bin_edges = np.append(time, 2 * time[-1]-time[-2])
+    n_bins = len(time)
+    lengths = [len(train) for train in trains]
+    if sum(lengths):
+        all_spikes = np.concatenate([np.asarray(train, dtype=float) for train in trains])
+    else:
+        all_spikes = np.zeros(0)
+    train_idx = np.repeat(np.arange(len(trains)), lengths)
+    
+    # Same bins as np.histogram (last bin closed on the right)
+    bin_idx = np.searchsorted(bin_edges, all_spikes, side='right') - 1
+    bin_idx[all_spikes == bin_edges[-1]] = n_bins - 1
+    valid = (bin_idx >= 0) & (bin_idx < n_bins)
+    
+    bspk = np.bincount(train_idx[valid]*n_bins + bin_idx[valid], minlength=len(trains)*n_bins)
+    return bspk.reshape(shape + (n_bins,)).astype(float)
+
+
 def get_isi(x):
     """
     Calculates interspike intervals
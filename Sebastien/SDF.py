@@ -1,21 +1,27 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from stage_profiler import profile_stage
+from precision import get_sdf_dtype
+from chunked_stats import get_chunked_mean_std
+
+@profile_stage('sdf')
 def SDF(array, sigma):
     """
     This function accepts a trial by time array of 0s and 1s and returns the spike density function of each trial. 
     It performs a gaussian convolution on each row of the array. Time bins should have milisecond resolution.
     The sigma input specifies the sigma of the gaussian used for convultion (in miliseconds).
     The convolution will produce edge effects. Select a larger than needed time window and cut manually.
+    The SDF is float64, or float32 in the float32 precision mode (see Shared/precision.py).
     
     @author: SeB
     """
     
     #from __future__ import division #makes sure all divisions are not rounded to nearest integers
     import numpy as np
-    import time
     import scipy.stats, scipy.signal
     import scipy as sp
     
-    start = time.time() # tic Measures function running speed. Works only on Macs
-    
     trials = array.shape[0]
     bins = array.shape[1]
     
@@ -28,17 +34,31 @@ def SDF(array, sigma):
     edges = np.arange(-3*sigma,3*sigma+.001,.001)
     kernel = sp.stats.norm.pdf(edges,0, sigma) #Use a gaussian function
     kernel = kernel*.001 #Time 1/1000 so the total area under the gaussian is 1
+    kernel = kernel.astype(get_sdf_dtype())
     
     #Compute Spike Density Function for all trials
-    Sdf = np.zeros((trials,bins))
-    Sdf = sp.signal.convolve(array, kernel[None, :] * 1000, mode='same') 
+    Sdf = sp.signal.convolve(np.asarray(array).astype(get_sdf_dtype(), copy=False), kernel[None, :] * 1000, mode='same') 
        
-    print 'Run time for SDF function was ' + str(round(time.time()-start)) + 'seconds' # toc
      
     return Sdf
 
     """ End of function """
 
+#%%
+def SDF_stats(array, sigma, chunk_size=100):
+    """
+    This function accepts a trial by time array of 0s and 1s and returns the mean and standard deviation
+    across trials of the spike density function (same as SDF(array, sigma).mean(axis=0) and .std(axis=0)).
+    Only chunk_size trials are convolved at a time, so the full trial by time SDF is never held in memory.
+    Chunks are merged with the pairwise update of the mean and sum of squared deviations
+    (get_chunked_mean_std in Shared/chunked_stats.py).
+    """
+    chunks = (SDF(array[start:start + chunk_size], sigma) for start in range(0, array.shape[0], chunk_size))
+    mean_SDF, std_SDF, _ = get_chunked_mean_std(chunks)
+    return mean_SDF.astype(get_sdf_dtype()), std_SDF.astype(get_sdf_dtype())
+
+    """ End of function """
+
 #%%   
 def plot_SDF_per_region(struct, stim, dataset, N):
     """
@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the analysis stages on fixed synthetic workloads
+
+Each workload is a SyntheticSession cut down to a number of units and
+trials, so the same workload always gives the same spikes. The stages are
+timed with the functions the analysis scripts use (trial alignment, raster,
+SDF, each latency method and pairwise LDA decoding), and every run appends
+wall time and peak memory per stage to a results file (one json record per
+line) so runs can be compared across changes. The import time of the
+compute modules a batch worker loads is timed too (workload 'imports'), each
+in a fresh interpreter, with any plotting library they pulled in.
+
+    python benchmark.py [workload ...] [--repeat N] [--output FILE] [--precision float32] [--no-imports] [--compare]
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import socket
+import argparse
+import datetime
+import subprocess
+import timeit
+import warnings
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2, peak memory isn't recorded
+    tracemalloc = None
+
+REPO_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+CODE_PATHS = [os.path.join(REPO_PATH, *folder) for folder in [['Shared'], ['Stav', 'Latency_paper'], ['Rahul'], ['Sara'], ['Stav', 'Decoding v2']]]
+sys.path.extend(CODE_PATHS)
+
+from synthetic_session import SyntheticSession
+from precision import PRECISIONS, get_precision, use_precision
+
+# Units, presentations of each stimulus and alignment window (seconds from
+# 100 ms before onset) per workload
+WORKLOADS = OrderedDict([
+    ('small', {'n_units': 12, 'n_trials': 100, 'window_length': 0.35}),
+    ('medium', {'n_units': 48, 'n_trials': 500, 'window_length': 0.35}),
+    ('large', {'n_units': 192, 'n_trials': 2000, 'window_length': 0.35}),
+    ('long_window', {'n_units': 48, 'n_trials': 500, 'window_length': 2.}),
+])
+
+STAGES = ['align', 'align_each_stimulus', 'align_all_stimuli', 'raster', 'sdf', 'latency_v11', 'latency_v12', 'latency_v2', 'latency_v2_batch', 'latency_highfire',
+          'latency_highfire_batch', 'latency_bootstrap', 'decode']
+
+# Compute core a batch worker imports (alignment, SDF, latency, decoding
+# features), none of which should need a plotting library
+CORE_MODULES = ['neuropixel_spikes', 'get_aligned_spike_trains', 'latency_engine', 'get_experiment_latency_dataframe',
+                'get_bootstrap_latency_ci', 'cortical_layers', 'neuropixel_decoding', 'create_train_test_data']
+PLOTTING_MODULES = ['matplotlib', 'seaborn']
+
+DEFAULT_RESULTS_FILE = 'benchmark_results.jsonl'
+
+PRE_TIME = 0.1  # seconds before stimulus onset
+SDF_SIGMA = 5  # ms, as in get_mean_sdf_from_spike_train
+MIN_DECODING_TRIALS = 5  # per class, for 5-fold cross validation
+
+
+def make_workload_session(n_units, n_trials, seed=0):
+    """
+    Synthetic session cut down to a workload
+
+    Parameters
+    ----------
+    n_units : int
+        Number of units (spread over all 6 probes)
+    n_trials : int
+        Presentations kept from the start of every stimulus table
+    seed : optional, int
+        Session seed (default = 0)
+
+    Returns
+    -------
+    session : SyntheticSession
+    """
+    # Natural scenes is the largest block, 5950 presentations at trial_scale 1
+    trial_scale = min(max(n_trials / 5950., 0.02) * 1.1, 1.)
+    session = SyntheticSession(seed=seed, units_per_probe=n_units // 6 + 2, trial_scale=trial_scale)
+    session.unit_df = session.unit_df.iloc[:n_units].reset_index(drop=True)
+    session.region_list = list(session.unit_df['structure'].unique())
+    kept = set(session.unit_df['unit_id'])
+    for probe in session.probe_list:
+        session.spike_times[probe] = dict((unit_id, train) for unit_id, train in session.spike_times[probe].items()
+                                          if unit_id in kept)
+    for stim_name in list(session.stim_tables):
+        if stim_name != 'spontaneous':
+            session.stim_tables[stim_name] = session.stim_tables[stim_name].iloc[:n_trials].reset_index(drop=True)
+    return session
+
+
+def time_stage(func, repeat=3, trace_memory=True):
+    """
+    Parameters
+    ----------
+    func : callable
+        Stage to time, called without arguments
+    repeat : optional, int
+        Number of timed calls (default = 3)
+    trace_memory : optional, bool
+        One more call under tracemalloc for peak memory (default = True)
+
+    Returns
+    -------
+    dict
+        'wall_min' and 'wall_median' (seconds), 'peak_bytes' (None without
+        tracemalloc)
+    """
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        func()
+        times.append(timeit.default_timer() - start)
+
+    peak_bytes = None
+    if trace_memory and tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        try:
+            func()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'wall_min': min(times), 'wall_median': float(np.median(times)), 'peak_bytes': peak_bytes}
+
+
+# Run in a fresh interpreter by time_import: prints the import time, the
+# growth of the peak resident memory and the plotting modules loaded
+_IMPORT_SCRIPT = """
+import sys, json, timeit, importlib
+sys.path.extend({paths!r})
+def peak_rss():
+    # VmHWM (kB), reset on exec unlike ru_maxrss; None outside Linux
+    try:
+        with open('/proc/self/status') as f:
+            return 1024 * int([line for line in f if line.startswith('VmHWM')][0].split()[1])
+    except (IOError, OSError, IndexError):
+        return None
+rss_start = peak_rss()
+start = timeit.default_timer()
+importlib.import_module({module!r})
+seconds = timeit.default_timer() - start
+rss = peak_rss() - rss_start if rss_start is not None else None
+print(json.dumps({{'seconds': seconds, 'rss_bytes': rss, 'plotting': [m for m in {plotting!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module, repeat=3):
+    """
+    Import time of a module in a fresh interpreter (nothing already imported)
+
+    Parameters
+    ----------
+    module : str
+        Module name, found on CODE_PATHS
+    repeat : optional, int
+        Number of interpreters started (default = 3)
+
+    Returns
+    -------
+    dict
+        'wall_min' and 'wall_median' (seconds), 'peak_bytes' (growth of the
+        peak resident memory during the import, None outside Linux) and 'plotting_modules' (the PLOTTING_MODULES it imported)
+    """
+    script = _IMPORT_SCRIPT.format(paths=CODE_PATHS, module=module, plotting=PLOTTING_MODULES)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=REPO_PATH)
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+    times = [run['seconds'] for run in runs]
+    rss = [run['rss_bytes'] for run in runs if run['rss_bytes'] is not None]
+    return {'wall_min': min(times), 'wall_median': float(np.median(times)),
+            'peak_bytes': int(np.median(rss)) if len(rss) > 0 else None,
+            'plotting_modules': runs[-1]['plotting']}
+
+
+def get_stage_functions(session, window_length):
+    """
+    One callable per stage, inputs prepared outside the timed calls
+
+    Parameters
+    ----------
+    session : SyntheticSession
+        Workload session
+    window_length : float
+        Alignment window after PRE_TIME (seconds)
+
+    Returns
+    -------
+    OrderedDict
+        Stage name -> callable
+    """
+    from neuropixel_spikes import align_spike_trains, align_spike_trains_all_stimuli, get_psth_tensor
+    from convert_spike_times_to_raster import convert_spike_times_to_raster
+    from get_sdf_from_spike_train import get_sdf_from_spike_train
+    from get_mean_sdf_from_spike_train import get_mean_sdf_from_spike_train
+    from get_latency_from_sdf_v11 import get_latency_from_sdf_v11
+    from get_latency_from_sdf_v12 import get_latency_from_sdf_v12
+    from get_latency_from_sdf_v2 import get_latency_from_sdf_v2
+    from get_latency_from_sdf_v2_fast import get_latency_from_sdf_v2_batch
+    from get_highfire_starts import get_highfire_starts
+    from get_highfire_starts_fast import get_highfire_starts_batch
+    from get_bootstrap_latency_ci import get_bootstrap_weights, get_bootstrap_latencies_v11, get_bootstrap_latencies_v12
+    from get_prestimulus_time import get_prestimulus_time
+    from get_time_window_buffer import get_time_window_buffer
+    from get_window_size import get_window_size
+
+    stim_df = session.get_stimulus_table('natural_scenes')
+    unit_df = session.unit_df
+    spike_trains = [session.spike_times[probe][unit_id] for probe, unit_id in zip(unit_df['probe'], unit_df['unit_id'])]
+    duration = stim_df['end'].values[0] - stim_df['start'].values[0]
+    tail_time = window_length - duration
+
+    # Latency pipeline trials: the window of get_window_size around onset
+    buffer_time = get_time_window_buffer() / 1000.
+    latency_stim_df = stim_df.copy()
+    latency_stim_df['end'] = latency_stim_df['start'] + (get_window_size() - get_prestimulus_time()) / 1000.
+    unit_idx, trial_idx, spike_times = align_spike_trains(latency_stim_df, spike_trains, pre_time=PRE_TIME + buffer_time)
+    unit_trains = []
+    for u in range(len(spike_trains)):
+        in_unit = unit_idx == u
+        bounds = np.searchsorted(trial_idx[in_unit], np.arange(1, len(stim_df)))
+        unit_trains.append(np.split(spike_times[in_unit], bounds))
+
+    # 1 ms spike counts over the workload window, for the SDF
+    counts, _ = get_psth_tensor(stim_df, spike_trains, pre_time=PRE_TIME, tail_time=tail_time, bin_width=0.001)
+    counts = counts.astype(float)
+
+    mean_sdfs = []
+    all_sdfs = []
+    for trains in unit_trains:
+        mean_sdf, _, unit_sdfs = get_mean_sdf_from_spike_train(trains)
+        mean_sdfs.append(mean_sdf)
+        all_sdfs.append(unit_sdfs)
+
+    stages = OrderedDict()
+    stages['align'] = lambda: align_spike_trains(stim_df, spike_trains, pre_time=PRE_TIME, tail_time=tail_time)
+    # Every stimulus type of the session, one call per type or one pass for all
+    stages['align_each_stimulus'] = lambda: [align_spike_trains(session.stim_tables[stim_type], spike_trains, pre_time=PRE_TIME, tail_time=tail_time)
+                                             for stim_type in session.stim_tables]
+    stages['align_all_stimuli'] = lambda: align_spike_trains_all_stimuli(session.stim_tables, spike_trains, pre_time=PRE_TIME, tail_time=tail_time)
+    stages['raster'] = lambda: [convert_spike_times_to_raster(trains) for trains in unit_trains]
+    stages['sdf'] = lambda: [get_sdf_from_spike_train(unit_counts, SDF_SIGMA) for unit_counts in counts]
+    stages['latency_v11'] = lambda: [get_latency_from_sdf_v11(mean_sdf) for mean_sdf in mean_sdfs]
+    stages['latency_v12'] = lambda: [get_latency_from_sdf_v12(unit_sdfs) for unit_sdfs in all_sdfs]
+    stages['latency_v2'] = lambda: [get_latency_from_sdf_v2(mean_sdf) for mean_sdf in mean_sdfs]
+    stages['latency_v2_batch'] = lambda: get_latency_from_sdf_v2_batch(np.array(mean_sdfs))
+    # As called in LatencyAnalysisPoissonMethod
+    stages['latency_highfire'] = lambda: [get_highfire_starts(mean_sdf[:350], PRE_TIME, 15) for mean_sdf in mean_sdfs]
+    stages['latency_highfire_batch'] = lambda: get_highfire_starts_batch(np.array(mean_sdfs)[:, :350], PRE_TIME, 15)
+
+    def bootstrap_latencies():
+        # 200 resamples of v11 and v12 per unit
+        for unit_sdfs in all_sdfs:
+            weights = get_bootstrap_weights(len(unit_sdfs))
+            get_bootstrap_latencies_v11(unit_sdfs, weights)
+            get_bootstrap_latencies_v12(unit_sdfs, weights)
+    stages['latency_bootstrap'] = bootstrap_latencies
+    stages['decode'] = lambda: decode_pairs(session)
+    return stages
+
+
+def get_decoding_pairs(session):
+    """
+    Condition pairs decoded in the decode stage
+
+    Flash colors against each other and the two most shown natural scenes,
+    where both have at least MIN_DECODING_TRIALS presentations.
+
+    Returns
+    -------
+    list of (stim_type, frame, stim_type, frame)
+    """
+    pairs = []
+    for stim_type, column in [('flash_250ms', 'color'), ('natural_scenes', 'frame')]:
+        frame_counts = session.get_stimulus_table(stim_type)[column].value_counts()
+        if len(frame_counts) > 1 and frame_counts.values[1] >= MIN_DECODING_TRIALS:
+            pairs.append((stim_type, frame_counts.index[0], stim_type, frame_counts.index[1]))
+    return pairs
+
+
+def decode_pairs(session):
+    """
+    Cross validated LDA for every region and decoding pair, as in the
+    decoding main loop
+
+    Returns
+    -------
+    list of mean test scores
+    """
+    from sklearn import model_selection
+    from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
+    from create_train_test_data import create_train_test_data
+
+    test_scores = []
+    for st1, sf1, st2, sf2 in get_decoding_pairs(session):
+        for region in session.region_list:
+            X1, _ = create_train_test_data(session, st1, region, sf1)
+            X2, _ = create_train_test_data(session, st2, region, sf2)
+            min_size = min(X1.shape[0], X2.shape[0])
+            X = np.concatenate((X1[:min_size], X2[:min_size]))
+            y = np.concatenate((np.zeros(min_size), np.ones(min_size)))
+            with warnings.catch_warnings():
+                # Regions with few, silent units make folds LDA can't fit
+                warnings.simplefilter('ignore')
+                scores = model_selection.cross_validate(LDA(), X, y, return_train_score=True)
+            test_scores.append(np.mean(scores['test_score']))
+    return test_scores
+
+
+def get_git_commit():
+    """
+    Returns
+    -------
+    str, the checked out commit (None outside a git checkout)
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_PATH, stderr=devnull)
+        return commit.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(workloads=None, stages=None, repeat=3, results_file=DEFAULT_RESULTS_FILE, trace_memory=True,
+                   precision=None, imports=True):
+    """
+    Time every stage on every workload and append the results
+
+    Parameters
+    ----------
+    workloads : optional, list
+        Workload names from WORKLOADS (default = all)
+    stages : optional, list
+        Stage names from STAGES (default = all)
+    repeat : optional, int
+        Timed calls per stage (default = 3)
+    results_file : optional, str
+        File the records are appended to (default = benchmark_results.jsonl),
+        None to not save
+    trace_memory : optional, bool
+        Record peak memory (default = True)
+    precision : optional, str
+        Pipeline precision from precision.PRECISIONS (default = the current one)
+    imports : optional, bool
+        Also time the import of every CORE_MODULES module (workload 'imports',
+        stage 'import_<module>', default = True)
+
+    Returns
+    -------
+    results : pandas.DataFrame
+        One row per workload and stage
+    """
+    if workloads is None:
+        workloads = list(WORKLOADS)
+    if stages is None:
+        stages = STAGES
+    if precision is None:
+        precision = get_precision()
+
+    run_info = {'run_id': datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S'),
+                'commit': get_git_commit(),
+                'host': socket.gethostname(),
+                'python': sys.version.split()[0],
+                'numpy': np.__version__,
+                'precision': precision}
+    records = []
+    if imports:
+        for module in CORE_MODULES:
+            record = dict(run_info)
+            record['workload'] = 'imports'
+            record['stage'] = 'import_' + module
+            record.update(time_import(module, repeat))
+            records.append(record)
+            plotting = ' (imports {})'.format(', '.join(record['plotting_modules'])) if record['plotting_modules'] else ''
+            print('{:<12} {:<32} {:8.3f} s{}'.format('imports', module, record['wall_median'], plotting))
+    for workload in workloads:
+        params = WORKLOADS[workload]
+        session = make_workload_session(params['n_units'], params['n_trials'])
+        stage_functions = get_stage_functions(session, params['window_length'])
+        for stage in stages:
+            record = dict(run_info)
+            record.update(params)
+            record['workload'] = workload
+            record['stage'] = stage
+            with use_precision(precision):
+                record.update(time_stage(stage_functions[stage], repeat, trace_memory))
+            records.append(record)
+            print('{:<12} {:<22} {:8.3f} s'.format(workload, stage, record['wall_median']))
+
+    if results_file is not None:
+        with open(results_file, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+    return pd.DataFrame(records)
+
+
+def load_benchmark_results(results_file=DEFAULT_RESULTS_FILE):
+    """
+    Returns
+    -------
+    results : pandas.DataFrame
+        Every record saved by run_benchmarks
+    """
+    with open(results_file, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return pd.DataFrame(records)
+
+
+def compare_benchmark_runs(results_file=DEFAULT_RESULTS_FILE, baseline_run=None, run=None):
+    """
+    Wall time and peak memory of one run relative to another
+
+    Parameters
+    ----------
+    results_file : optional, str
+        Saved results (default = benchmark_results.jsonl)
+    baseline_run, run : optional, str
+        Run ids to compare (default = the last two runs)
+
+    Returns
+    -------
+    comparison : pandas.DataFrame
+        Per workload and stage: median wall time of both runs, their ratio
+        (run / baseline, below 1 is faster) and the same for peak memory
+    """
+    results = load_benchmark_results(results_file)
+    run_ids = sorted(results['run_id'].unique())
+    if run is None:
+        run = run_ids[-1]
+    if baseline_run is None:
+        baseline_run = run_ids[-2] if len(run_ids) > 1 else run_ids[-1]
+
+    columns = ['workload', 'stage', 'wall_median', 'peak_bytes']
+    baseline = results.loc[results['run_id'] == baseline_run, columns]
+    current = results.loc[results['run_id'] == run, columns]
+    comparison = pd.merge(baseline, current, on=['workload', 'stage'], suffixes=('_baseline', ''))
+    comparison['wall_ratio'] = comparison['wall_median'] / comparison['wall_median_baseline']
+    comparison['memory_ratio'] = comparison['peak_bytes'].astype(float) / comparison['peak_bytes_baseline'].astype(float)
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the analysis stages on synthetic workloads')
+    parser.add_argument('workloads', nargs='*', help='any of: ' + ', '.join(WORKLOADS))
+    parser.add_argument('--stages', help='comma separated, any of: ' + ', '.join(STAGES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=DEFAULT_RESULTS_FILE)
+    parser.add_argument('--no-memory', action='store_true', help="don't record peak memory")
+    parser.add_argument('--precision', choices=list(PRECISIONS), help='pipeline precision (default float64)')
+    parser.add_argument('--no-imports', action='store_true', help="don't time the imports of the compute modules")
+    parser.add_argument('--compare', action='store_true', help='compare with the previous run in the output file')
+    args = parser.parse_args()
+
+    stages = args.stages.split(',') if args.stages else None
+    run_benchmarks(args.workloads or None, stages, args.repeat, args.output, not args.no_memory, args.precision, not args.no_imports)
+    if args.compare:
+        print(compare_benchmark_runs(args.output)[['workload', 'stage', 'wall_median', 'wall_ratio', 'memory_ratio']])
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Trial mean and std accumulated over chunks of trials
+
+Used by the streaming SDF statistics (SDF_stats in Sebastien/SDF.py and
+get_sdf_stats_from_spike_train in Stav/Latency_paper), so the full trials x
+time SDF never has to be held in memory.
+"""
+import numpy as np
+
+
+def get_chunked_mean_std(chunks):
+    """
+    Mean and std across trials (axis 0) of arrays given one chunk at a time
+
+    Chunks are merged with the pairwise update of the mean and the sum of
+    squared deviations, which stays accurate where sum(x**2) - n*mean**2
+    doesn't. Accumulated in float64 whatever the dtype of the chunks.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Trials x time arrays (same number of columns)
+
+    Returns
+    -------
+    mean : np.array, float64
+        Same as np.concatenate(chunks).mean(axis=0)
+    std : np.array, float64
+        Same as np.concatenate(chunks).std(axis=0)
+    num_of_trials : int
+    """
+    num_of_trials = 0
+    mean = None
+    sq_dev = None
+    for chunk in chunks:
+        chunk_trials = chunk.shape[0]
+        if chunk_trials == 0:
+            continue
+        chunk_mean = chunk.mean(axis=0, dtype=np.float64)
+        chunk_sq_dev = ((chunk - chunk_mean)**2).sum(axis=0)
+        if mean is None:
+            mean = chunk_mean
+            sq_dev = chunk_sq_dev
+        else:
+            delta = chunk_mean - mean
+            total_trials = num_of_trials + chunk_trials
+            mean = mean + delta*chunk_trials/float(total_trials)
+            sq_dev = sq_dev + chunk_sq_dev + delta**2*num_of_trials*chunk_trials/float(total_trials)
+        num_of_trials += chunk_trials
+    if mean is None:
+        raise ValueError('No trials to average')
+    return mean, np.sqrt(sq_dev/num_of_trials), num_of_trials
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Process-level cache of opened neuropixel experiments
+
+open_experiment and load_exp_file go through get_cached_experiment, so
+re-running a cell (or looping over the same sessions again) reuses the
+loaded dataset instead of parsing the NWB file again. Entries are keyed by
+NWB path and modification time and evicted least recently used first once
+their total size passes the byte budget.
+"""
+from __future__ import print_function
+import os
+from collections import OrderedDict
+
+# Default budget for all cached experiments together
+DEFAULT_MAX_BYTES = 8e9
+
+# (nwb path, mtime, loader name) -> [dataset, size in bytes]
+_experiments = OrderedDict()
+_settings = {'max_bytes': DEFAULT_MAX_BYTES}
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def get_cached_experiment(nwb_file, loader=None, loader_kwargs=None):
+    """
+    Open an NWB file, or return the dataset already opened from it
+
+    Parameters
+    ----------
+    nwb_file : str
+        Path to the .nwb file
+    loader : optional, callable
+        Function opening the file (default = NWB_adapter). Datasets from
+        different loaders are cached separately
+    loader_kwargs : optional, dict
+        Keyword arguments of the loader, only used when the file is opened
+        (a cached dataset is returned as it is)
+
+    Returns
+    -------
+    data_set : NWB dataset
+    """
+    if loader is None:
+        from swdb_2018_neuropixels.ephys_nwb_adapter import NWB_adapter
+        loader = NWB_adapter
+    nwb_file = os.path.abspath(nwb_file)
+    key = (nwb_file, os.path.getmtime(nwb_file), getattr(loader, '__name__', str(loader)))
+
+    if key in _experiments:
+        _stats['hits'] += 1
+        entry = _experiments.pop(key)
+        _experiments[key] = entry
+        return entry[0]
+
+    _stats['misses'] += 1
+    # A re-saved file replaces its stale entry
+    for old_key in [k for k in _experiments if k[0] == nwb_file and k[2] == key[2]]:
+        del _experiments[old_key]
+
+    data_set = loader(nwb_file, **(loader_kwargs or {}))
+    _experiments[key] = [data_set, get_dataset_size(data_set)]
+    _evict_to_budget(keep=key)
+    return data_set
+
+
+def get_dataset_size(data_set):
+    """
+    Approximate memory held by a dataset
+
+    Parameters
+    ----------
+    data_set : NWB dataset
+        NWB_adapter (or anything with unit_df, spike_times, stim_tables)
+
+    Returns
+    -------
+    int, bytes of spike times, unit table and stimulus tables
+    """
+    if hasattr(data_set, 'memory_usage'):
+        # Lazy datasets only hold what was loaded (and bound themselves)
+        n_bytes = sum(data_set.memory_usage().values())
+    else:
+        n_bytes = 0
+        for probe_spikes in data_set.spike_times.values():
+            n_bytes += sum(getattr(train, 'nbytes', 0) for train in probe_spikes.values())
+        for stim_table in data_set.stim_tables.values():
+            n_bytes += int(stim_table.memory_usage(deep=True).sum())
+    unit_df = getattr(data_set, 'unit_df', None)
+    if unit_df is not None:
+        n_bytes += int(unit_df.memory_usage(deep=True).sum())
+    return n_bytes
+
+
+def _refresh_sizes():
+    # Lazy datasets grow as probes are read
+    for entry in _experiments.values():
+        if hasattr(entry[0], 'memory_usage'):
+            entry[1] = get_dataset_size(entry[0])
+
+
+def _evict_to_budget(keep=None):
+    _refresh_sizes()
+    while len(_experiments) > 0 and sum(entry[1] for entry in _experiments.values()) > _settings['max_bytes']:
+        key = next(iter(_experiments))
+        if key == keep:
+            break
+        del _experiments[key]
+        _stats['evictions'] += 1
+
+
+def set_cache_size(max_bytes):
+    """
+    Parameters
+    ----------
+    max_bytes : float
+        New budget for all cached experiments, evicts if already over it
+    """
+    _settings['max_bytes'] = max_bytes
+    _evict_to_budget()
+
+
+def evict(nwb_file=None):
+    """
+    Drop cached experiments
+
+    Parameters
+    ----------
+    nwb_file : optional, str
+        Only drop datasets opened from this file (default = drop all)
+    """
+    if nwb_file is None:
+        keys = list(_experiments.keys())
+    else:
+        nwb_file = os.path.abspath(nwb_file)
+        keys = [key for key in _experiments if key[0] == nwb_file]
+    for key in keys:
+        del _experiments[key]
+        _stats['evictions'] += 1
+
+
+def stats(print_stats=False):
+    """
+    Parameters
+    ----------
+    print_stats : optional, bool
+        Also print a summary (default = False)
+
+    Returns
+    -------
+    dict
+        'hits', 'misses', 'evictions', 'bytes', 'max_bytes' and 'entries'
+        (file name, loader, size in bytes; least recently used first)
+    """
+    _refresh_sizes()
+    cache_stats = dict(_stats)
+    cache_stats['bytes'] = sum(entry[1] for entry in _experiments.values())
+    cache_stats['max_bytes'] = _settings['max_bytes']
+    cache_stats['entries'] = [(os.path.basename(key[0]), key[2], entry[1]) for key, entry in _experiments.items()]
+    if print_stats:
+        print('{} experiments cached, {:.2f} of {:.2f} GB'.format(
+            len(_experiments), cache_stats['bytes']/1e9, cache_stats['max_bytes']/1e9))
+        print('Hits: {hits}, misses: {misses}, evictions: {evictions}'.format(**cache_stats))
+        for fname, loader_name, n_bytes in cache_stats['entries']:
+            print('  {} ({}): {:.2f} GB'.format(fname, loader_name, n_bytes/1e9))
+    return cache_stats
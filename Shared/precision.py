@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Storage precision of the raster to latency pipeline
+
+The rasters, SDFs and latencies are float64 by default. The 'float32' mode
+stores rasters as uint8 (they only hold 0 and 1), SDFs (and the kernel they
+are convolved with) as float32 and latencies as float32, which cuts memory
+by 2 to 8 times and speeds up the convolutions:
+
+    import precision
+    precision.set_precision('float32')
+
+or set the NEUROPIXEL_PRECISION environment variable to 'float32' before the
+modules are imported. Code allocating rasters or SDFs asks for the dtype
+with get_raster_dtype / get_sdf_dtype. validate_latency_precision (in
+Stav/Latency_paper) reports how far the latencies move against float64.
+"""
+import os
+import contextlib
+from collections import OrderedDict
+import numpy as np
+
+PRECISION_ENV = 'NEUROPIXEL_PRECISION'
+
+# Mode -> dtype of the rasters, SDFs and latencies
+PRECISIONS = OrderedDict([
+    ('float64', {'raster': np.float64, 'sdf': np.float64, 'latency': np.float64}),
+    ('float32', {'raster': np.uint8, 'sdf': np.float32, 'latency': np.float32}),
+])
+
+_settings = {'precision': 'float64'}
+
+
+def set_precision(precision):
+    """
+    Parameters
+    ----------
+    precision : str
+        One of PRECISIONS ('float64' or 'float32')
+    """
+    if precision not in PRECISIONS:
+        raise ValueError('Unknown precision: {} (one of {})'.format(precision, ', '.join(PRECISIONS)))
+    _settings['precision'] = precision
+
+
+def get_precision():
+    return _settings['precision']
+
+
+@contextlib.contextmanager
+def use_precision(precision):
+    """
+    Run a block in the given precision, then go back to the previous one
+
+    Parameters
+    ----------
+    precision : str
+        One of PRECISIONS
+    """
+    previous = get_precision()
+    set_precision(precision)
+    try:
+        yield
+    finally:
+        set_precision(previous)
+
+
+def get_raster_dtype():
+    return PRECISIONS[_settings['precision']]['raster']
+
+
+def get_sdf_dtype():
+    return PRECISIONS[_settings['precision']]['sdf']
+
+
+def get_latency_dtype():
+    return PRECISIONS[_settings['precision']]['latency']
+
+
+if os.environ.get(PRECISION_ENV):
+    set_precision(os.environ[PRECISION_ENV].lower())
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Catalog of the neuropixel sessions in the manifest
+
+Each NWB file is opened once to record its probes, regions, unit counts,
+stimulus tables and whether running speed was acquired. The result is kept
+as a small .json next to the manifest so scripts can look these up without
+opening NWB files or hard-coding region lists.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import pandas as pd
+
+CATALOG_NAME = 'session_catalog.json'
+
+# In-memory copy of each catalog file: path -> (modification time, catalog)
+_catalog_cache = {}
+
+
+def scan_session(nwb_file):
+    """
+    Summarize a single NWB file
+
+    Parameters
+    ----------
+    nwb_file : str
+        Path to the .nwb file
+
+    Returns
+    -------
+    session : dict
+        'probes', 'regions', 'units' (probe -> region -> unit count),
+        'stim_tables' (stimulus name -> number of presentations),
+        'running_speed', 'mtime' and 'size'
+    """
+    import h5py
+    from swdb_2018_neuropixels.ephys_nwb_adapter import NWB_adapter
+
+    data_set = NWB_adapter(nwb_file)
+    unit_df = data_set.unit_df
+
+    session = {}
+    session['probes'] = [str(probe) for probe in data_set.probe_list]
+    session['regions'] = [str(region) for region in pd.unique(unit_df['structure'])]
+    session['units'] = {}
+    for (probe, region), n_units in unit_df.groupby(['probe', 'structure']).size().items():
+        session['units'].setdefault(str(probe), {})[str(region)] = int(n_units)
+    session['stim_tables'] = {str(stim): int(len(table)) for stim, table in data_set.stim_tables.items()}
+
+    with h5py.File(nwb_file, 'r') as f:
+        session['running_speed'] = 'acquisition/timeseries/RunningSpeed/data' in f
+
+    session['mtime'] = os.path.getmtime(nwb_file)
+    session['size'] = os.path.getsize(nwb_file)
+    return session
+
+
+def build_session_catalog(drive_path, experiment_type=None, catalog_file=None, rebuild=False):
+    """
+    Scan the sessions in the manifest, skipping ones already cataloged
+
+    Parameters
+    ----------
+    drive_path : str
+        Location of the manifest and .nwb files
+    experiment_type : optional, str
+        Only scan 'multi_probe' or 'single_probe' sessions (default = all)
+    catalog_file : optional, str
+        Where to save the catalog (default = drive_path/session_catalog.json)
+    rebuild : optional, bool
+        Rescan every session, even if unchanged (default = False)
+
+    Returns
+    -------
+    catalog : dict
+        Session summary (see scan_session) per nwb filename, plus the
+        manifest's experiment_type and order
+    """
+    if catalog_file is None:
+        catalog_file = os.path.join(drive_path, CATALOG_NAME)
+    if os.path.isfile(catalog_file) and not rebuild:
+        catalog = load_session_catalog(drive_path, catalog_file)
+    else:
+        catalog = {}
+
+    expt_info_df = pd.read_csv(os.path.join(drive_path, 'ephys_manifest.csv'))
+    if experiment_type is not None:
+        expt_info_df = expt_info_df[expt_info_df.experiment_type == experiment_type]
+
+    for _, row in expt_info_df.iterrows():
+        nwb_filename = row['nwb_filename']
+        nwb_file = os.path.join(drive_path, nwb_filename)
+        if not os.path.isfile(nwb_file):
+            print('Missing {}, skipped'.format(nwb_file))
+            continue
+        session = catalog.get(nwb_filename)
+        if session is not None and session['mtime'] == os.path.getmtime(nwb_file):
+            continue
+        print('Scanning {}'.format(nwb_file))
+        session = scan_session(nwb_file)
+        session['experiment_type'] = row['experiment_type']
+        session['manifest_index'] = int(row.name)
+        catalog[nwb_filename] = session
+        # Save after every session so an interrupted scan keeps its progress
+        save_session_catalog(catalog, catalog_file)
+
+    return catalog
+
+
+def save_session_catalog(catalog, catalog_file):
+    """
+    Save a session catalog as .json
+
+    Parameters
+    ----------
+    catalog : dict
+        Output of build_session_catalog
+    catalog_file : str
+        File to save to
+    """
+    with open(catalog_file, 'w') as f:
+        json.dump(catalog, f, indent=1, sort_keys=True)
+    _catalog_cache[catalog_file] = (os.path.getmtime(catalog_file), catalog)
+
+
+def load_session_catalog(drive_path, catalog_file=None):
+    """
+    Load a session catalog saved by build_session_catalog
+
+    Parameters
+    ----------
+    drive_path : str
+        Location of the manifest and .nwb files
+    catalog_file : optional, str
+        Catalog location (default = drive_path/session_catalog.json)
+
+    Returns
+    -------
+    catalog : dict, None if no catalog exists
+    """
+    if catalog_file is None:
+        catalog_file = os.path.join(drive_path, CATALOG_NAME)
+    if not os.path.isfile(catalog_file):
+        return None
+
+    mtime = os.path.getmtime(catalog_file)
+    if catalog_file in _catalog_cache and _catalog_cache[catalog_file][0] == mtime:
+        return _catalog_cache[catalog_file][1]
+    with open(catalog_file, 'r') as f:
+        catalog = json.load(f)
+    _catalog_cache[catalog_file] = (mtime, catalog)
+    return catalog
+
+
+def get_catalog_experiments(catalog, experiment_type='multi_probe', stim_type=None, region=None):
+    """
+    Sessions in the catalog, in manifest order
+
+    Parameters
+    ----------
+    catalog : dict
+        Session catalog
+    experiment_type : optional, str
+        'multi_probe' (default), 'single_probe' or None for both
+    stim_type : optional, str
+        Only sessions with this stimulus table
+    region : optional, str
+        Only sessions with units in this region
+
+    Returns
+    -------
+    list of nwb filenames
+    """
+    nwb_filenames = sorted(catalog.keys(), key=lambda name: catalog[name]['manifest_index'])
+    if experiment_type is not None:
+        nwb_filenames = [name for name in nwb_filenames if catalog[name]['experiment_type'] == experiment_type]
+    if stim_type is not None:
+        nwb_filenames = [name for name in nwb_filenames if stim_type in catalog[name]['stim_tables']]
+    if region is not None:
+        nwb_filenames = [name for name in nwb_filenames if region in catalog[name]['regions']]
+    return nwb_filenames
+
+
+def get_catalog_regions(catalog, experiment_type='multi_probe', nwb_filenames=None):
+    """
+    All regions recorded in a set of sessions
+
+    Parameters
+    ----------
+    catalog : dict
+        Session catalog
+    experiment_type : optional, str
+        'multi_probe' (default), 'single_probe' or None for both
+    nwb_filenames : optional, list
+        Only these sessions (default = all of experiment_type)
+
+    Returns
+    -------
+    list of regions, in the order first recorded
+    """
+    if nwb_filenames is None:
+        nwb_filenames = get_catalog_experiments(catalog, experiment_type)
+    all_regions = []
+    for name in nwb_filenames:
+        all_regions.extend([region for region in catalog[name]['regions'] if region not in all_regions])
+    return all_regions
+
+
+def get_catalog_unit_table(catalog, experiment_type='multi_probe'):
+    """
+    Unit counts for every session, probe and region
+
+    Parameters
+    ----------
+    catalog : dict
+        Session catalog
+    experiment_type : optional, str
+        'multi_probe' (default), 'single_probe' or None for both
+
+    Returns
+    -------
+    unit_table : pandas.DataFrame
+        Columns: nwb_filename, probe, region, units
+    """
+    rows = []
+    for name in get_catalog_experiments(catalog, experiment_type):
+        for probe, region_units in sorted(catalog[name]['units'].items()):
+            for region, n_units in sorted(region_units.items()):
+                rows.append((name, probe, region, n_units))
+    return pd.DataFrame(rows, columns=['nwb_filename', 'probe', 'region', 'units'])
+
+
+def get_catalog_stim_table(catalog, experiment_type='multi_probe'):
+    """
+    Number of presentations of each stimulus in every session
+
+    Parameters
+    ----------
+    catalog : dict
+        Session catalog
+    experiment_type : optional, str
+        'multi_probe' (default), 'single_probe' or None for both
+
+    Returns
+    -------
+    stim_table : pandas.DataFrame
+        Sessions x stimulus names, 0 where a stimulus wasn't shown, plus a
+        running_speed column
+    """
+    nwb_filenames = get_catalog_experiments(catalog, experiment_type)
+    stim_table = pd.DataFrame([catalog[name]['stim_tables'] for name in nwb_filenames], index=nwb_filenames)
+    stim_table = stim_table.fillna(0).astype(int)
+    stim_table['running_speed'] = [catalog[name]['running_speed'] for name in nwb_filenames]
+    return stim_table
+
+
+if __name__ == '__main__':
+    # python session_catalog.py <drive_path> [multi_probe|single_probe]
+    drive_path = sys.argv[1]
+    experiment_type = sys.argv[2] if len(sys.argv) > 2 else None
+    catalog = build_session_catalog(drive_path, experiment_type)
+    print(get_catalog_unit_table(catalog, experiment_type).groupby('region')['units'].sum())
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Spike times of a dataset shared between worker processes
+
+Process pools would otherwise pickle data_set.spike_times into every worker
+(or reopen the NWB file in each one), multiplying the memory by the number
+of workers. share_spike_times copies each probe's spike trains once into a
+flat array and its unit offsets into shared memory (multiprocessing.
+shared_memory, or memory mapped files where it isn't available, e.g.
+Python 2). The small handle it returns is what goes to the workers, which
+attach by name and read the spikes without copying:
+
+    with share_spike_times(data_set) as shared:
+        pool = multiprocessing.Pool(4, initializer=init_worker, initargs=(shared.handle,))
+        results = pool.map(analyse_unit, unit_keys)
+
+    def analyse_unit(unit_key):
+        data_set = get_worker_dataset()
+        spikes = data_set.spike_times[probe][unit_id]  # read only view
+        ...
+
+The process that shared the spikes owns the segments and removes them when
+the with block ends (also on errors), on close() or at exit.
+
+task_queue.run_local does this for the queue's workers (shared_datasets),
+which then get the dataset of a task with get_worker_dataset(experiment).
+"""
+from __future__ import print_function
+import os
+import shutil
+import atexit
+import tempfile
+import uuid
+from collections import OrderedDict
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+    from multiprocessing import resource_tracker
+except ImportError:
+    # Python < 3.8, memory mapped files only
+    shared_memory = None
+
+BACKENDS = ['shared_memory', 'memmap']
+
+# Shared spike times owned by this process, removed at exit if still open
+_owned = []
+# Datasets attached by init_worker in a worker process, by name
+_worker_datasets = {}
+
+
+def _create_array(backend, name, values, folder=None):
+    # Copies values to a new shared array, returns (buffer holder, array)
+    values = np.ascontiguousarray(values)
+    if backend == 'shared_memory':
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(values.nbytes, 1))
+        array = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+        array[:] = values
+        return shm, array
+    array = np.lib.format.open_memmap(os.path.join(folder, name + '.npy'), mode='w+', dtype=values.dtype, shape=values.shape)
+    array[:] = values
+    array.flush()
+    return None, array
+
+
+def _attach_array(backend, name, shape, dtype, folder=None, owner=False):
+    # Read only view of a shared array created by _create_array
+    if backend == 'shared_memory' and owner:
+        shm = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    elif backend == 'shared_memory':
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 registers attached segments with the resource
+            # tracker, which would remove them when this worker exits
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    else:
+        shm = None
+        array = np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')
+    array.flags.writeable = False
+    return shm, array
+
+
+class SharedSpikeTimes(object):
+    """
+    Spike trains of every probe, flattened into shared arrays
+
+    Parameters
+    ----------
+    handle : dict
+        From share_spike_times(...).handle
+    owner : optional, bool
+        Whether this instance removes the segments when closed (only the one
+        share_spike_times returns)
+
+    Attributes
+    ----------
+    handle : dict
+        Picklable description to attach from other processes: backend,
+        segment names, shapes, unit ids per probe, plus the unit and stimulus
+        tables of the dataset
+    spike_times : dict
+        Probe -> OrderedDict of unit id -> read only spike times, like
+        data_set.spike_times
+    unit_df, stim_tables
+        As in the dataset (copies, they are small)
+    """
+    def __init__(self, handle, owner=False):
+        self.handle = handle
+        self.owner = owner
+        self.unit_df = handle['unit_df']
+        self.stim_tables = handle['stim_tables']
+        self._buffers = []
+        self.spike_times = {}
+        self.closed = False
+        try:
+            for probe, probe_handle in handle['probes'].items():
+                self.spike_times[probe] = self._attach_probe(probe_handle)
+        except Exception:
+            self.close()
+            raise
+
+    def _attach_probe(self, probe_handle):
+        backend, folder = self.handle['backend'], self.handle['folder']
+        spikes_buffer, spikes = _attach_array(backend, probe_handle['spikes'], (probe_handle['n_spikes'],), np.float64, folder, self.owner)
+        self._buffers.append(spikes_buffer)
+        offsets_buffer, offsets = _attach_array(backend, probe_handle['offsets'], (len(probe_handle['unit_ids']) + 1,), np.int64, folder, self.owner)
+        self._buffers.append(offsets_buffer)
+        probe_spikes = OrderedDict()
+        for u, unit_id in enumerate(probe_handle['unit_ids']):
+            probe_spikes[unit_id] = spikes[offsets[u]:offsets[u + 1]]
+        return probe_spikes
+
+    def get_stimulus_table(self, stim_type):
+        return self.stim_tables[stim_type]
+
+    def close(self):
+        """
+        Detach (and remove the segments if this is the owner). The spike
+        times can't be read after this
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.spike_times = {}
+        _close_buffers(self._buffers)
+        self._buffers = []
+        if self.owner:
+            _remove_segments(self.handle)
+            if self in _owned:
+                _owned.remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def _remove_segments(handle):
+    if handle['backend'] == 'memmap':
+        shutil.rmtree(handle['folder'], ignore_errors=True)
+        return
+    for probe_handle in handle['probes'].values():
+        for name in [probe_handle['spikes'], probe_handle['offsets']]:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except (OSError, ValueError):
+                # Already removed
+                continue
+            shm.close()
+            shm.unlink()
+
+
+def share_spike_times(data_set, backend=None, probes=None):
+    """
+    Copy the spike times of a dataset to shared memory
+
+    Parameters
+    ----------
+    data_set : NWB dataset
+        Anything with spike_times (probe -> unit id -> sorted spike times),
+        unit_df and stim_tables
+    backend : optional, str
+        'shared_memory' or 'memmap' (default = shared_memory if available)
+    probes : optional, list
+        Probes to share (default = all)
+
+    Returns
+    -------
+    SharedSpikeTimes, owning the segments: use it in a with block (or call
+    close) so they are removed once the workers are done
+    """
+    if backend is None:
+        backend = 'shared_memory' if shared_memory is not None else 'memmap'
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend: {} (one of {})'.format(backend, ', '.join(BACKENDS)))
+    if backend == 'shared_memory' and shared_memory is None:
+        raise ValueError('multiprocessing.shared_memory needs Python 3.8+, use the memmap backend')
+    if probes is None:
+        probes = list(data_set.spike_times.keys())
+
+    prefix = 'npx_' + uuid.uuid4().hex[:12]
+    stim_tables = getattr(data_set, 'stim_tables', {})
+    handle = {'backend': backend, 'folder': None, 'probes': OrderedDict(),
+              'unit_df': getattr(data_set, 'unit_df', None), 'stim_tables': dict(stim_tables)}
+    if backend == 'memmap':
+        handle['folder'] = tempfile.mkdtemp(prefix=prefix + '_')
+
+    buffers = []
+    try:
+        for p_ind, probe in enumerate(probes):
+            unit_ids = list(data_set.spike_times[probe].keys())
+            trains = [np.asarray(data_set.spike_times[probe][unit_id], dtype=np.float64) for unit_id in unit_ids]
+            offsets = np.concatenate(([0], np.cumsum([len(train) for train in trains]))).astype(np.int64)
+            spikes = np.concatenate(trains) if len(trains) > 0 else np.zeros(0)
+            probe_handle = {'spikes': '{}_{}_spikes'.format(prefix, p_ind), 'offsets': '{}_{}_offsets'.format(prefix, p_ind),
+                            'n_spikes': len(spikes), 'unit_ids': unit_ids}
+            # In the handle first, so a failure part way still removes it
+            handle['probes'][probe] = probe_handle
+            buffers.append(_create_array(backend, probe_handle['spikes'], spikes, handle['folder'])[0])
+            buffers.append(_create_array(backend, probe_handle['offsets'], offsets, handle['folder'])[0])
+        shared = SharedSpikeTimes(handle, owner=True)
+    except Exception:
+        _close_buffers(buffers)
+        _remove_segments(handle)
+        raise
+    # The owner's views hold their own buffers
+    _close_buffers(buffers)
+    _owned.append(shared)
+    return shared
+
+
+def _close_buffers(buffers):
+    for shm in buffers:
+        if shm is None:
+            continue
+        try:
+            shm.close()
+        except BufferError:
+            # Spike arrays still referenced somewhere, the mapping goes when they do
+            pass
+
+
+def attach_spike_times(handle):
+    """
+    Parameters
+    ----------
+    handle : dict
+        SharedSpikeTimes.handle of the owning process
+
+    Returns
+    -------
+    SharedSpikeTimes, reading the owner's segments (close it to detach)
+    """
+    return SharedSpikeTimes(handle)
+
+
+def init_worker(handle, name=None):
+    """
+    Pool initializer: attach the shared spike times once per worker process
+
+    Parameters
+    ----------
+    handle : dict
+        SharedSpikeTimes.handle of the owning process
+    name : optional, str
+        Name to get it back by, when a worker attaches several datasets
+        (e.g. the experiment)
+    """
+    _worker_datasets[name] = attach_spike_times(handle)
+
+
+def get_worker_dataset(name=None, required=True):
+    """
+    Parameters
+    ----------
+    name : optional, str
+        As given to init_worker
+    required : optional, bool
+        Raise if nothing was attached under name (default = True), else
+        return None
+
+    Returns
+    -------
+    SharedSpikeTimes attached by init_worker, with spike_times, unit_df,
+    stim_tables and get_stimulus_table like the dataset it came from
+    """
+    if name not in _worker_datasets:
+        if not required:
+            return None
+        raise RuntimeError('No shared spike times in this process, start the pool with initializer=init_worker')
+    return _worker_datasets[name]
+
+
+def _close_owned():
+    for shared in list(_owned):
+        shared.close()
+
+
+atexit.register(_close_owned)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage profiling of the analysis pipelines
+
+Code marks its stages (load, align, raster, sdf, latency, dataframe, plot,
+save, decode) with profile_stage, as a decorator or a context manager:
+
+    @profile_stage('sdf')
+    def get_sdf_from_spike_train(...):
+
+    with profile_stage('latency'):
+        ...
+
+Nothing is recorded unless the NEUROPIXEL_PROFILE environment variable is
+set ('1' for call counts, time and peak memory, 'time' to skip the memory
+tracing, which slows allocation heavy code). The report is written to the
+folder given to set_report_path (e.g. the Latency_results/<timestamp>/
+folder of the run) when the process exits, or printed if no folder was set.
+"""
+from __future__ import print_function
+import os
+import json
+import atexit
+import datetime
+import functools
+import timeit
+from collections import OrderedDict
+import pandas as pd
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2, peak memory isn't recorded
+    tracemalloc = None
+
+PROFILE_ENV = 'NEUROPIXEL_PROFILE'
+STAGES = ['load', 'align', 'raster', 'sdf', 'latency', 'dataframe', 'plot', 'save', 'decode']
+REPORT_NAME = 'stage_profile'
+
+_settings = {'enabled': False, 'memory': False, 'report_path': None, 'exit_registered': False,
+             'start': None, 'started_at': None}
+# Stage name -> {'calls', 'time', 'peak_bytes'}
+_records = OrderedDict()
+# Open stages: [name, start time, traced bytes at start, peak traced bytes]
+_stack = []
+
+
+def enable(memory=True):
+    """
+    Start recording stages
+
+    Parameters
+    ----------
+    memory : optional, bool
+        Also record peak memory with tracemalloc (default = True)
+    """
+    _settings['enabled'] = True
+    _settings['memory'] = memory and tracemalloc is not None
+    if _settings['memory'] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if _settings['start'] is None:
+        _settings['start'] = timeit.default_timer()
+        _settings['started_at'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if not _settings['exit_registered']:
+        atexit.register(_report_at_exit)
+        _settings['exit_registered'] = True
+
+
+def disable():
+    """
+    Stop recording stages (what was recorded is kept)
+    """
+    _settings['enabled'] = False
+    if _settings['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _settings['memory'] = False
+
+
+def is_enabled():
+    return _settings['enabled']
+
+
+def reset():
+    """
+    Drop everything recorded so far
+    """
+    _records.clear()
+    _settings['start'] = timeit.default_timer()
+    _settings['started_at'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def set_report_path(report_path):
+    """
+    Parameters
+    ----------
+    report_path : str
+        Folder the report is written to at exit
+    """
+    _settings['report_path'] = report_path
+
+
+class profile_stage(object):
+    """
+    Parameters
+    ----------
+    name : str
+        Stage name, one of STAGES for the standard report order
+
+    Notes
+    -----
+    Times include any stages opened inside this one. A stage opened inside
+    itself (e.g. a decorated function called in a block of the same stage)
+    counts as a call but its time isn't added twice.
+    """
+    def __init__(self, name):
+        self.name = name
+        # Whether each open 'with' of this instance started a stage
+        self._opened = []
+
+    def __enter__(self):
+        self._opened.append(_settings['enabled'])
+        if self._opened[-1]:
+            _start_stage(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._opened.pop():
+            _stop_stage()
+        return False
+
+    def __call__(self, func):
+        name = self.name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _settings['enabled']:
+                return func(*args, **kwargs)
+            _start_stage(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _stop_stage()
+        return wrapper
+
+
+def _update_open_peaks(peak_bytes):
+    # Open stages keep the highest peak seen, so the global peak can be
+    # reset for the stage starting or ending now
+    for frame in _stack:
+        frame[3] = max(frame[3], peak_bytes)
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+def _start_stage(name):
+    frame = [name, timeit.default_timer(), 0, 0]
+    if _settings['memory']:
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        _update_open_peaks(peak_bytes)
+        frame[2] = current_bytes
+        frame[3] = current_bytes
+    _stack.append(frame)
+
+
+def _stop_stage():
+    name, start, start_bytes, peak_bytes = _stack.pop()
+    elapsed = timeit.default_timer() - start
+    if name not in _records:
+        _records[name] = {'calls': 0, 'time': 0., 'peak_bytes': 0}
+    record = _records[name]
+    record['calls'] += 1
+    if not any(frame[0] == name for frame in _stack):
+        record['time'] += elapsed
+    if _settings['memory']:
+        peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1])
+        _update_open_peaks(peak_bytes)
+        record['peak_bytes'] = max(record['peak_bytes'], peak_bytes - start_bytes)
+
+
+def get_stage_stats():
+    """
+    Returns
+    -------
+    stats : pandas.DataFrame
+        Per stage (STAGES first, then any others in the order first seen):
+        calls, total_s, mean_ms, peak_mb (NaN without memory tracing) and
+        share of the run's wall time
+    """
+    names = [name for name in STAGES if name in _records] + [name for name in _records if name not in STAGES]
+    run_time = timeit.default_timer() - _settings['start'] if _settings['start'] is not None else 0.
+    rows = []
+    for name in names:
+        record = _records[name]
+        peak_mb = record['peak_bytes'] / 1e6 if _settings['memory'] or record['peak_bytes'] > 0 else float('nan')
+        rows.append({'stage': name, 'calls': record['calls'], 'total_s': record['time'],
+                     'mean_ms': 1000. * record['time'] / record['calls'], 'peak_mb': peak_mb,
+                     'share': record['time'] / run_time if run_time > 0 else float('nan')})
+    stats = pd.DataFrame(rows, columns=['stage', 'calls', 'total_s', 'mean_ms', 'peak_mb', 'share'])
+    return stats.set_index('stage')
+
+
+def format_report():
+    """
+    Returns
+    -------
+    str, the stage table with the run's start and wall time
+    """
+    run_time = timeit.default_timer() - _settings['start'] if _settings['start'] is not None else 0.
+    lines = ['Stage profile, started {}, {:.1f} s'.format(_settings['started_at'], run_time)]
+    lines.append(get_stage_stats().to_string(float_format=lambda x: '{:.3f}'.format(x)))
+    return '\n'.join(lines)
+
+
+def write_report(report_path=None):
+    """
+    Save the report as stage_profile.txt and stage_profile.json
+
+    Parameters
+    ----------
+    report_path : optional, str
+        Folder to write to (default = the one from set_report_path)
+
+    Returns
+    -------
+    str, the .txt file written (None if there is no folder)
+    """
+    if report_path is None:
+        report_path = _settings['report_path']
+    if report_path is None:
+        return None
+    if not os.path.exists(report_path):
+        os.makedirs(report_path)
+
+    txt_file = os.path.join(report_path, REPORT_NAME + '.txt')
+    with open(txt_file, 'w') as f:
+        f.write(format_report() + '\n')
+    stages = {}
+    for name, row in get_stage_stats().iterrows():
+        stages[name] = {'calls': int(row['calls']), 'total_s': float(row['total_s']), 'mean_ms': float(row['mean_ms']),
+                        'peak_mb': None if pd.isnull(row['peak_mb']) else float(row['peak_mb'])}
+    report = {'started_at': _settings['started_at'], 'memory': _settings['memory'], 'stages': stages}
+    with open(os.path.join(report_path, REPORT_NAME + '.json'), 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    return txt_file
+
+
+def _report_at_exit():
+    if len(_records) == 0:
+        return
+    if write_report() is None:
+        print(format_report())
+
+
+if os.environ.get(PROFILE_ENV, '').lower() not in ['', '0', 'false', 'no']:
+    enable(memory=os.environ[PROFILE_ENV].lower() != 'time')
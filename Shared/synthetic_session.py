@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic neuropixel sessions for working without the data drive
+
+SyntheticSession has the parts of NWB_adapter the analysis code uses
+(unit_df, spike_times[probe][unit], stim_tables, get_stimulus_table,
+probe_list, region_list, nwb_path) plus a running speed trace. Spikes are
+inhomogeneous Poisson: a baseline rate for the whole session plus a
+stimulus-evoked response starting at a configurable latency per region.
+"""
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+# Response onset (seconds) per region
+DEFAULT_LATENCIES = {'LGd': 0.035, 'TH': 0.040, 'SCs': 0.045, 'VISp': 0.045, 'VISl': 0.055,
+                     'VISrl': 0.058, 'VISal': 0.060, 'VISpm': 0.065, 'VISam': 0.070,
+                     'CA': 0.090, 'DG': 0.100}
+
+# Regions along each probe, shallowest first
+DEFAULT_PROBE_LAYOUT = [('probeA', ['VISam', 'CA', 'DG', 'TH']),
+                        ('probeB', ['VISpm', 'CA', 'DG', 'TH']),
+                        ('probeC', ['VISp', 'CA', 'DG', 'LGd']),
+                        ('probeD', ['VISl', 'CA', 'DG', 'TH']),
+                        ('probeE', ['VISal', 'CA', 'DG', 'SCs']),
+                        ('probeF', ['VISrl', 'CA', 'DG', 'TH'])]
+
+PROBE_LENGTH = 3840  # microns
+SITE_SPACING = 20  # microns
+RUNNING_RATE = 60.  # running speed samples per second
+
+
+class SyntheticSession(object):
+    """
+    Parameters
+    ----------
+    seed : optional, int
+        Random seed, the same seed gives the same session (default = 0)
+    n_probes : optional, int
+        Number of probes, up to 6 (default = 6)
+    units_per_probe : optional, int
+        Mean number of units per probe (default = 120)
+    latencies : optional, dict
+        Response onset in seconds per region (default = DEFAULT_LATENCIES)
+    trial_scale : optional, float
+        Scales the number of repeats of every stimulus (default = 1, close
+        to a real session's ~2 hours of stimuli)
+    baseline_rate : optional, float
+        Median spontaneous firing rate in Hz (default = 3)
+    response_spikes : optional, float
+        Median number of evoked spikes per presentation (default = 2)
+    nwb_path : optional, str
+        Name reported as nwb_path (default = 'synthetic_<seed>.nwb')
+
+    Notes
+    -----
+    Each unit's evoked spikes follow latency + gamma(2, 15 ms) after
+    stimulus onset, so the PSTH rises at the unit's latency (the region
+    latency plus a few ms of jitter, stored in unit_df['latency']).
+    """
+    def __init__(self, seed=0, n_probes=6, units_per_probe=120, latencies=None, trial_scale=1.,
+                 baseline_rate=3., response_spikes=2., nwb_path=None):
+        self.rng = np.random.RandomState(seed)
+        self.latencies = dict(DEFAULT_LATENCIES)
+        if latencies is not None:
+            self.latencies.update(latencies)
+        if nwb_path is None:
+            nwb_path = 'synthetic_{}.nwb'.format(seed)
+        self.nwb_path = nwb_path
+
+        self.stim_tables = make_stim_tables(self.rng, trial_scale)
+        self.duration = max(table['end'].max() for table in self.stim_tables.values()) + 10.
+        self._conditions = {}
+        for stim_name, stim_table in self.stim_tables.items():
+            if stim_name != 'spontaneous':
+                self._conditions[stim_name] = (stim_table['start'].values, get_condition_codes(stim_table))
+
+        layout = DEFAULT_PROBE_LAYOUT[:n_probes]
+        self.probe_list = [probe for probe, _ in layout]
+        self.unit_df = make_unit_df(self.rng, layout, units_per_probe, self.latencies)
+        self.region_list = list(self.unit_df['structure'].unique())
+
+        self.spike_times = {}
+        for probe in self.probe_list:
+            self.spike_times[probe] = {}
+        for _, unit in self.unit_df.iterrows():
+            self.spike_times[unit['probe']][unit['unit_id']] = self._make_spike_train(
+                unit['latency'], baseline_rate, response_spikes)
+
+        self.running_timestamps, self.running_speed = make_running_speed(self.rng, self.duration)
+
+    def get_stimulus_table(self, stim_name):
+        """
+        Parameters
+        ----------
+        stim_name : str
+            Stimulus name
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        return self.stim_tables[stim_name]
+
+    def _make_spike_train(self, latency, baseline_rate, response_spikes):
+        rng = self.rng
+        rate = baseline_rate * rng.lognormal(0, 0.7)
+        all_spikes = [rng.uniform(0, self.duration, rng.poisson(rate * self.duration))]
+
+        # Responsive units have a random (log-normal) gain per condition
+        if rng.rand() < 0.8:
+            unit_gain = response_spikes * rng.lognormal(0, 0.5)
+            for stim_name in sorted(self._conditions):
+                starts, conditions = self._conditions[stim_name]
+                gains = unit_gain * rng.lognormal(0, 0.6, conditions.max() + 1)
+                n_evoked = rng.poisson(gains[conditions])
+                onsets = np.repeat(starts, n_evoked)
+                evoked = onsets + latency + rng.gamma(2., 0.015, len(onsets))
+                all_spikes.append(evoked)
+
+        spike_train = np.sort(np.concatenate(all_spikes))
+        return spike_train[spike_train < self.duration]
+
+
+def get_condition_codes(stim_table):
+    """
+    Integer code of each presentation's condition (all non-time columns)
+
+    Parameters
+    ----------
+    stim_table : pandas.DataFrame
+        Stimulus table
+
+    Returns
+    -------
+    np.array of int
+    """
+    columns = [column for column in stim_table.columns if column not in ['start', 'end']]
+    if len(columns) == 0:
+        return np.zeros(len(stim_table), dtype=int)
+    _, codes = np.unique(stim_table[columns].values, axis=0, return_inverse=True)
+    return np.asarray(codes).ravel()
+
+
+def make_unit_df(rng, layout, units_per_probe, latencies):
+    """
+    Units spread along each probe, region set by depth
+
+    Parameters
+    ----------
+    rng : np.random.RandomState
+    layout : list
+        (probe name, regions from shallowest to deepest) per probe
+    units_per_probe : int
+        Mean units per probe
+    latencies : dict
+        Response onset per region (seconds)
+
+    Returns
+    -------
+    unit_df : pandas.DataFrame
+        probe, structure, unit_id (str), depth (microns, negative below the
+        surface), latency (seconds)
+    """
+    rows = []
+    unit_num = 0
+    n_sites = PROBE_LENGTH // SITE_SPACING
+    for probe, regions in layout:
+        n_units = max(rng.poisson(units_per_probe), len(regions))
+        sites = np.sort(rng.randint(1, n_sites, n_units))
+        # Equal depth bands per region, shallowest first
+        region_ind = np.minimum((sites * len(regions)) // n_sites, len(regions) - 1)
+        for site, r_ind in zip(sites, region_ind):
+            region = regions[r_ind]
+            latency = latencies.get(region, 0.05) + rng.gamma(2., 0.0025)
+            rows.append({'probe': probe, 'structure': region, 'unit_id': str(unit_num),
+                         'depth': -int(site * SITE_SPACING), 'latency': latency})
+            unit_num += 1
+    return pd.DataFrame(rows, columns=['probe', 'structure', 'unit_id', 'depth', 'latency'])
+
+
+def make_stim_tables(rng, trial_scale=1.):
+    """
+    Stimulus blocks in the order and rough size of a real session
+
+    Parameters
+    ----------
+    rng : np.random.RandomState
+    trial_scale : optional, float
+        Scales the number of repeats (default = 1)
+
+    Returns
+    -------
+    stim_tables : dict
+        Stimulus name -> table with start, end and condition columns
+    """
+    def repeats(n):
+        return max(int(round(n * trial_scale)), 1)
+
+    def shuffled(conditions, n_repeats):
+        conditions = np.tile(np.asarray(conditions, dtype=float), (n_repeats, 1))
+        return conditions[rng.permutation(len(conditions))]
+
+    def block(t0, conditions, columns, duration, interval):
+        n_trials = len(conditions)
+        table = pd.DataFrame(conditions, columns=columns)
+        table.insert(0, 'start', t0 + interval * np.arange(n_trials))
+        table.insert(1, 'end', table['start'] + duration)
+        return table, t0 + interval * n_trials + 1.
+
+    stim_tables = {}
+    t0 = 1.
+    duration = 300. * trial_scale
+    stim_tables['spontaneous'] = pd.DataFrame({'start': [t0], 'end': [t0 + duration]}, columns=['start', 'end'])
+    t0 += duration + 1.
+
+    conditions = shuffled([[1], [-1]], repeats(75))
+    stim_tables['flash_250ms'], t0 = block(t0, conditions, ['color'], 0.25, 2.)
+
+    grid = np.arange(-40, 41, 10)
+    conditions = shuffled([[x, y, ori] for x in grid for y in grid for ori in [0, 45, 90]], repeats(15))
+    stim_tables['gabor_20_deg_250ms'], t0 = block(t0, conditions, ['pos_x', 'pos_y', 'orientation'], 0.25, 0.25)
+
+    conditions = shuffled([[ori, sf, phase] for ori in np.arange(0, 180, 30)
+                           for sf in [0.02, 0.04, 0.08, 0.16, 0.32] for phase in [0, 0.25, 0.5, 0.75]], repeats(50))
+    stim_tables['static_gratings'], t0 = block(t0, conditions, ['orientation', 'spatial_frequency', 'phase'], 0.25, 0.25)
+
+    conditions = shuffled([[frame] for frame in range(-1, 118)], repeats(50))
+    stim_tables['natural_scenes'], t0 = block(t0, conditions, ['frame'], 0.25, 0.25)
+
+    conditions = shuffled([[ori, tf] for ori in np.arange(0, 360, 45) for tf in [1, 2, 4, 8, 15]], repeats(15))
+    stim_tables['drifting_gratings'], t0 = block(t0, conditions, ['orientation', 'temporal_frequency'], 2., 3.)
+    return stim_tables
+
+
+def make_running_speed(rng, duration):
+    """
+    Running speed alternating between still and running bouts
+
+    Parameters
+    ----------
+    rng : np.random.RandomState
+    duration : float
+        Session length (seconds)
+
+    Returns
+    -------
+    running_timestamps, running_speed : np.array
+        Sampled at RUNNING_RATE, speed in cm/s
+    """
+    running_timestamps = np.arange(0, duration, 1. / RUNNING_RATE)
+    # Bout boundaries, bouts last ~30 s on average
+    bout_ends = np.cumsum(rng.exponential(30., int(duration / 30.) * 2 + 10))
+    bout = np.searchsorted(bout_ends, running_timestamps)
+    bout_speed = np.where(np.arange(len(bout_ends)) % 2 == 1, rng.gamma(4., 5., len(bout_ends)), 0.)
+    running_speed = bout_speed[bout] + np.abs(rng.normal(0, 1., len(running_timestamps)))
+    return running_timestamps, running_speed
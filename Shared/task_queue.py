@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+"""
+Batch runs split across analysis nodes through a folder on a shared filesystem
+
+A job spec (experiments x probes x stimulus types x analyses) is expanded
+into one task file per combination. Any number of workers, on any node
+that sees the folder, claim tasks by renaming them from pending/ to
+claimed/ (a rename is atomic, so exactly one worker gets each task), touch
+a heartbeat file while they work, and write the result before moving the
+task to done/ (or back to pending/, then to failed/ after max_attempts).
+Tasks whose heartbeat stops (a node died) are moved back to pending/ by
+whichever worker notices first (to failed/ after max_attempts too). No
+server or database is needed:
+
+    create_tasks('/shared/queue', {'experiments': ['ephys_multi_58', ...],
+                                   'stim_types': ['natural_scenes'],
+                                   'analyses': ['latency']})
+    run_worker('/shared/queue', {'latency': run_latency_task})  # on every node
+    results = collect_results('/shared/queue')
+
+run_local starts several worker processes on one machine, standing in for
+the nodes. From the command line:
+
+    python task_queue.py status QUEUE_DIR
+    python task_queue.py worker QUEUE_DIR --module run_latency_task [--processes N]
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import pickle
+import socket
+import argparse
+import importlib
+import itertools
+import threading
+import traceback
+import multiprocessing
+from collections import OrderedDict
+
+STATES = ['pending', 'claimed', 'done', 'failed']
+DEFAULT_HEARTBEAT_INTERVAL = 30  # seconds
+DEFAULT_STALE_TIMEOUT = 300  # seconds without a heartbeat before a claimed task is reclaimed
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Analysis name -> function(task) returning a picklable result, for workers
+# started from the command line (modules register with register_analysis)
+analyses = OrderedDict()
+
+
+def register_analysis(name):
+    def register(func):
+        analyses[name] = func
+        return func
+    return register
+
+
+def _task_file(queue_dir, state, task_id):
+    return os.path.join(queue_dir, state, task_id + '.json')
+
+
+def _write_atomic(path, data, binary=False):
+    # Written next to the target and renamed over it, so readers never see
+    # a partial file
+    tmp_path = '{}.{}.{}.tmp'.format(path, socket.gethostname(), os.getpid())
+    with open(tmp_path, 'wb' if binary else 'w') as f:
+        f.write(data)
+    os.rename(tmp_path, path)
+
+
+def _read_task(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _move(queue_dir, task_id, from_state, to_state):
+    # True if this call moved the task (False if another worker did first)
+    try:
+        os.rename(_task_file(queue_dir, from_state, task_id), _task_file(queue_dir, to_state, task_id))
+        return True
+    except OSError:
+        return False
+
+
+def get_worker_id():
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+
+def expand_job(job_spec):
+    """
+    Parameters
+    ----------
+    job_spec : dict
+        'experiments', 'stim_types' and 'analyses' (lists), optional 'probes'
+        (list, default = one task over all probes) and 'params' (analysis
+        name -> keyword arguments)
+
+    Returns
+    -------
+    tasks : list
+        One dict per combination: task_id, experiment, probe (None = all),
+        stim_type, analysis, params, attempts
+    """
+    probes = job_spec.get('probes') or [None]
+    params = job_spec.get('params', {})
+    tasks = []
+    for experiment, probe, stim_type, analysis in itertools.product(
+            job_spec['experiments'], probes, job_spec['stim_types'], job_spec['analyses']):
+        task_id = '__'.join([str(experiment), str(probe) if probe is not None else 'all', str(stim_type), str(analysis)])
+        tasks.append({'task_id': task_id, 'experiment': experiment, 'probe': probe, 'stim_type': stim_type,
+                      'analysis': analysis, 'params': params.get(analysis, {}), 'attempts': 0})
+    return tasks
+
+
+def create_tasks(queue_dir, job_spec):
+    """
+    Write the task files of a job (tasks already in the queue, in any
+    state, are left as they are, so a job can be resubmitted)
+
+    Parameters
+    ----------
+    queue_dir : str
+        Queue folder on the shared filesystem
+    job_spec : dict
+        See expand_job
+
+    Returns
+    -------
+    int, number of new tasks
+    """
+    for folder in STATES + ['results', 'heartbeats']:
+        path = os.path.join(queue_dir, folder)
+        if not os.path.exists(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # Created by another node meanwhile
+                pass
+    n_new = 0
+    for task in expand_job(job_spec):
+        if any(os.path.exists(_task_file(queue_dir, state, task['task_id'])) for state in STATES):
+            continue
+        _write_atomic(_task_file(queue_dir, 'pending', task['task_id']), json.dumps(task, sort_keys=True))
+        n_new += 1
+    return n_new
+
+
+def _list_tasks(queue_dir, state):
+    names = os.listdir(os.path.join(queue_dir, state))
+    return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+
+def touch_heartbeat(queue_dir, task_id, worker_id):
+    _write_atomic(os.path.join(queue_dir, 'heartbeats', task_id), json.dumps({'worker': worker_id, 'time': time.time()}))
+
+
+def _remove_heartbeat(queue_dir, task_id):
+    try:
+        os.remove(os.path.join(queue_dir, 'heartbeats', task_id))
+    except OSError:
+        pass
+
+
+def _read_json(path):
+    # None if the file is gone (or being replaced)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _read_heartbeat(queue_dir, task_id):
+    return _read_json(os.path.join(queue_dir, 'heartbeats', task_id))
+
+
+def _get_claim_time(queue_dir, task_id):
+    # The claimed file is touched when a worker claims it
+    try:
+        return os.path.getmtime(_task_file(queue_dir, 'claimed', task_id))
+    except OSError:
+        return None
+
+
+def claim_task(queue_dir, worker_id=None):
+    """
+    Take the first pending task nobody else takes first
+
+    Returns
+    -------
+    task : dict, or None if nothing is pending
+    """
+    if worker_id is None:
+        worker_id = get_worker_id()
+    lost_claim = True
+    while lost_claim:
+        lost_claim = False
+        for task_id in _list_tasks(queue_dir, 'pending'):
+            if not _move(queue_dir, task_id, 'pending', 'claimed'):
+                continue
+            # The task file is ours now. A rename keeps the mtime of when the
+            # task was created, so it's touched to mark the claim as fresh
+            path = _task_file(queue_dir, 'claimed', task_id)
+            try:
+                os.utime(path, None)
+                touch_heartbeat(queue_dir, task_id, worker_id)
+                task = _read_task(path)
+            except (IOError, OSError, ValueError):
+                # Reclaimed already (e.g. stalled right after the rename), it's
+                # back in pending/
+                lost_claim = True
+                break
+            task['attempts'] += 1
+            task['worker'] = worker_id
+            _write_atomic(path, json.dumps(task, sort_keys=True))
+            return task
+    return None
+
+
+def _owns_task(queue_dir, task_id, worker_id):
+    heartbeat = _read_heartbeat(queue_dir, task_id)
+    return heartbeat is not None and heartbeat['worker'] == worker_id
+
+
+def complete_task(queue_dir, task, result, worker_id=None):
+    """
+    Save the result and move the task to done/
+
+    Returns
+    -------
+    bool, False if the task was reclaimed meanwhile (the result is dropped)
+    """
+    if worker_id is None:
+        worker_id = get_worker_id()
+    if not _owns_task(queue_dir, task['task_id'], worker_id):
+        return False
+    _write_atomic(os.path.join(queue_dir, 'results', task['task_id'] + '.pkl'), pickle.dumps(result, protocol=2), binary=True)
+    if not _move(queue_dir, task['task_id'], 'claimed', 'done'):
+        return False
+    _remove_heartbeat(queue_dir, task['task_id'])
+    return True
+
+
+def fail_task(queue_dir, task, error, worker_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Put the task back in pending/, or in failed/ (with the error) once it
+    has been tried max_attempts times
+    """
+    if worker_id is None:
+        worker_id = get_worker_id()
+    if not _owns_task(queue_dir, task['task_id'], worker_id):
+        return
+    path = _task_file(queue_dir, 'claimed', task['task_id'])
+    task = dict(task, error=error)
+    _write_atomic(path, json.dumps(task, sort_keys=True))
+    # Removed while the task is still ours: once it's back in pending/ the
+    # heartbeat may already be the next claimer's
+    _remove_heartbeat(queue_dir, task['task_id'])
+    _move(queue_dir, task['task_id'], 'claimed', 'failed' if task['attempts'] >= max_attempts else 'pending')
+
+
+def _take_stale_heartbeat(queue_dir, task_id, heartbeat):
+    # Renames the heartbeat away (only one worker can), True if it was the
+    # stale one read before. A heartbeat written since (a new claim) is put back
+    path = os.path.join(queue_dir, 'heartbeats', task_id)
+    taken_path = '{}.stale.{}'.format(path, get_worker_id())
+    try:
+        os.rename(path, taken_path)
+    except OSError:
+        # Another worker took it
+        return False
+    taken = _read_json(taken_path)
+    if taken == heartbeat:
+        os.remove(taken_path)
+        return True
+    if os.path.exists(path):
+        os.remove(taken_path)
+    else:
+        os.rename(taken_path, path)
+    return False
+
+
+def reclaim_stale_tasks(queue_dir, stale_timeout=DEFAULT_STALE_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Move claimed tasks without a heartbeat (or claim) for stale_timeout
+    seconds back to pending/, or to failed/ once they have been tried
+    max_attempts times (a task that keeps killing its node doesn't cycle
+    forever). The stale heartbeat is removed
+
+    Returns
+    -------
+    list, ids of the tasks this call reclaimed
+    """
+    reclaimed = []
+    for task_id in _list_tasks(queue_dir, 'claimed'):
+        heartbeat = _read_heartbeat(queue_dir, task_id)
+        claim_time = _get_claim_time(queue_dir, task_id)
+        if claim_time is None:
+            continue
+        last_seen = max(claim_time, heartbeat['time'] if heartbeat is not None else claim_time)
+        if time.time() - last_seen < stale_timeout:
+            continue
+        if heartbeat is not None and not _take_stale_heartbeat(queue_dir, task_id, heartbeat):
+            continue
+        # Claimed again meanwhile (the new claimer touches the file)
+        claim_time = _get_claim_time(queue_dir, task_id)
+        if claim_time is None or time.time() - claim_time < stale_timeout:
+            continue
+
+        path = _task_file(queue_dir, 'claimed', task_id)
+        task = _read_json(path)
+        if task is None:
+            continue
+        to_state = 'pending'
+        if task['attempts'] >= max_attempts:
+            task['error'] = 'No heartbeat from {} for {} s'.format(task.get('worker'), stale_timeout)
+            _write_atomic(path, json.dumps(task, sort_keys=True))
+            to_state = 'failed'
+        if _move(queue_dir, task_id, 'claimed', to_state):
+            reclaimed.append(task_id)
+    return reclaimed
+
+
+class _Heartbeat(object):
+    # Touches the task's heartbeat every interval seconds while the analysis runs
+    def __init__(self, queue_dir, task_id, worker_id, interval):
+        self.args = (queue_dir, task_id, worker_id)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            if not _owns_task(*self.args):
+                # Reclaimed: don't take the new claimer's heartbeat over
+                return
+            touch_heartbeat(*self.args)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+
+def run_worker(queue_dir, task_analyses=None, worker_id=None, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL,
+               stale_timeout=DEFAULT_STALE_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS, wait=True, poll_interval=5):
+    """
+    Claim and run tasks until the queue is finished
+
+    Parameters
+    ----------
+    queue_dir : str
+        Queue folder
+    task_analyses : optional, dict
+        Analysis name -> function(task) returning a picklable result
+        (default = the registered analyses)
+    worker_id : optional, str
+        Name in the heartbeats (default = host-pid)
+    heartbeat_interval, stale_timeout : optional, float
+        Seconds between heartbeats, and without one before a task is reclaimed
+    max_attempts : optional, int
+        Tries (failed or gone stale) before a task goes to failed/
+    wait : optional, bool
+        Keep polling while other workers hold claimed tasks, to pick up the
+        ones that go stale (default = True)
+    poll_interval : optional, float
+        Seconds between polls while waiting
+
+    Returns
+    -------
+    dict, number of tasks this worker completed and failed
+    """
+    if task_analyses is None:
+        task_analyses = analyses
+    if worker_id is None:
+        worker_id = get_worker_id()
+    counts = {'done': 0, 'failed': 0}
+    while True:
+        reclaim_stale_tasks(queue_dir, stale_timeout, max_attempts)
+        task = claim_task(queue_dir, worker_id)
+        if task is None:
+            if wait and len(_list_tasks(queue_dir, 'claimed')) > 0:
+                time.sleep(poll_interval)
+                continue
+            return counts
+
+        try:
+            with _Heartbeat(queue_dir, task['task_id'], worker_id, heartbeat_interval):
+                result = task_analyses[task['analysis']](task)
+        except Exception:
+            fail_task(queue_dir, task, traceback.format_exc(), worker_id, max_attempts)
+            counts['failed'] += 1
+            continue
+        if complete_task(queue_dir, task, result, worker_id):
+            counts['done'] += 1
+
+
+def _run_worker_process(queue_dir, task_analyses, module_names, kwargs, shared_handles):
+    if shared_handles:
+        from shared_spikes import init_worker
+        for name, handle in shared_handles.items():
+            init_worker(handle, name)
+    for module_name in module_names:
+        importlib.import_module(module_name)
+    run_worker(queue_dir, task_analyses, **kwargs)
+
+
+def run_local(queue_dir, task_analyses=None, processes=4, module_names=(), shared_datasets=None, **kwargs):
+    """
+    Run several workers on this machine (each a separate process, as the
+    nodes of a batch run would be) and wait for them
+
+    Parameters
+    ----------
+    queue_dir : str
+        Queue folder
+    task_analyses : optional, dict
+        As for run_worker (functions must be importable, to pickle them)
+    processes : optional, int
+        Number of workers (default = 4)
+    module_names : optional, list
+        Modules each worker imports first (registering analyses)
+    shared_datasets : optional, dict
+        Experiment -> opened dataset. Their spike times are put in shared
+        memory once (see shared_spikes) and every worker attaches them, so
+        analyses get them with get_worker_dataset(experiment) instead of
+        each worker opening the NWB file
+    kwargs
+        Passed to run_worker
+
+    Returns
+    -------
+    dict, queue_status once all workers have stopped
+    """
+    shared = OrderedDict()
+    try:
+        if shared_datasets:
+            from shared_spikes import share_spike_times
+            for name, data_set in shared_datasets.items():
+                shared[name] = share_spike_times(data_set)
+        shared_handles = OrderedDict((name, shared_dataset.handle) for name, shared_dataset in shared.items())
+        workers = [multiprocessing.Process(target=_run_worker_process,
+                                           args=(queue_dir, task_analyses, list(module_names), kwargs, shared_handles))
+                   for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        # The workers are done with the segments (or never started)
+        for shared_dataset in shared.values():
+            shared_dataset.close()
+    return queue_status(queue_dir)
+
+
+def queue_status(queue_dir):
+    """
+    Returns
+    -------
+    dict, number of tasks in each state
+    """
+    return OrderedDict((state, len(_list_tasks(queue_dir, state))) for state in STATES)
+
+
+def collect_results(queue_dir):
+    """
+    Returns
+    -------
+    results : dict
+        Task id -> result, for every done task
+    """
+    results = OrderedDict()
+    for task_id in _list_tasks(queue_dir, 'done'):
+        with open(os.path.join(queue_dir, 'results', task_id + '.pkl'), 'rb') as f:
+            results[task_id] = pickle.load(f)
+    return results
+
+
+def get_pending_tasks(queue_dir):
+    """
+    Returns
+    -------
+    list, the pending task dicts
+    """
+    return [_read_task(_task_file(queue_dir, 'pending', task_id)) for task_id in _list_tasks(queue_dir, 'pending')]
+
+
+def get_failed_tasks(queue_dir):
+    """
+    Returns
+    -------
+    list, the failed task dicts (with their last error)
+    """
+    return [_read_task(_task_file(queue_dir, 'failed', task_id)) for task_id in _list_tasks(queue_dir, 'failed')]
+
+
+def retry_failed_tasks(queue_dir):
+    """
+    Move every failed task back to pending/ with its attempts reset
+
+    Returns
+    -------
+    int, number of tasks moved
+    """
+    n_moved = 0
+    for task_id in _list_tasks(queue_dir, 'failed'):
+        path = _task_file(queue_dir, 'failed', task_id)
+        task = _read_task(path)
+        task['attempts'] = 0
+        _write_atomic(path, json.dumps(task, sort_keys=True))
+        n_moved += _move(queue_dir, task_id, 'failed', 'pending')
+    return n_moved
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='File queue of analysis tasks on a shared folder')
+    parser.add_argument('command', choices=['status', 'worker', 'retry'])
+    parser.add_argument('queue_dir')
+    parser.add_argument('--module', action='append', default=[], help='module registering analyses (repeatable)')
+    parser.add_argument('--processes', type=int, default=1, help='workers to start on this machine')
+    parser.add_argument('--heartbeat', type=float, default=DEFAULT_HEARTBEAT_INTERVAL)
+    parser.add_argument('--stale-timeout', type=float, default=DEFAULT_STALE_TIMEOUT)
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        for state, count in queue_status(args.queue_dir).items():
+            print('{:<8} {}'.format(state, count))
+    elif args.command == 'retry':
+        print('{} failed tasks back in pending'.format(retry_failed_tasks(args.queue_dir)))
+    else:
+        sys.path.insert(0, os.getcwd())
+        # Analysis modules register with 'from task_queue import
+        # register_analysis', i.e. in the imported module, not in this
+        # __main__ copy, so the workers must run from it too
+        import task_queue
+        worker_kwargs = {'heartbeat_interval': args.heartbeat, 'stale_timeout': args.stale_timeout}
+        if args.processes > 1:
+            print(task_queue.run_local(args.queue_dir, None, args.processes, args.module, **worker_kwargs))
+        else:
+            for module_name in args.module:
+                importlib.import_module(module_name)
+            print(task_queue.run_worker(args.queue_dir, **worker_kwargs))
@@ -1,2 +1,6 @@
+import os
+
 def get_run_on_server():
-	return False
\ No newline at end of file
+	# Batch nodes (see Shared/task_queue.py) set NEUROPIXEL_RUN_ON_SERVER=1:
+	# server paths and no plotting
+	return os.environ.get('NEUROPIXEL_RUN_ON_SERVER', '0') == '1'
\ No newline at end of file
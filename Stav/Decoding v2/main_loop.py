@@ -15,6 +15,8 @@ from plot_all_mean_sdfs import plot_all_mean_sdfs
 from get_resource_path import get_resource_path
 from create_train_test_data import create_train_test_data
 from get_all_regions import get_all_regions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from stage_profiler import profile_stage
 
 resource_path = get_resource_path()
 if not os.path.exists(resource_path):
@@ -64,8 +66,9 @@ if True:
         sf2 = stim_frames2[stim_ind]
 
         for region in all_regions:
-            X1, num_of_probes = create_train_test_data(data_set, st1, region, sf1)
-            X2, _ = create_train_test_data(data_set, st2, region, sf2)
+            with profile_stage('align'):
+                X1, num_of_probes = create_train_test_data(data_set, st1, region, sf1)
+                X2, _ = create_train_test_data(data_set, st2, region, sf2)
 
             min_size = np.array([X1.shape[0], X2.shape[0]]).min()
             X1 = X1[:min_size, :]
@@ -82,7 +85,8 @@ if True:
 
             cross_validate = True
             if cross_validate:
-                scores = model_selection.cross_validate(classifier,X,y, return_train_score=True)
+                with profile_stage('decode'):
+                    scores = model_selection.cross_validate(classifier,X,y, return_train_score=True)
                 print(region + ' (' + str(num_of_probes) + ') - Train score: ' + "{0:.2f}".format(np.mean(scores['train_score'])) + ', Test score: ' + "{0:.2f}".format(np.mean(scores['test_score'])))
                 all_test_rates.append(np.mean(scores['test_score']))
                 all_test_sems.append(sem(scores['test_score']))
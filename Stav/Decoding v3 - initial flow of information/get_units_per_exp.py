@@ -0,0 +1,19 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from session_catalog import load_session_catalog, get_catalog_unit_table
+
+def get_units_per_exp(multi_probe_experiments, all_regions, drive_path):
+    # Units every region is sub-sampled to, per multi_probe_id: the smallest
+    # of all_regions in that experiment (0 if one wasn't recorded). Read from
+    # the session catalog (python Shared/session_catalog.py <drive_path>)
+    catalog = load_session_catalog(drive_path)
+    if catalog is None:
+        # No catalog yet, the counts of the multi-probe sessions
+        return [0, 12, 83, 39]
+    unit_table = get_catalog_unit_table(catalog)
+    region_units = unit_table.groupby(['nwb_filename', 'region'])['units'].sum()
+    units_per_exp = []
+    for nwb_filename in multi_probe_experiments['nwb_filename']:
+        units_per_exp.append(min([int(region_units.get((nwb_filename, region), 0)) for region in all_regions]))
+    return units_per_exp
@@ -15,19 +15,20 @@ sys.path.append(basic_path + 'resources/swdb_2018_neuropixels')
 from load_exp_file import load_exp_file
 from create_early_train_test_data import create_early_train_test_data
 from get_all_regions import get_all_regions
+from get_units_per_exp import get_units_per_exp
 from get_all_frames import get_all_frames
 from get_resource_path import get_resource_path
 manifest_file = os.path.join(drive_path,'ephys_manifest.csv')
 expt_info_df = pd.read_csv(manifest_file)
 multi_probe_experiments = expt_info_df[expt_info_df.experiment_type == 'multi_probe']
 
+# multi_probe_id -> session (manifest order)
+for multi_probe_id, nwb_filename in enumerate(multi_probe_experiments['nwb_filename']):
+    print(str(multi_probe_id) + ' -> ' + nwb_filename[:-4])
+
 # for multi_probe_id in range(len(multi_probe_experiments)):
-# 0 -> 84
-# 1 -> 58
-# 2 -> 10
-# 3 -> 21
 sub_sample = False
-units_per_exp = [0, 12, 83, 39]
+units_per_exp = get_units_per_exp(multi_probe_experiments, get_all_regions(), drive_path)
 multi_probe_id = 2
 if True:
 # for multi_probe_id in [1, 2, 3]:
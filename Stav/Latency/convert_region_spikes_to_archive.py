@@ -0,0 +1,11 @@
+from load_region_spikes import load_region_spikes
+from spike_train_archive import append_spike_train_archive
+
+# Converts a region's old whole-dictionary pickle to a spike train archive,
+# single units are then read with load_spike_trains / sample_spike_trains
+region = 'VISp'
+
+region_spikes = load_region_spikes(region + '_spikes.pkl')
+print('Loaded spikes file from region: ' + region)
+append_spike_train_archive(region_spikes, region + '_spikes')
+print('Archive saved')
\ No newline at end of file
@@ -0,0 +1,74 @@
+basic_path = 'F:\\'
+drive_path = basic_path + 'visual_coding_neuropixels'
+
+import numpy as np
+import pandas as pd
+import os
+# Import NWB_adapter
+import sys
+sys.path.append(basic_path + 'resources/swdb_2018_neuropixels')
+from swdb_2018_neuropixels.ephys_nwb_adapter import NWB_adapter
+from spike_train_archive import append_spike_train_archive
+
+def filter_spikes_by_regions_stimulus(multi_probe_expt_info, regions, stimulus, output_archives=None, split_frames=False, short_run=False):
+    # Opens each experiment once and aligns the units of every requested
+    # region in that pass (instead of one pass per region). With
+    # output_archives ({region: archive folder}) each experiment's trains
+    # are appended to the region's spike train archive as soon as it is done
+    pre_stimulus_time = 0.1
+    spike_trains = {}
+    for region in regions:
+        spike_trains[region] = {}
+        if output_archives is not None:
+            # Start from an empty archive
+            for file_name in ['index.json', 'spikes.bin', 'trial_offsets.bin']:
+                if os.path.isfile(os.path.join(output_archives[region], file_name)):
+                    os.remove(os.path.join(output_archives[region], file_name))
+
+    for multi_probe_example in range(len(multi_probe_expt_info)):
+        multi_probe_filename = multi_probe_expt_info.iloc[multi_probe_example]['nwb_filename']
+
+        # Specify full path to the .nwb file
+        nwb_file = os.path.join(drive_path,multi_probe_filename)
+
+        data_set = NWB_adapter(nwb_file)
+        stim_table = data_set.stim_tables['natural_scenes']
+        stim_starts = stim_table['start'].values
+        stim_ends = stim_table['end'].values
+        stim_frames = [str(int(frame)) for frame in stim_table['frame'].values]
+
+        exp_spike_trains = {}
+        for region in regions:
+            exp_spike_trains[region] = {}
+
+        region_units = data_set.unit_df[data_set.unit_df['structure'].isin(regions)]
+        for c_probe in np.unique(region_units['probe']):
+            probe_units = region_units[region_units['probe'] == c_probe]
+            all_units = data_set.spike_times[c_probe]
+            for unit_id, depth, region in zip(probe_units['unit_id'], probe_units['depth'], probe_units['structure']):
+                spike_train = all_units[unit_id]
+                # Spike times are sorted, so every stimulus window is a slice
+                first = np.searchsorted(spike_train, stim_starts - pre_stimulus_time, side='right')
+                last = np.searchsorted(spike_train, stim_ends, side='left')
+                unit_trains = exp_spike_trains[region]
+                for c_first, c_last, c_start, c_frame in zip(first, last, stim_starts, stim_frames):
+                    if split_frames:
+                        train_id = multi_probe_filename + '_' + c_probe + '_' + unit_id + '_' + c_frame + '_' + str(depth)
+                    else:
+                        train_id = multi_probe_filename + '_' + c_probe + '_' + unit_id + '_' + str(depth)
+                    if train_id not in unit_trains:
+                        unit_trains[train_id] = []
+                    unit_trains[train_id].append(spike_train[c_first:c_last] - c_start)
+
+        for region in regions:
+            if output_archives is None:
+                spike_trains[region].update(exp_spike_trains[region])
+            else:
+                append_spike_train_archive(exp_spike_trains[region], output_archives[region])
+        print('Done with: ' + multi_probe_filename)
+
+        if short_run:
+            break
+
+    if output_archives is None:
+        return spike_trains
\ No newline at end of file
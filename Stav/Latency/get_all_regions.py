@@ -4,24 +4,21 @@ Created on Thu Aug 23 21:52:27 2018
 
 @author: Stav
 """
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from session_catalog import load_session_catalog, get_catalog_regions
 
-def get_all_regions(multi_probe_expt_info):    
-#    all_regions = []
-#    
-#    for multi_probe_example in range(len(multi_probe_expt_info)):
-#    
-#        multi_probe_filename  = multi_probe_expt_info.iloc[multi_probe_example]['nwb_filename']
-#    
-#        # Specify full path to the .nwb file
-#        nwb_file = os.path.join(drive_path,multi_probe_filename)
-#    
-#        data_set = NWB_adapter(nwb_file)
-#        unique_regions = np.unique(data_set.unit_df['structure'])
-#        unique_list = list(unique_regions)
-#        all_regions.extend(unique_list)
-#    
-#    all_regions = list(set(all_regions))
-    
+def get_all_regions(multi_probe_expt_info, drive_path=None):
+    # Regions come from the session catalog when one has been built
+    # (python Shared/session_catalog.py <drive_path>), scanning every NWB is too slow
+    if drive_path is not None:
+        catalog = load_session_catalog(drive_path)
+        if catalog is not None:
+            nwb_filenames = [name for name in multi_probe_expt_info['nwb_filename'] if name in catalog]
+            return get_catalog_regions(catalog, nwb_filenames=nwb_filenames)
+
+    # No catalog yet, fall back to the regions of the multi-probe sessions
     all_regions = ['VISp', 'VISrl', 'DG', 'CA', 'VISal', 'VISam', 'SCs', 'TH', 'VISpm', 'VISl']
 
     return all_regions
\ No newline at end of file
@@ -14,7 +14,8 @@ import sys
 sys.path.append(basic_path + 'resources/swdb_2018_neuropixels')
 from swdb_2018_neuropixels.ephys_nwb_adapter import NWB_adapter
 
-from filter_spikes_by_region_stimulus import filter_spikes_by_region_stimulus
+from filter_spikes_by_regions_stimulus import filter_spikes_by_regions_stimulus
+from load_region_spikes import load_region_spikes
 from plot_spike_train import plot_spike_train
 from plot_spike_train_psth import plot_spike_train_psth
 from plot_spike_train_psth_with_latency import plot_spike_train_psth_with_latency
@@ -33,20 +34,23 @@ expt_info_df = pd.read_csv(manifest_file)
 #make new dataframe by selecting only multi-probe experiments
 multi_probe_expt_info = expt_info_df[expt_info_df.experiment_type == 'multi_probe']
 
-all_regions = get_all_regions(multi_probe_expt_info)
+all_regions = get_all_regions(multi_probe_expt_info, drive_path)
 print('All regions: ' + str(all_regions))
 
 output_path = 'Latency_results/'
 if not os.path.exists(output_path):
     os.makedirs(output_path)
 
+# One pass over the experiments for all regions, saved per region as it goes
+region_files = {}
 for region in all_regions:
-    region_spikes = filter_spikes_by_region_stimulus(multi_probe_expt_info, region, current_stimulus)
+    region_files[region] = region + '_spikes'
+filter_spikes_by_regions_stimulus(multi_probe_expt_info, all_regions, current_stimulus,
+    output_archives=region_files, split_frames=True)
+print('Region files saved')
 
-    print('Saving region file to disk: ' + region)
-    with open(region + '_spikes.pkl', 'w') as f:
-        pickle.dump([region_spikes], f)
-    print('File saved')
+for region in all_regions:
+    region_spikes = load_region_spikes(region_files[region])
 
     # c_output_path = output_path + region + '/'
     # if not os.path.exists(c_output_path):
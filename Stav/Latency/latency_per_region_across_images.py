@@ -22,7 +22,8 @@ from get_all_regions import get_all_regions
 from print_info import print_info
 import pickle
 import datetime
-from filter_spikes_by_region_stimulus_across_images import filter_spikes_by_region_stimulus_across_images
+from filter_spikes_by_regions_stimulus import filter_spikes_by_regions_stimulus
+from spike_train_archive import sample_spike_trains
 from plot_spike_train_sdf_with_latency import plot_spike_train_sdf_with_latency
 current_stimulus = ['natural_images']
 
@@ -35,7 +36,7 @@ expt_info_df = pd.read_csv(manifest_file)
 #make new dataframe by selecting only multi-probe experiments
 multi_probe_expt_info = expt_info_df[expt_info_df.experiment_type == 'multi_probe']
 
-all_regions = get_all_regions(multi_probe_expt_info)
+all_regions = get_all_regions(multi_probe_expt_info, drive_path)
 print('All regions: ' + str(all_regions))
 
 output_path = 'Latency_results/'
@@ -45,15 +46,18 @@ if not os.path.exists(output_path):
 
 region_latency = {}
 
+# One pass over the experiments for all regions, saved per region as it goes
+region_files = {}
 for region in all_regions:
-    region_latency[region] = []
-    region_spikes = filter_spikes_by_region_stimulus_across_images(multi_probe_expt_info, region,
-        current_stimulus, short_run=True)
+    region_files[region] = input_path + region + '_spikes_aIm'
+filter_spikes_by_regions_stimulus(multi_probe_expt_info, all_regions,
+    current_stimulus, output_archives=region_files, short_run=True)
+print('Region files saved')
 
-    print('Saving region file to disk: ' + region)
-    with open(input_path + 'Small_' + region + '_spikes_aIm.pkl', 'w') as f:
-        pickle.dump([region_spikes], f)
-    print('File saved')
+for region in all_regions:
+    region_latency[region] = []
+    # Only the units plotted below are read from disk
+    region_spikes = sample_spike_trains(region_files[region], 200)
 
     c_output_path = output_path + region + '_' + str(datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")) + '/'
     if not os.path.exists(c_output_path):
@@ -20,6 +20,7 @@ from plot_spike_train_psth import plot_spike_train_psth
 from plot_spike_train_psth_with_latency import plot_spike_train_psth_with_latency
 from plot_spike_train_sdf_with_latency import plot_spike_train_sdf_with_latency
 from get_all_regions import get_all_regions
+from spike_train_archive import sample_spike_trains
 from print_info import print_info
 import pickle
 import datetime
@@ -35,7 +36,7 @@ expt_info_df = pd.read_csv(manifest_file)
 #make new dataframe by selecting only multi-probe experiments
 multi_probe_expt_info = expt_info_df[expt_info_df.experiment_type == 'multi_probe']
 
-all_regions = get_all_regions(multi_probe_expt_info)
+all_regions = get_all_regions(multi_probe_expt_info, drive_path)
 print('All regions: ' + str(all_regions))
 
 output_path = 'Latency_results/'
@@ -53,10 +54,8 @@ for region in all_regions:
     # with open('region_spikes.pkl', 'w') as f:
     #     pickle.dump([region_spikes], f)
 
-    with open(input_path + 'Small_' + region + '_spikes.pkl') as f:
-        region_spikes = pickle.load(f)
-
-    region_spikes = region_spikes[0]
+    # First 200 units straight from the region's archive, no 'Small_' copy needed
+    region_spikes = sample_spike_trains(input_path + region + '_spikes', 200)
 
     print('Loaded spikes file from region: ' + region)
 
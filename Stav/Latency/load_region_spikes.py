@@ -0,0 +1,20 @@
+import os
+import pickle
+from spike_train_archive import load_spike_trains
+
+def load_region_spikes(file_name):
+    # Whole region from a spike train archive folder, or from the older
+    # pickles ([dictionary], or one dictionary per experiment)
+    if os.path.isdir(file_name):
+        return load_spike_trains(file_name)
+    region_spikes = {}
+    with open(file_name, 'rb') as f:
+        while True:
+            try:
+                exp_spikes = pickle.load(f)
+            except EOFError:
+                break
+            if isinstance(exp_spikes, list):
+                exp_spikes = exp_spikes[0]
+            region_spikes.update(exp_spikes)
+    return region_spikes
\ No newline at end of file
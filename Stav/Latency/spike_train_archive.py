@@ -0,0 +1,109 @@
+import os
+import json
+import numpy as np
+
+# A spike train archive is a folder holding:
+#   spikes.bin         all aligned spike times (float64), back to back
+#   trial_offsets.bin  end of each trial in spikes.bin (int64)
+#   index.json         the keys, in order, and the end of each key's trials
+# so a single key's trials are read from disk without loading the rest
+
+archive_index_cache = {}
+
+def append_spike_train_archive(region_spikes, archive_path):
+    # Adds {train_id: [aligned trains]} to the archive (created if needed)
+    if not os.path.exists(archive_path):
+        os.makedirs(archive_path)
+    index = load_spike_train_archive_index(archive_path)
+    keys = list(index['keys'])
+    key_offsets = list(index['key_offsets'])
+    n_trials = key_offsets[-1] if len(key_offsets) > 0 else 0
+    n_spikes = index['n_spikes']
+
+    # Drop anything past the index, left by an interrupted append
+    for file_name, n_values in [('spikes.bin', n_spikes), ('trial_offsets.bin', n_trials)]:
+        file_path = os.path.join(archive_path, file_name)
+        if os.path.isfile(file_path) and os.path.getsize(file_path) > 8*n_values:
+            with open(file_path, 'r+b') as f:
+                f.truncate(8*n_values)
+
+    all_trains = []
+    trial_ends = []
+    for train_id, trains in region_spikes.items():
+        if train_id in index['positions']:
+            raise KeyError('Key already in archive: ' + train_id)
+        for train in trains:
+            n_spikes += len(train)
+            trial_ends.append(n_spikes)
+            all_trains.append(np.asarray(train, dtype=np.float64))
+        n_trials += len(trains)
+        keys.append(train_id)
+        key_offsets.append(n_trials)
+
+    with open(os.path.join(archive_path, 'spikes.bin'), 'ab') as f:
+        if len(all_trains) > 0:
+            np.concatenate(all_trains).tofile(f)
+    with open(os.path.join(archive_path, 'trial_offsets.bin'), 'ab') as f:
+        np.asarray(trial_ends, dtype=np.int64).tofile(f)
+    # Index last, so a crash mid-write leaves the previous archive readable
+    index = {'keys': keys, 'key_offsets': key_offsets, 'n_spikes': n_spikes}
+    with open(os.path.join(archive_path, 'index.json'), 'w') as f:
+        json.dump(index, f)
+    index['positions'] = dict((key, ind) for ind, key in enumerate(keys))
+    archive_index_cache[archive_path] = (os.path.getmtime(os.path.join(archive_path, 'index.json')), index)
+
+def load_spike_train_archive_index(archive_path):
+    index_file = os.path.join(archive_path, 'index.json')
+    if not os.path.isfile(index_file):
+        return {'keys': [], 'key_offsets': [], 'n_spikes': 0, 'positions': {}}
+    mtime = os.path.getmtime(index_file)
+    if archive_path in archive_index_cache and archive_index_cache[archive_path][0] == mtime:
+        return archive_index_cache[archive_path][1]
+    with open(index_file) as f:
+        index = json.load(f)
+    index['positions'] = dict((key, ind) for ind, key in enumerate(index['keys']))
+    archive_index_cache[archive_path] = (mtime, index)
+    return index
+
+def get_spike_train_archive_keys(archive_path):
+    return load_spike_train_archive_index(archive_path)['keys']
+
+def load_spike_trains(archive_path, keys=None):
+    # Reads only the requested keys ({train_id: [aligned trains]}), all of
+    # them if keys is None
+    index = load_spike_train_archive_index(archive_path)
+    if keys is None:
+        keys = index['keys']
+    n_trials = index['key_offsets'][-1] if len(index['key_offsets']) > 0 else 0
+    if n_trials == 0 or index['n_spikes'] == 0:
+        spikes = np.zeros(0)
+    else:
+        spikes = np.memmap(os.path.join(archive_path, 'spikes.bin'), dtype=np.float64, mode='r', shape=(index['n_spikes'],))
+    if n_trials > 0:
+        trial_offsets = np.memmap(os.path.join(archive_path, 'trial_offsets.bin'), dtype=np.int64, mode='r', shape=(n_trials,))
+
+    region_spikes = {}
+    for key in keys:
+        position = index['positions'][key]
+        first_trial = index['key_offsets'][position - 1] if position > 0 else 0
+        last_trial = index['key_offsets'][position]
+        if last_trial == first_trial:
+            region_spikes[key] = []
+            continue
+        trial_ends = np.array(trial_offsets[first_trial:last_trial])
+        first_spike = trial_offsets[first_trial - 1] if first_trial > 0 else 0
+        key_spikes = np.array(spikes[first_spike:trial_ends[-1]])
+        region_spikes[key] = np.split(key_spikes, trial_ends[:-1] - first_spike)
+    return region_spikes
+
+def sample_spike_trains(archive_path, n_keys, random_sample=False, seed=None):
+    # The first n_keys (or n_keys random ones) straight from disk, replaces
+    # the 'Small_' copies of the region pickles
+    keys = get_spike_train_archive_keys(archive_path)
+    if random_sample:
+        rng = np.random.RandomState(seed)
+        selected = np.sort(rng.choice(len(keys), min(n_keys, len(keys)), replace=False))
+        keys = [keys[ind] for ind in selected]
+    else:
+        keys = keys[:n_keys]
+    return load_spike_trains(archive_path, keys)
\ No newline at end of file
@@ -1,22 +1,24 @@
 import numpy as np
 import pandas as pd
 from get_full_latency_dataframe import get_full_latency_dataframe
-from get_all_crotical_regions import get_all_crotical_regions
+from get_all_cortical_regions import get_all_cortical_regions
+from latency_dataset import LatencyDataset
 import matplotlib.pyplot as plt
 
-full_latency_dataframe = get_full_latency_dataframe()
-all_regions = np.unique(full_latency_dataframe['region'])
+stim_type = 'natural_scenes'
+latency_dataset = LatencyDataset(get_full_latency_dataframe(stim_type), stim_type)
+all_regions = latency_dataset.unique('region')
 print(all_regions)
 all_cortical_regions = get_all_cortical_regions()
-all_exps = np.unique(full_latency_dataframe['experiment'])
+all_exps = latency_dataset.unique('experiment')
 
 fig, ax = plt.subplots(1,1,figsize=(12,6))
 c_ind = 0
 all_lables = []
 for exp in all_exps:
-	all_probes = np.unique(full_latency_dataframe[full_latency_dataframe['experiment'] == exp]['probe'])
+	all_probes = latency_dataset.unique('probe', experiment=exp)
 	for probe in all_probes:
-		all_depths = full_latency_dataframe[(full_latency_dataframe['experiment'] == exp) & (full_latency_dataframe['probe'] == probe) & (full_latency_dataframe['region'].isin(all_cortical_regions))]['depth'].values.astype(int)
+		all_depths = latency_dataset.values('depth', experiment=exp, probe=probe, region=all_cortical_regions)
 		ax.plot([c_ind, c_ind], [all_depths.max(), all_depths.min()], marker='_')
 		# ax.scatter(c_ind, all_depths.max())
 		# ax.scatter(c_ind, all_depths.min())
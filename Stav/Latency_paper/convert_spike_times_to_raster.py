@@ -1,13 +1,18 @@
 import numpy as np
 from get_prestimulus_time import get_prestimulus_time
 from get_window_size import get_window_size
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from stage_profiler import profile_stage
+from precision import get_raster_dtype
 
 def convert_time_to_ind(spike_time):
     ind = int(spike_time*1000 + get_prestimulus_time())
     return ind
 
 def get_spike_train_from_time(spike_times_list):
-    spike_train = np.zeros(get_window_size())
+    spike_train = np.zeros(get_window_size(), dtype=get_raster_dtype())
     for spike_time in spike_times_list:
         spike_ind = convert_time_to_ind(spike_time)
         if spike_ind < get_window_size():
@@ -15,8 +20,10 @@ def get_spike_train_from_time(spike_times_list):
 
     return spike_train
 
+@profile_stage('raster')
 def convert_spike_times_to_raster(spike_times):
-    spike_raster = np.zeros((len(spike_times), get_window_size()))
+    # 0/1 values, uint8 in the float32 precision mode
+    spike_raster = np.zeros((len(spike_times), get_window_size()), dtype=get_raster_dtype())
     for ind, spike_times_list in enumerate(spike_times):
         spike_raster[ind, :] = get_spike_train_from_time(spike_times_list)
 
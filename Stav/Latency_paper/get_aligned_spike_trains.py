@@ -0,0 +1,38 @@
+import numpy as np
+import os
+import sys
+from collections import OrderedDict
+from get_prestimulus_time import get_prestimulus_time
+from get_time_window_buffer import get_time_window_buffer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Sara'))
+from neuropixel_spikes import align_spike_trains_all_stimuli, split_aligned_spike_trains
+
+def get_aligned_spike_trains(data_set, stim_types, short_version=False, probes=None):
+    # Spike trains of every unit around every presentation of each stimulus
+    # type, in the window of get_experiment_latency_dataframe (from
+    # get_prestimulus_time before onset to get_time_window_buffer after the
+    # end, relative to onset). All stimulus types are aligned in one pass over
+    # each unit's spikes. Returns {stim_type: {(probe, unit_id): [train per
+    # presentation]}}, stimulus types missing from the experiment are empty.
+    # probes: only these probes' units (default = all)
+    pre_stimulus_time = float(get_prestimulus_time())/1000
+    time_window_buffer = float(get_time_window_buffer())/1000
+    stim_tables = OrderedDict((stim_type, data_set.stim_tables[stim_type]) for stim_type in stim_types if stim_type in data_set.stim_tables)
+    aligned_spike_trains = dict((stim_type, OrderedDict()) for stim_type in stim_types)
+    if len(stim_tables) == 0:
+        return aligned_spike_trains
+
+    for c_probe in np.unique(data_set.unit_df['probe']):
+        if probes is not None and c_probe not in probes:
+            continue
+        unit_ids = list(data_set.unit_df[data_set.unit_df['probe'] == c_probe]['unit_id'])
+        spike_trains = [data_set.spike_times[c_probe][unit_id] for unit_id in unit_ids]
+        aligned = align_spike_trains_all_stimuli(stim_tables, spike_trains, pre_time=pre_stimulus_time, tail_time=time_window_buffer)
+        for stim_type in stim_tables:
+            unit_trains = split_aligned_spike_trains(*aligned[stim_type], n_units=len(unit_ids), n_trials=len(stim_tables[stim_type]))
+            for unit_id, trains in zip(unit_ids, unit_trains):
+                aligned_spike_trains[stim_type][(c_probe, unit_id)] = trains
+        if short_version:
+            break
+
+    return aligned_spike_trains
@@ -0,0 +1,42 @@
+import numpy as np
+from get_time_window_buffer import get_time_window_buffer
+from get_latency_from_sdf_batch import get_baseline_window, get_latency_from_sdf_v11_batch, get_latency_from_sdf_v12_batch
+
+# Bootstrap confidence intervals of the v11 and v12 latencies without
+# rerunning the SDF per resample: a resample is a row of trial weights (how
+# often each trial was drawn / number of trials), so all the resampled mean
+# SDFs are one matrix product with the per trial SDFs, and the threshold
+# detection runs on all of them at once
+
+def get_bootstrap_weights(num_of_trials, num_of_resamples=200, random_seed=0):
+    # resamples x trials, each row sums to 1
+    random_state = np.random.RandomState(random_seed)
+    trial_inds = random_state.randint(num_of_trials, size=(num_of_resamples, num_of_trials))
+    # Draw counts of every row in one bincount (row r counts into r*num_of_trials + trial)
+    row_offsets = num_of_trials*np.arange(num_of_resamples)[:, None]
+    counts = np.bincount((trial_inds + row_offsets).ravel(), minlength=num_of_resamples*num_of_trials)
+    return counts.reshape(num_of_resamples, num_of_trials)/float(num_of_trials)
+
+def get_bootstrap_latencies_v11(all_sdfs, weights, number_of_std=4, min_response_window=10):
+    # all_sdfs: trials x time with the buffer, as get_sdf_from_spike_train
+    time_window_buffer = get_time_window_buffer()
+    mean_sdfs = weights.dot(all_sdfs)[:, time_window_buffer:-1*time_window_buffer]
+    return get_latency_from_sdf_v11_batch(mean_sdfs, number_of_std, min_response_window)
+
+def get_bootstrap_latencies_v12(all_sdfs, weights, number_of_std=3, min_response_window=10):
+    # As the engine's v12, on the SDFs with the buffer
+    baseline_window = get_baseline_window()
+    mean_sdfs = weights.dot(all_sdfs)
+    # Weighted trial std of every resample from the second moment, only in the baseline window
+    baseline_sq_means = weights.dot(all_sdfs[:, baseline_window]**2)
+    baseline_std_sdfs = np.sqrt(np.maximum(baseline_sq_means - mean_sdfs[:, baseline_window]**2, 0))
+    return get_latency_from_sdf_v12_batch(mean_sdfs, baseline_std_sdfs, all_sdfs.shape[0], number_of_std, min_response_window)
+
+def get_latency_ci(latencies, ci=95):
+    # Percentile interval of the resampled latencies where one was found (nan
+    # if less than half of the resamples found one)
+    found = latencies[~np.isnan(latencies)]
+    if len(found) < len(latencies)/2. or len(found) == 0:
+        return np.nan, np.nan
+    ci_low, ci_high = np.percentile(found, [(100 - ci)/2., 100 - (100 - ci)/2.])
+    return ci_low, ci_high
@@ -2,21 +2,19 @@ import numpy as np
 import pandas as pd
 from get_full_latency_dataframe import get_full_latency_dataframe
 from get_all_cortical_regions import get_all_cortical_regions
+from latency_dataset import LatencyDataset
 
-def get_depth_thresh_dict(stim_type):
-	full_latency_dataframe = get_full_latency_dataframe(stim_type)
-	all_regions = np.unique(full_latency_dataframe['region'])
+def get_depth_thresh_dict(stim_type, latency_dataset=None):
+	if latency_dataset is None:
+		latency_dataset = LatencyDataset(get_full_latency_dataframe(stim_type), stim_type)
 	all_cortical_regions = get_all_cortical_regions()
-	all_exps = np.unique(full_latency_dataframe['experiment'])
+	all_exps = latency_dataset.unique('experiment')
 
-	c_ind = 0
-	all_lables = []
 	final_dict = {}
 	for exp in all_exps:
-		all_probes = np.unique(full_latency_dataframe[full_latency_dataframe['experiment'] == exp]['probe'])
+		all_probes = latency_dataset.unique('probe', experiment=exp)
 		for probe in all_probes:
-			all_depths = full_latency_dataframe[(full_latency_dataframe['experiment'] == exp) & (full_latency_dataframe['probe'] == probe) & (full_latency_dataframe['region'].isin(all_cortical_regions))]['depth'].values.astype(int)
+			all_depths = latency_dataset.values('depth', experiment=exp, probe=probe, region=all_cortical_regions)
 			final_dict[exp+'_'+probe] = all_depths.min()+((all_depths.max() - all_depths.min())/2)
 
-	return final_dict
-		
+	return final_dict
\ No newline at end of file
@@ -4,78 +4,118 @@ import pandas as pd
 import os
 import datetime
 from get_spike_train_values_from_key import get_spike_train_values_from_key
-from get_mean_sdf_from_spike_train import get_mean_sdf_from_spike_train
-from get_latency_from_sdf_v11 import get_latency_from_sdf_v11
-from get_latency_from_sdf_v12 import get_latency_from_sdf_v12
 from get_latency_dataframe import get_latency_dataframe
-from get_time_window_buffer import get_time_window_buffer
-from get_prestimulus_time import get_prestimulus_time
+from latency_engine import LatencyEngine, latency_methods
 from get_resource_path import get_resource_path
-from get_latency_from_sdf_v2 import get_latency_from_sdf_v2
 from get_frames_name import get_frames_name
+from get_aligned_spike_trains import get_aligned_spike_trains
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from stage_profiler import profile_stage, set_report_path
 
-if not get_run_on_server():
-    from plot_raster_sdf import plot_raster_sdf
+def get_pre_stim_dict(latency_engine, artifacts):
+    # Baseline lines of the figure come from v12 (or v11), run here on the
+    # artifacts' SDFs if the engine hasn't
+    for method in ['v12', 'v11']:
+        if method in artifacts.pre_stim_dicts:
+            return artifacts.pre_stim_dicts[method]
+    for method in ['v12', 'v11']:
+        if method in latency_engine.methods:
+            latency_methods[method](artifacts, **latency_engine.method_params.get(method, {}))
+            return artifacts.pre_stim_dicts[method]
+    return None
 
-def get_experiment_latency_dataframe(data_set, multi_probe_filename, short_version=False, split_frames=False, stim_type='natural_scenes'):
-    latency_dataframe = get_latency_dataframe()
+def get_experiment_latency_dataframe(data_set, multi_probe_filename, short_version=False, split_frames=False, stim_type='natural_scenes',
+    latency_methods=None, method_params=None, sdf_chunk_size=None, aligned_spike_trains=None, probes=None):
+    # latency_methods: names registered in latency_engine (default v11, v12 and v2),
+    # all computed from one raster and SDF pass per spike train. sdf_chunk_size
+    # bounds memory: only that many trials' SDFs are held at a time.
+    # With split_frames every unit is aligned once and the latency of each
+    # frame comes from the unit's trial SDFs grouped by frame.
+    # aligned_spike_trains: get_aligned_spike_trains(...)[stim_type], to align
+    # several stimulus types in one pass (aligned here if not given).
+    # probes: only these probes' units (default = all), e.g. one task of a
+    # batch run (see run_latency_task)
+    latency_engine = LatencyEngine(latency_methods, method_params, chunk_size=sdf_chunk_size)
+    latency_dataframe = get_latency_dataframe(latency_engine.columns)
 
-    pre_stimulus_time = float(get_prestimulus_time())/1000
+    inner_char_sep = '__'
     probe_spikes = {}
     probe_spikes_images = {}
     probe_spikes_times = {}
-    time_window_buffer = float(get_time_window_buffer())/1000
-    for c_probe in np.unique(data_set.unit_df['probe']):
-        probe_units = data_set.unit_df[data_set.unit_df['probe'] == c_probe]
-        c_spikes = data_set.spike_times[c_probe]
-        for unit_id, unit in probe_units.iterrows():
-            unit_spike_train = c_spikes[unit['unit_id']]
-            if data_set.stim_tables.has_key(stim_type):
-                for ind, stim_row in data_set.stim_tables[stim_type].iterrows():
-                    stimulus_train = unit_spike_train[(unit_spike_train > stim_row['start'] - pre_stimulus_time) & (unit_spike_train < stim_row['end'] + time_window_buffer)] - stim_row['start']
-                    inner_char_sep = '__'
-                    if split_frames:
-                        train_id = multi_probe_filename + inner_char_sep + c_probe + inner_char_sep + \
-                        unit['structure'] + inner_char_sep + unit['unit_id'] + inner_char_sep + str(unit['depth']) + inner_char_sep + str(int(stim_row[get_frames_name(stim_type)]))
-                    else:
-                        train_id = multi_probe_filename + inner_char_sep + c_probe + inner_char_sep + \
-                        unit['structure'] + inner_char_sep + unit['unit_id'] + inner_char_sep + str(unit['depth'])
-                    
-                    if not probe_spikes.has_key(train_id):
-                        probe_spikes[train_id] = []
-                        probe_spikes_images[train_id] = []
-                        probe_spikes_times[train_id] = []
-                    probe_spikes[train_id].append(stimulus_train)
-                    probe_spikes_images[train_id].append(int(stim_row[get_frames_name(stim_type)]))
-                    probe_spikes_times[train_id].append(stim_row['start'])
-        if short_version:
-            break
+    with profile_stage('align'):
+        if aligned_spike_trains is None:
+            aligned_spike_trains = get_aligned_spike_trains(data_set, [stim_type], short_version, probes)[stim_type]
+        if len(aligned_spike_trains) > 0:
+            stim_table = data_set.stim_tables[stim_type]
+            stim_images = [int(frame) for frame in stim_table[get_frames_name(stim_type)]]
+            stim_starts = list(stim_table['start'])
+        for c_probe in np.unique(data_set.unit_df['probe']):
+            if probes is not None and c_probe not in probes:
+                continue
+            probe_units = data_set.unit_df[data_set.unit_df['probe'] == c_probe]
+            for unit_id, unit in probe_units.iterrows():
+                if (c_probe, unit['unit_id']) not in aligned_spike_trains:
+                    continue
+                train_id = multi_probe_filename + inner_char_sep + c_probe + inner_char_sep + \
+                unit['structure'] + inner_char_sep + unit['unit_id'] + inner_char_sep + str(unit['depth'])
+                probe_spikes[train_id] = aligned_spike_trains[(c_probe, unit['unit_id'])]
+                probe_spikes_images[train_id] = stim_images
+                probe_spikes_times[train_id] = stim_starts
+            if short_version:
+                break
 
-    output_path = get_resource_path() + 'Latency_results/'
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    c_output_path = output_path + str(datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")) + '/'
+    # Workers of a batch run (see run_latency_task) share the timestamp
+    # folder, another one may create it between the check and makedirs
+    c_output_path = get_resource_path() + 'Latency_results/' + str(datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")) + '/'
     if not os.path.exists(c_output_path):
-        os.makedirs(c_output_path)
+        try:
+            os.makedirs(c_output_path)
+        except OSError:
+            if not os.path.isdir(c_output_path):
+                raise
+    # Stage profile (if enabled) is saved with this run's figures
+    set_report_path(c_output_path)
 
-    for st_ind, spike_train_name in enumerate(probe_spikes.keys()):
-        st_vals = get_spike_train_values_from_key(spike_train_name)
+    st_ind = 0
+    for spike_train_name in probe_spikes.keys():
         # st_hist = get_hist_from_spike_train(st_vals)
         # hist_latency = get_latency_from_hist(st_hist)
-        mean_sdf, spike_raster, all_sdfs = get_mean_sdf_from_spike_train(probe_spikes[spike_train_name])
-        sdf_latency, response_type, pre_stim_dict = get_latency_from_sdf_v11(mean_sdf)
-        sdf_latency2, response_type2, pre_stim_dict = get_latency_from_sdf_v12(all_sdfs)        
-        # sdf_latency3, response_type3 = get_latency_from_sdf_v2(mean_sdf)
-        st_vals['latency_psth'] = 0
-        st_vals['latency_sdf'] = sdf_latency
-        st_vals['response_type'] = response_type
-        st_vals['latency_sdf_v2'] = sdf_latency2
-        st_vals['response_type_v2'] = response_type2
-        latency_dataframe.loc[st_ind] = st_vals
+        if split_frames:
+            frames, frame_latency_values, frame_artifacts = latency_engine.run_groups(probe_spikes[spike_train_name], probe_spikes_images[spike_train_name])
+            frame_keys = [spike_train_name + inner_char_sep + str(frame) for frame in frames]
+        else:
+            frame_keys = [spike_train_name]
 
-        if not get_run_on_server():
-            fig_file_name = c_output_path + spike_train_name
-            fig_path = fig_file_name + '_sdf.png'
-            plot_raster_sdf(spike_train_name, probe_spikes[spike_train_name], probe_spikes_images[spike_train_name], mean_sdf, st_vals, pre_stim_dict, fig_path)
+        for frame_ind, frame_key in enumerate(frame_keys):
+            if split_frames:
+                latency_values = dict((column, values[frame_ind]) for column, values in frame_latency_values.items())
+            else:
+                latency_values, artifacts = latency_engine.run(probe_spikes[spike_train_name])
+
+            st_vals = get_spike_train_values_from_key(frame_key)
+            with profile_stage('dataframe'):
+                st_vals['latency_psth'] = 0
+                st_vals.update(latency_values)
+                latency_dataframe.loc[st_ind] = st_vals
+            st_ind += 1
+
+            if not get_run_on_server():
+                # The frame's trials are only gathered for its figure
+                if split_frames:
+                    artifacts = frame_artifacts.group_artifacts(frame_ind)
+                    spike_trains = artifacts.spike_trains
+                    spike_images = [frames[frame_ind]]*len(spike_trains)
+                else:
+                    spike_trains = probe_spikes[spike_train_name]
+                    spike_images = probe_spikes_images[spike_train_name]
+                pre_stim_dict = get_pre_stim_dict(latency_engine, artifacts)
+                if pre_stim_dict is None:
+                    continue
+                fig_path = c_output_path + frame_key + '_sdf.png'
+                with profile_stage('plot'):
+                    # Imported on the first figure, the latency core doesn't need matplotlib
+                    from plot_raster_sdf import plot_raster_sdf
+                    plot_raster_sdf(frame_key, spike_trains, spike_images, artifacts.mean_sdf, st_vals, pre_stim_dict, fig_path)
 
     return latency_dataframe
\ No newline at end of file
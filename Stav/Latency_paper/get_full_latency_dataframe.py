@@ -1,16 +1,35 @@
+import os
 import numpy as np
 import pandas as pd
 from get_all_exp_file_names import get_all_exp_file_names
 from get_resource_path import get_resource_path
 from load_exp_dataframe import load_exp_dataframe
+from normalize_latency_dataframe import normalize_latency_dataframe
 
-def get_full_latency_dataframe(stim_type):
+# stim_type -> (file modification times, normalized dataframe)
+latency_dataframe_cache = {}
+
+def get_full_latency_dataframe(stim_type, use_cache=True):
 	resource_folder = get_resource_path()
 	all_exp_files = get_all_exp_file_names()
 
+	# Reload whenever one of the experiment tables was re-saved
+	file_names = [resource_folder + 'Latency_tables/' + stim_type + '_' + exp_file + '_latency_table.pkl' for exp_file in all_exp_files]
+	file_times = [os.path.getmtime(file_name) for file_name in file_names]
+	if use_cache and stim_type in latency_dataframe_cache:
+		cached_times, full_latency_dataframe = latency_dataframe_cache[stim_type]
+		# A copy, so callers adding columns don't change the cached table
+		if cached_times == file_times:
+			return full_latency_dataframe.copy()
+
 	full_latency_dataframe = []
 	for exp_file in all_exp_files:
 	    latency_dataframe = load_exp_dataframe(stim_type + '_' + exp_file, resource_folder + 'Latency_tables/')
 	    full_latency_dataframe.append(latency_dataframe)
 	full_latency_dataframe = pd.concat(full_latency_dataframe, ignore_index=True)
+	full_latency_dataframe = normalize_latency_dataframe(full_latency_dataframe)
+
+	if use_cache:
+		latency_dataframe_cache[stim_type] = (file_times, full_latency_dataframe)
+		return full_latency_dataframe.copy()
 	return full_latency_dataframe
\ No newline at end of file
@@ -1,7 +1,10 @@
 import pandas as pd
 
-def get_latency_dataframe():
+def get_latency_dataframe(latency_columns=None):
+    # latency_columns: the columns of the latency methods used (LatencyEngine.columns)
+    if latency_columns is None:
+        latency_columns = ['latency_sdf', 'response_type', 'latency_sdf_v2', 'response_type_v2']
     df_columns = ['full_unit_id', 'experiment', 'probe', 'region', 'depth', 
-    'unit_id', 'latency_psth', 'latency_sdf', 'response_type', 'latency_sdf_v2', 'response_type_v2', 'frame']
+    'unit_id', 'latency_psth'] + list(latency_columns) + ['frame']
     latency_dataframe = pd.DataFrame(columns=df_columns)
     return latency_dataframe
\ No newline at end of file
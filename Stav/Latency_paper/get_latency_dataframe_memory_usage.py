@@ -0,0 +1,12 @@
+import pandas as pd
+
+def get_latency_dataframe_memory_usage(latency_dataframe, print_report=True):
+	memory_usage = latency_dataframe.memory_usage(index=True, deep=True)
+	dtypes = latency_dataframe.dtypes.astype(str)
+	dtypes['Index'] = ''
+	memory_report = pd.DataFrame({'dtype': dtypes, 'MB': memory_usage / 1024.0**2})
+	memory_report = memory_report.loc[memory_usage.index]
+	if print_report:
+		print(memory_report)
+		print('Total: ' + str(round(memory_report['MB'].sum(), 2)) + ' MB for ' + str(len(latency_dataframe)) + ' rows')
+	return memory_report
\ No newline at end of file
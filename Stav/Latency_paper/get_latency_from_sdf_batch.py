@@ -0,0 +1,64 @@
+import numpy as np
+from get_prestimulus_time import get_prestimulus_time
+from get_time_window_buffer import get_time_window_buffer
+from get_baseline_window_size import get_baseline_window_size
+
+# get_latency_from_sdf_v11 and get_latency_from_sdf_v12_stats on many mean
+# sdfs at once (bootstrap resamples, frames of one unit), returning arrays
+# of latencies and response types instead of one value each
+
+def get_baseline_window():
+    # The baseline slice of v11 / v12 (around onset in the sdfs without the buffer)
+    baseline_window_size = get_baseline_window_size()
+    pre_stimulus_time = get_prestimulus_time() - get_time_window_buffer()
+    return slice(pre_stimulus_time-baseline_window_size, pre_stimulus_time+baseline_window_size)
+
+def get_first_responses(flagged_sdfs, min_response_window, include_last_start=False):
+    # Per row, the first index starting min_response_window bins flagged 1 (or
+    # -1) in a row, as the loop of get_latency_from_sdf_v11, which doesn't try
+    # the last possible start (the loop in Sara's LatencyAnalysis does:
+    # include_last_start=True). nan where there is none
+    num_of_starts = flagged_sdfs.shape[1] - min_response_window + int(include_last_start)
+    latencies = np.full(len(flagged_sdfs), np.nan)
+    response_types = np.full(len(flagged_sdfs), np.nan)
+    if num_of_starts <= 0:
+        return latencies, response_types
+    for c_type in [1, -1]:
+        in_run = np.concatenate((np.zeros((len(flagged_sdfs), 1)), np.cumsum(flagged_sdfs == c_type, axis=1)), axis=1)
+        full_runs = in_run[:, min_response_window:min_response_window + num_of_starts] - in_run[:, :num_of_starts] == min_response_window
+        has_run = full_runs.any(axis=1)
+        first_run = np.where(has_run, np.argmax(full_runs, axis=1), np.nan)
+        earlier = has_run & ~(first_run >= latencies)
+        latencies[earlier] = first_run[earlier]
+        response_types[earlier] = c_type
+    return latencies, response_types
+
+def get_threshold_latencies(mean_sdfs, baseline_means, baseline_spreads, number_of_std, min_response_window):
+    # mean_sdfs: rows x time (onset at pre_stimulus_time), the thresholds are
+    # baseline_mean +- number_of_std*baseline_spread per row
+    pre_stimulus_time = get_prestimulus_time() - get_time_window_buffer()
+    post_stimulus_sdfs = mean_sdfs[:, pre_stimulus_time:]
+    positive_threshold = (baseline_means + number_of_std*baseline_spreads)[:, None]
+    negative_threshold = (baseline_means - number_of_std*baseline_spreads)[:, None]
+    flagged_post_stim_sdfs = np.zeros(post_stimulus_sdfs.shape)
+    flagged_post_stim_sdfs[post_stimulus_sdfs > positive_threshold] = 1
+    flagged_post_stim_sdfs[post_stimulus_sdfs < negative_threshold] = -1
+    return get_first_responses(flagged_post_stim_sdfs, min_response_window)
+
+def get_latency_from_sdf_v11_batch(mean_sdfs, number_of_std=4, min_response_window=10):
+    # mean_sdfs: rows x time, each as passed to get_latency_from_sdf_v11
+    mean_sdfs = np.atleast_2d(mean_sdfs)
+    baseline_sdfs = mean_sdfs[:, get_baseline_window()]
+    return get_threshold_latencies(mean_sdfs, baseline_sdfs.mean(axis=1), baseline_sdfs.std(axis=1),
+        number_of_std, min_response_window)
+
+def get_latency_from_sdf_v12_batch(mean_SDFs, baseline_std_SDFs, num_of_trials, number_of_std=3, min_response_window=10):
+    # mean_SDFs: rows x time, as passed to get_latency_from_sdf_v12_stats.
+    # Only the baseline window of the std is used, so baseline_std_SDFs is
+    # std_SDF[get_baseline_window()] of every row. num_of_trials: one number
+    # or one per row
+    mean_SDFs = np.atleast_2d(mean_SDFs)
+    num_of_trials = np.asarray(num_of_trials, dtype=float).reshape(-1, 1)
+    baseline_CI95 = np.mean(np.atleast_2d(baseline_std_SDFs)/np.sqrt(num_of_trials)*1.96, axis=1)
+    return get_threshold_latencies(mean_SDFs, mean_SDFs[:, get_baseline_window()].mean(axis=1), baseline_CI95,
+        number_of_std, min_response_window)
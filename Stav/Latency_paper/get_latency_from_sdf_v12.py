@@ -4,12 +4,16 @@ from get_time_window_buffer import get_time_window_buffer
 from get_baseline_window_size import get_baseline_window_size
 
 def get_latency_from_sdf_v12(all_sdfs, number_of_std=3, min_response_window=10):
+    mean_SDF = all_sdfs.mean(axis=0)
+    std_SDF = all_sdfs.std(axis=0)
+    return get_latency_from_sdf_v12_stats(mean_SDF, std_SDF, len(all_sdfs), number_of_std, min_response_window)
+
+def get_latency_from_sdf_v12_stats(mean_SDF, std_SDF, num_of_trials, number_of_std=3, min_response_window=10):
+    # Same as v12, from the trial mean and std of the SDFs
     baseline_window_size = get_baseline_window_size()
     pre_stimulus_time = get_prestimulus_time() - get_time_window_buffer()
 
-    mean_SDF = all_sdfs.mean(axis=0)
-    std_SDF = all_sdfs.std(axis=0)
-    SEM_SDF = std_SDF/np.sqrt(len(all_sdfs))
+    SEM_SDF = std_SDF/np.sqrt(num_of_trials)
     CI95_SDF = SEM_SDF*1.96
     CI99_SDF = SEM_SDF*2.58
     
@@ -0,0 +1,72 @@
+import numpy as np
+from get_prestimulus_time import get_prestimulus_time
+from get_time_window_buffer import get_time_window_buffer
+
+# get_latency_from_sdf_v2 with the peaks and troughs of each sdf found once.
+# The walk only looks at prefixes of the post stimulus sdf, and (strict)
+# peaks and troughs inside a prefix are those of the whole sdf, so every
+# find_min_highfire / argrelextrema call becomes a searchsorted. Returns nan
+# (instead of raising) when no peak passes the threshold or none follows the
+# trough
+
+def get_peak_threshold(sdf_stims, peaks_mask):
+    # 75th percentile + 1.5 iqr of the peak values of each row (nan without peaks)
+    peak_values = np.where(peaks_mask, sdf_stims, np.nan)
+    has_peaks = peaks_mask.any(axis=1)
+    thresh = np.full(len(sdf_stims), np.nan)
+    if has_peaks.any():
+        q75, q25 = np.nanpercentile(peak_values[has_peaks], [75, 25], axis=1)
+        thresh[has_peaks] = q75 + 1.5*(q75 - q25)
+    return thresh
+
+def walk_to_latency_v2(sdf_stim, peaks, troughs, thresh0):
+    passing_peaks = peaks[sdf_stim[peaks] >= thresh0]
+    if len(passing_peaks) == 0:
+        return np.nan
+    subset_length = passing_peaks[0]
+    out_idx = 0
+    while subset_length >= 3:
+        # find_min_highfire(sdf_stim[:subset_length])
+        t_ind = np.searchsorted(troughs, subset_length - 2, side='right') - 1
+        out_idx = troughs[t_ind] if t_ind >= 0 else 1
+        if out_idx == 2:
+            out_idx = 1
+        if sdf_stim[out_idx] < np.percentile(sdf_stim[:out_idx], 75):
+            break
+        # Last peak of sdf_stim[:out_idx]
+        p_ind = np.searchsorted(peaks, out_idx - 2, side='right') - 1
+        if p_ind < 0:
+            break
+        subset_length = peaks[p_ind]
+
+    # Halfway to the next peak
+    p_ind = np.searchsorted(peaks, out_idx, side='right')
+    if p_ind == len(peaks):
+        return np.nan
+    return out_idx + (peaks[p_ind] - out_idx)//2
+
+def get_latency_from_sdf_v2_batch(mean_sdfs):
+    # mean_sdfs: sdfs x time, as passed to get_latency_from_sdf_v2
+    pre_stimulus_time = get_prestimulus_time() - get_time_window_buffer()
+    sdf_stims = np.atleast_2d(np.asarray(mean_sdfs, dtype=float))[:, pre_stimulus_time:]
+
+    # argrelextrema(np.greater) peaks, and troughs as in find_min_highfire
+    peaks_mask = np.zeros(sdf_stims.shape, dtype=bool)
+    peaks_mask[:, 1:-1] = (sdf_stims[:, 1:-1] > sdf_stims[:, :-2]) & (sdf_stims[:, 1:-1] > sdf_stims[:, 2:])
+    troughs_mask = np.zeros(sdf_stims.shape, dtype=bool)
+    troughs_mask[:, 1:-1] = (sdf_stims[:, 1:-1] < sdf_stims[:, 2:]) & (sdf_stims[:, 1:-1] <= sdf_stims[:, :-2])
+    thresh0 = get_peak_threshold(sdf_stims, peaks_mask)
+
+    latencies = np.full(len(sdf_stims), np.nan)
+    for s_ind, sdf_stim in enumerate(sdf_stims):
+        # No peaks, or the highest point is below the threshold
+        if np.isnan(thresh0[s_ind]) or sdf_stim.max() < thresh0[s_ind]:
+            continue
+        latencies[s_ind] = walk_to_latency_v2(sdf_stim, np.flatnonzero(peaks_mask[s_ind]),
+            np.flatnonzero(troughs_mask[s_ind]), thresh0[s_ind])
+    response_types = np.where(np.isnan(latencies), np.nan, 1)
+    return latencies, response_types
+
+def get_latency_from_sdf_v2_fast(mean_sdf):
+    latencies, response_types = get_latency_from_sdf_v2_batch(mean_sdf[None, :])
+    return latencies[0], response_types[0]
@@ -1,7 +1,13 @@
 import numpy as np
 import scipy.stats
 import scipy.signal
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from stage_profiler import profile_stage
+from precision import get_sdf_dtype
 
+@profile_stage('sdf')
 def get_sdf_from_spike_train(spike_train, sigma):
     trials = spike_train.shape[0]
     bins = spike_train.shape[1]
@@ -11,9 +17,9 @@ def get_sdf_from_spike_train(spike_train, sigma):
     edges = np.arange(-3*sigma,3*sigma+.001,.001)
     kernel = scipy.stats.norm.pdf(edges,0, sigma) #Use a gaussian function
     kernel = kernel*.001 #Time 1/1000 so the total area under the gaussian is 1
+    kernel = kernel.astype(get_sdf_dtype()) #float32 in the float32 precision mode
     
     #Compute Spike Density Function for all trials
-    Sdf = np.zeros((trials,bins))
-    Sdf = scipy.signal.convolve(spike_train, kernel[None, :] * 1000, mode='same') 
+    Sdf = scipy.signal.convolve(spike_train.astype(get_sdf_dtype(), copy=False), kernel[None, :] * 1000, mode='same') 
        
     return Sdf
\ No newline at end of file
@@ -0,0 +1,17 @@
+import numpy as np
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from precision import get_sdf_dtype
+from chunked_stats import get_chunked_mean_std
+from convert_spike_times_to_raster import convert_spike_times_to_raster
+from get_sdf_from_spike_train import get_sdf_from_spike_train
+
+def get_sdf_stats_from_spike_train(spike_train, sigma, chunk_size=100):
+    # Trial mean and std of the sdfs (whole window, like all_sdfs.mean(axis=0)
+    # and all_sdfs.std(axis=0)) holding only chunk_size trials of raster and
+    # sdf at a time (merged in float64 by get_chunked_mean_std)
+    chunks = (get_sdf_from_spike_train(convert_spike_times_to_raster(spike_train[start:start + chunk_size]), sigma)
+        for start in range(0, len(spike_train), chunk_size))
+    mean_sdf, std_sdf, num_of_trials = get_chunked_mean_std(chunks)
+    return mean_sdf.astype(get_sdf_dtype()), std_sdf.astype(get_sdf_dtype()), num_of_trials
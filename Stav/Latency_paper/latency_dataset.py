@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+class LatencyDataset(object):
+	# Columns with a sorted index, queried by value (or list of values)
+	index_columns = ['experiment', 'probe', 'region', 'stim_type', 'frame']
+	# Stored as strings in the latency tables
+	int_columns = ['depth', 'frame']
+
+	def __init__(self, latency_dataframe, stim_type=None):
+		latency_dataframe = latency_dataframe.reset_index(drop=True)
+		if 'stim_type' not in latency_dataframe.columns:
+			latency_dataframe['stim_type'] = stim_type
+		self.dataframe = latency_dataframe
+
+		# Cast once, instead of .astype(int) on every query
+		self._int_values = {}
+		for column in self.int_columns:
+			self._int_values[column] = pd.to_numeric(latency_dataframe[column].values).astype(int)
+
+		self._index = {}
+		for column in self.index_columns:
+			values = self._column_values(column)
+			categories, codes = np.unique(values, return_inverse=True)
+			order = np.argsort(codes, kind='mergesort')
+			bounds = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+			self._index[column] = (categories, codes, order, bounds)
+
+		depth = self._column_values('depth')
+		self._depth_order = np.argsort(depth, kind='mergesort')
+		self._sorted_depth = depth[self._depth_order]
+
+	@classmethod
+	def from_stim_types(cls, stim_types):
+		from get_full_latency_dataframe import get_full_latency_dataframe
+		all_dataframes = []
+		for stim_type in stim_types:
+			latency_dataframe = get_full_latency_dataframe(stim_type)
+			latency_dataframe['stim_type'] = stim_type
+			all_dataframes.append(latency_dataframe)
+		return cls(pd.concat(all_dataframes, ignore_index=True))
+
+	def __len__(self):
+		return len(self.dataframe)
+
+	def _column_values(self, column):
+		if column in self._int_values:
+			return self._int_values[column]
+		values = self.dataframe[column].values
+		if column in self.index_columns:
+			return np.asarray(values).astype(str)
+		return values
+
+	def _rows_for_value(self, column, value):
+		categories, codes, order, bounds = self._index[column]
+		if column in self.int_columns:
+			value = int(value)
+		else:
+			value = str(value)
+		c_ind = np.searchsorted(categories, value)
+		if c_ind == len(categories) or categories[c_ind] != value:
+			return np.zeros(0, dtype=int)
+		return order[bounds[c_ind]:bounds[c_ind + 1]]
+
+	def query(self, depth_range=None, **column_values):
+		# Returns the (sorted) row indices matching every condition; a list
+		# of values for a column selects any of them
+		rows = None
+		for column, value in column_values.items():
+			if column not in self._index:
+				raise KeyError('No index for column: ' + column)
+			if isinstance(value, (list, tuple, set, np.ndarray)):
+				c_rows = np.sort(np.concatenate([self._rows_for_value(column, v) for v in value] + [np.zeros(0, dtype=int)]))
+			else:
+				c_rows = self._rows_for_value(column, value)
+			rows = c_rows if rows is None else np.intersect1d(rows, c_rows, assume_unique=True)
+
+		if depth_range is not None:
+			# Inclusive on both ends
+			start = np.searchsorted(self._sorted_depth, depth_range[0], side='left')
+			end = np.searchsorted(self._sorted_depth, depth_range[1], side='right')
+			c_rows = np.sort(self._depth_order[start:end])
+			rows = c_rows if rows is None else np.intersect1d(rows, c_rows, assume_unique=True)
+
+		if rows is None:
+			rows = np.arange(len(self.dataframe))
+		return rows
+
+	def select(self, **query):
+		return self.dataframe.iloc[self.query(**query)]
+
+	def values(self, column, **query):
+		return self._column_values(column)[self.query(**query)]
+
+	def unique(self, column, **query):
+		categories, codes = self._index[column][:2]
+		if not query:
+			return categories
+		return categories[np.unique(codes[self.query(**query)])]
+
+	def group_summary(self, by, column, func=np.median, dropna=True, **query):
+		# Applies func to the column values of each group of the by column,
+		# using the prebuilt index codes instead of a pandas groupby
+		categories, codes = self._index[by][:2]
+		rows = self.query(**query)
+		values = self._column_values(column)[rows].astype(float)
+		group_codes = codes[rows]
+		if dropna:
+			keep = ~np.isnan(values)
+			values = values[keep]
+			group_codes = group_codes[keep]
+		order = np.argsort(group_codes, kind='mergesort')
+		group_list, starts = np.unique(group_codes[order], return_index=True)
+		groups = np.split(values[order], starts[1:]) if len(starts) > 0 else []
+		return pd.Series([func(group) for group in groups], index=categories[group_list])
@@ -0,0 +1,348 @@
+import os
+import sys
+import numpy as np
+from collections import OrderedDict
+from convert_spike_times_to_raster import convert_spike_times_to_raster
+from get_sdf_from_spike_train import get_sdf_from_spike_train
+from get_sdf_stats_from_spike_train import get_sdf_stats_from_spike_train
+from get_prestimulus_time import get_prestimulus_time
+from get_time_window_buffer import get_time_window_buffer
+from get_baseline_window_size import get_baseline_window_size
+from get_latency_from_sdf_v11 import get_latency_from_sdf_v11
+from get_latency_from_sdf_v12 import get_latency_from_sdf_v12_stats
+from get_latency_from_sdf_v2_fast import get_latency_from_sdf_v2_fast, get_latency_from_sdf_v2_batch
+from get_latency_from_sdf_batch import get_baseline_window, get_first_responses, get_latency_from_sdf_v11_batch, get_latency_from_sdf_v12_batch
+from get_bootstrap_latency_ci import get_bootstrap_weights, get_bootstrap_latencies_v11, get_bootstrap_latencies_v12, get_latency_ci
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Rahul'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from get_highfire_starts_fast import get_highfire_starts_fast, get_highfire_starts_batch
+from stage_profiler import profile_stage
+from precision import get_latency_dtype
+
+# A latency method takes the LatencyArtifacts of one spike train (plus its
+# own keyword parameters) and returns {column: value}. Every method reads the
+# same raster, SDFs and statistics, each computed once per spike train and
+# only if some method asks for it
+latency_methods = OrderedDict()
+latency_method_columns = {}
+# A batch method takes LatencyGroupArtifacts and returns {column: array with
+# one value per group}. Methods without one run per group
+latency_batch_methods = {}
+default_latency_methods = ['v11', 'v12', 'v2']
+
+def register_latency_method(name, columns):
+	def register(method):
+		latency_methods[name] = method
+		latency_method_columns[name] = list(columns)
+		return method
+	return register
+
+def register_latency_batch_method(name):
+	def register(method):
+		latency_batch_methods[name] = method
+		return method
+	return register
+
+class LatencyArtifacts(object):
+	def __init__(self, spike_trains, sigma=5, chunk_size=None):
+		self.spike_trains = spike_trains
+		self.num_of_trials = len(spike_trains)
+		self.sigma = sigma
+		# With a chunk_size the mean and std sdfs are accumulated chunk_size
+		# trials at a time, all_sdfs is only computed if a method asks for it
+		self.chunk_size = chunk_size
+		self.time_window_buffer = get_time_window_buffer()
+		# Onset in the SDFs without the buffer (mean_sdf, std_sdf, sem_sdf)
+		self.pre_stimulus_time = get_prestimulus_time() - self.time_window_buffer
+		# Baseline values methods report for plotting, by method name
+		self.pre_stim_dicts = {}
+		self._cache = {}
+
+	def _get(self, name, compute):
+		if name not in self._cache:
+			self._cache[name] = compute()
+		return self._cache[name]
+
+	def _trim(self, sdf):
+		return sdf[self.time_window_buffer:-1*self.time_window_buffer]
+
+	@property
+	def raster(self):
+		return self._get('raster', lambda: convert_spike_times_to_raster(self.spike_trains))
+
+	@property
+	def all_sdfs(self):
+		# Per trial, over the whole window including the buffer
+		return self._get('all_sdfs', lambda: get_sdf_from_spike_train(self.raster, self.sigma))
+
+	def _streaming(self):
+		return self.chunk_size is not None and 'all_sdfs' not in self._cache
+
+	def _sdf_stats(self):
+		mean_sdf, std_sdf, _ = get_sdf_stats_from_spike_train(self.spike_trains, self.sigma, self.chunk_size)
+		self._cache['full_std_sdf'] = std_sdf
+		return mean_sdf
+
+	@property
+	def full_mean_sdf(self):
+		if self._streaming():
+			return self._get('full_mean_sdf', self._sdf_stats)
+		return self._get('full_mean_sdf', lambda: self.all_sdfs.mean(axis=0))
+
+	@property
+	def full_std_sdf(self):
+		if self._streaming() and 'full_std_sdf' not in self._cache:
+			self.full_mean_sdf
+		return self._get('full_std_sdf', lambda: self.all_sdfs.std(axis=0))
+
+	@property
+	def mean_sdf(self):
+		return self._trim(self.full_mean_sdf)
+
+	@property
+	def std_sdf(self):
+		return self._trim(self.full_std_sdf)
+
+	@property
+	def sem_sdf(self):
+		return self.std_sdf/np.sqrt(self.num_of_trials)
+
+	@property
+	def baseline_window(self):
+		baseline_window_size = get_baseline_window_size()
+		return slice(self.pre_stimulus_time - baseline_window_size, self.pre_stimulus_time + baseline_window_size)
+
+	@property
+	def baseline_mean(self):
+		return np.mean(self.mean_sdf[self.baseline_window])
+
+	@property
+	def baseline_std(self):
+		# Spread of the mean SDF around onset
+		return np.std(self.mean_sdf[self.baseline_window])
+
+class LatencyGroupArtifacts(object):
+	# The trials of one spike train split in groups (e.g. the frame of each
+	# trial): one raster and SDF pass for all trials, and the mean SDF of every
+	# group from one grouped sum over the trial SDFs ordered by group (an
+	# add.reduceat, which sums the rows in the same order as mean(axis=0) on
+	# the group alone, so every group gets the values it would on its own).
+	# With a chunk_size the mean and std sdfs of each group are accumulated
+	# chunk_size trials at a time instead, all_sdfs is only computed if a
+	# method asks for it
+	def __init__(self, spike_trains, group_labels, sigma=5, chunk_size=None):
+		self.trial_artifacts = LatencyArtifacts(spike_trains, sigma, chunk_size)
+		self.spike_trains = spike_trains
+		self.sigma = sigma
+		self.chunk_size = chunk_size
+		self.time_window_buffer = self.trial_artifacts.time_window_buffer
+		self.pre_stimulus_time = self.trial_artifacts.pre_stimulus_time
+		self.groups, self.group_inds = np.unique(np.asarray(group_labels), return_inverse=True)
+		self.group_counts = np.bincount(self.group_inds, minlength=len(self.groups))
+		# Trials ordered by group (stable, so in their original order within a
+		# group) and where each group starts in that order
+		self.group_order = np.argsort(self.group_inds, kind='mergesort')
+		self.group_starts = np.concatenate(([0], np.cumsum(self.group_counts)[:-1]))
+		self._cache = {}
+
+	def _get(self, name, compute):
+		if name not in self._cache:
+			self._cache[name] = compute()
+		return self._cache[name]
+
+	@property
+	def all_sdfs(self):
+		return self.trial_artifacts.all_sdfs
+
+	def _group_means(self, trial_values):
+		# groups x time, the mean over the trials of each group
+		return np.add.reduceat(trial_values[self.group_order], self.group_starts, axis=0)/self.group_counts[:, None]
+
+	def _group_stds(self, window):
+		deviations = self.all_sdfs[:, window] - self.full_mean_sdfs[self.group_inds][:, window]
+		return np.sqrt(self._group_means(deviations**2))
+
+	def _streaming(self):
+		return self.chunk_size is not None and 'all_sdfs' not in self.trial_artifacts._cache
+
+	def _group_trains(self, group_ind):
+		return [self.spike_trains[i] for i in np.flatnonzero(self.group_inds == group_ind)]
+
+	def _group_sdf_stats(self):
+		group_stats = [get_sdf_stats_from_spike_train(self._group_trains(group_ind), self.sigma, self.chunk_size)
+			for group_ind in range(len(self.groups))]
+		self._cache['full_std_sdfs'] = np.array([std_sdf for _, std_sdf, _ in group_stats])
+		return np.array([mean_sdf for mean_sdf, _, _ in group_stats])
+
+	@property
+	def full_mean_sdfs(self):
+		if self._streaming():
+			return self._get('full_mean_sdfs', self._group_sdf_stats)
+		return self._get('full_mean_sdfs', lambda: self._group_means(self.all_sdfs))
+
+	@property
+	def full_std_sdfs(self):
+		if self._streaming() and 'full_std_sdfs' not in self._cache:
+			self.full_mean_sdfs
+		return self._get('full_std_sdfs', lambda: self._group_stds(slice(None)))
+
+	@property
+	def baseline_std_sdfs(self):
+		# full_std_sdfs in the v11 / v12 baseline window only
+		if self._streaming() or 'full_std_sdfs' in self._cache:
+			return self.full_std_sdfs[:, get_baseline_window()]
+		return self._get('baseline_std_sdfs', lambda: self._group_stds(get_baseline_window()))
+
+	@property
+	def mean_sdfs(self):
+		return self.full_mean_sdfs[:, self.time_window_buffer:-1*self.time_window_buffer]
+
+	def group_artifacts(self, group_ind):
+		# LatencyArtifacts of one group, sharing the trial SDFs (or, streaming,
+		# the group's mean and std sdfs) already computed
+		in_group = np.flatnonzero(self.group_inds == group_ind)
+		artifacts = LatencyArtifacts(self._group_trains(group_ind), self.sigma, self.chunk_size)
+		if self._streaming():
+			artifacts._cache['full_mean_sdf'] = self.full_mean_sdfs[group_ind]
+			artifacts._cache['full_std_sdf'] = self.full_std_sdfs[group_ind]
+			return artifacts
+		artifacts._cache['raster'] = self.trial_artifacts.raster[in_group]
+		artifacts._cache['all_sdfs'] = self.all_sdfs[in_group]
+		return artifacts
+
+class LatencyEngine(object):
+	def __init__(self, methods=None, method_params=None, sigma=5, chunk_size=None):
+		if methods is None:
+			methods = default_latency_methods
+		for method in methods:
+			if method not in latency_methods:
+				raise KeyError('Unknown latency method: ' + method + ' (registered: ' + ', '.join(latency_methods) + ')')
+		self.methods = list(methods)
+		self.method_params = method_params if method_params is not None else {}
+		self.sigma = sigma
+		self.chunk_size = chunk_size
+
+	@property
+	def columns(self):
+		columns = []
+		for method in self.methods:
+			columns.extend(latency_method_columns[method])
+		return columns
+
+	def run(self, spike_trains):
+		# Returns {column: value} for every method, and the artifacts (for
+		# plotting or further analysis)
+		artifacts = LatencyArtifacts(spike_trains, self.sigma, self.chunk_size)
+		values = OrderedDict()
+		for method in self.methods:
+			with profile_stage('latency'):
+				values.update(latency_methods[method](artifacts, **self.method_params.get(method, {})))
+		# float32 latencies in the float32 precision mode (float64 keeps them as computed)
+		if get_latency_dtype() != np.float64:
+			for column in values:
+				if column.startswith('latency_'):
+					values[column] = get_latency_dtype()(values[column])
+		return values, artifacts
+
+	def run_groups(self, spike_trains, group_labels):
+		# Latencies of every group of trials (e.g. per frame) of one spike
+		# train. Returns the groups, {column: array over groups} and the
+		# artifacts (group_artifacts gives the LatencyArtifacts of one group)
+		artifacts = LatencyGroupArtifacts(spike_trains, group_labels, self.sigma, self.chunk_size)
+		values = OrderedDict()
+		for method in self.methods:
+			params = self.method_params.get(method, {})
+			with profile_stage('latency'):
+				if method in latency_batch_methods:
+					values.update(latency_batch_methods[method](artifacts, **params))
+					continue
+				for column in latency_method_columns[method]:
+					values[column] = np.full(len(artifacts.groups), np.nan)
+				for group_ind in range(len(artifacts.groups)):
+					group_values = latency_methods[method](artifacts.group_artifacts(group_ind), **params)
+					for column in group_values:
+						values[column][group_ind] = group_values[column]
+		if get_latency_dtype() != np.float64:
+			for column in values:
+				if column.startswith('latency_'):
+					values[column] = values[column].astype(get_latency_dtype())
+		return artifacts.groups, values, artifacts
+
+@register_latency_method('v11', ['latency_sdf', 'response_type'])
+def latency_method_v11(artifacts, number_of_std=4, min_response_window=10):
+	latency, response_type, pre_stim_dict = get_latency_from_sdf_v11(artifacts.mean_sdf, number_of_std, min_response_window)
+	artifacts.pre_stim_dicts['v11'] = pre_stim_dict
+	return {'latency_sdf': latency, 'response_type': response_type}
+
+@register_latency_method('v12', ['latency_sdf_v2', 'response_type_v2'])
+def latency_method_v12(artifacts, number_of_std=3, min_response_window=10):
+	# On the SDFs with the buffer, as get_experiment_latency_dataframe has
+	# always run v12
+	latency, response_type, pre_stim_dict = get_latency_from_sdf_v12_stats(artifacts.full_mean_sdf, artifacts.full_std_sdf,
+		artifacts.num_of_trials, number_of_std, min_response_window)
+	artifacts.pre_stim_dicts['v12'] = pre_stim_dict
+	return {'latency_sdf_v2': latency, 'response_type_v2': response_type}
+
+@register_latency_batch_method('v11')
+def latency_batch_method_v11(group_artifacts, number_of_std=4, min_response_window=10):
+	latencies, response_types = get_latency_from_sdf_v11_batch(group_artifacts.mean_sdfs, number_of_std, min_response_window)
+	return {'latency_sdf': latencies, 'response_type': response_types}
+
+@register_latency_batch_method('v12')
+def latency_batch_method_v12(group_artifacts, number_of_std=3, min_response_window=10):
+	latencies, response_types = get_latency_from_sdf_v12_batch(group_artifacts.full_mean_sdfs,
+		group_artifacts.baseline_std_sdfs, group_artifacts.group_counts, number_of_std, min_response_window)
+	return {'latency_sdf_v2': latencies, 'response_type_v2': response_types}
+
+# get_latency_from_sdf_v2 (latency_sdf_v2 already holds v12)
+@register_latency_method('v2', ['latency_sdf_v3', 'response_type_v3'])
+def latency_method_v2(artifacts):
+	latency, response_type = get_latency_from_sdf_v2_fast(artifacts.mean_sdf)
+	return {'latency_sdf_v3': latency, 'response_type_v3': response_type}
+
+@register_latency_batch_method('v2')
+def latency_batch_method_v2(group_artifacts):
+	latencies, response_types = get_latency_from_sdf_v2_batch(group_artifacts.mean_sdfs)
+	return {'latency_sdf_v3': latencies, 'response_type_v3': response_types}
+
+# Rahul's get_highfire_starts, as in Sara's LatencyAnalysisPoissonMethod
+@register_latency_method('highfire', ['latency_highfire'])
+def latency_method_highfire(artifacts, min_start_time=15):
+	latency = get_highfire_starts_fast(artifacts.mean_sdf, artifacts.pre_stimulus_time/1000., min_start_time)
+	return {'latency_highfire': latency}
+
+@register_latency_batch_method('highfire')
+def latency_batch_method_highfire(group_artifacts, min_start_time=15):
+	latencies = get_highfire_starts_batch(group_artifacts.mean_sdfs, group_artifacts.pre_stimulus_time/1000., min_start_time)
+	return {'latency_highfire': latencies}
+
+# Sara's LatencyAnalysis: the mean SDF leaving baseline_mean +- multiplier
+# times the trial std of each bin (0.25 for drifting gratings)
+@register_latency_method('ci', ['latency_ci', 'response_type_ci'])
+def latency_method_ci(artifacts, multiplier=0.125, min_response_window=20):
+	post_stimulus_sdf = artifacts.mean_sdf[artifacts.pre_stimulus_time:]
+	post_stimulus_std = artifacts.std_sdf[artifacts.pre_stimulus_time:]
+	positive_threshold = artifacts.baseline_mean + multiplier*post_stimulus_std
+	negative_threshold = artifacts.baseline_mean - multiplier*post_stimulus_std
+	flagged_post_stim_sdf = np.zeros(post_stimulus_sdf.shape)
+	flagged_post_stim_sdf[post_stimulus_sdf > positive_threshold] = 1
+	flagged_post_stim_sdf[post_stimulus_sdf < negative_threshold] = -1
+	latencies, response_types = get_first_responses(flagged_post_stim_sdf[None, :], min_response_window, include_last_start=True)
+	latency, response_type = latencies[0], response_types[0]
+	# Units that barely fire never get a threshold above 1 Hz
+	if np.all(positive_threshold < 1):
+		latency, response_type = np.nan, np.nan
+	return {'latency_ci': latency, 'response_type_ci': response_type}
+
+# Bootstrap intervals of the v11 and v12 latencies, all resamples from one
+# product of trial weights and the per trial SDFs (so all_sdfs is computed,
+# whatever the chunk_size)
+@register_latency_method('bootstrap', ['latency_sdf_ci_low', 'latency_sdf_ci_high', 'latency_sdf_v2_ci_low', 'latency_sdf_v2_ci_high'])
+def latency_method_bootstrap(artifacts, num_of_resamples=200, ci=95, random_seed=0):
+	weights = get_bootstrap_weights(artifacts.num_of_trials, num_of_resamples, random_seed)
+	latencies_v11, _ = get_bootstrap_latencies_v11(artifacts.all_sdfs, weights)
+	latencies_v12, _ = get_bootstrap_latencies_v12(artifacts.all_sdfs, weights)
+	values = {}
+	values['latency_sdf_ci_low'], values['latency_sdf_ci_high'] = get_latency_ci(latencies_v11, ci)
+	values['latency_sdf_v2_ci_low'], values['latency_sdf_v2_ci_high'] = get_latency_ci(latencies_v12, ci)
+	return values
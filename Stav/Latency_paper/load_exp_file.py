@@ -1,8 +1,14 @@
 import os
+import sys
 from swdb_2018_neuropixels.ephys_nwb_adapter import NWB_adapter
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from experiment_cache import get_cached_experiment
+from stage_profiler import profile_stage
 
+@profile_stage('load')
 def load_exp_file(multi_probe_experiments, experiment, drive_path):
     multi_probe_filename = multi_probe_experiments.iloc[experiment]['nwb_filename']
     nwb_file = os.path.join(drive_path, multi_probe_filename)
-    data_set = NWB_adapter(nwb_file)
+    # Reuses the dataset if this file was already opened in this session
+    data_set = get_cached_experiment(nwb_file, NWB_adapter)
     return data_set, multi_probe_filename[:-4]
\ No newline at end of file
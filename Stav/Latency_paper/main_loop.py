@@ -11,6 +11,7 @@ sys.path.append(basic_path + 'resources/swdb_2018_neuropixels')
 
 from load_exp_file import load_exp_file
 from get_experiment_latency_dataframe import get_experiment_latency_dataframe
+from get_aligned_spike_trains import get_aligned_spike_trains
 from save_exp_dataframe import save_exp_dataframe
 from get_resource_path import get_resource_path
 
@@ -32,13 +33,18 @@ for multi_probe_id in range(len(multi_probe_experiments)):
 	
 	data_set, multi_probe_filename = load_exp_file(multi_probe_experiments, multi_probe_id, drive_path)
 	
-	# 'natural_scenes', 'flash_250ms'
-	current_stim_type = 'flash_250ms'
+	# Stimulus types with frames (see get_frames_name)
+	current_stim_types = ['natural_scenes', 'flash_250ms']
 	current_split_frames = True
 
-	latency_dataframe = get_experiment_latency_dataframe(data_set, multi_probe_filename, 
-		short_version=run_short_version, split_frames=current_split_frames, stim_type=current_stim_type)
-	
-	save_exp_dataframe(latency_dataframe, current_stim_type + '_' + multi_probe_filename, resource_path)
+	# One pass over each unit's spikes for all the stimulus types
+	aligned_spike_trains = get_aligned_spike_trains(data_set, current_stim_types, run_short_version)
+
+	for current_stim_type in current_stim_types:
+		latency_dataframe = get_experiment_latency_dataframe(data_set, multi_probe_filename, 
+			short_version=run_short_version, split_frames=current_split_frames, stim_type=current_stim_type,
+			aligned_spike_trains=aligned_spike_trains[current_stim_type])
+		
+		save_exp_dataframe(latency_dataframe, current_stim_type + '_' + multi_probe_filename, resource_path)
 	
 	print('Done')
\ No newline at end of file
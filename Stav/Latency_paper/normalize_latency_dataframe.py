@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+
+def normalize_latency_dataframe(latency_dataframe):
+	# The saved tables keep everything parsed from the spike train keys as
+	# strings; cast once so callers don't have to
+	latency_dataframe = latency_dataframe.copy()
+	for column in ['experiment', 'probe', 'region']:
+		latency_dataframe[column] = latency_dataframe[column].astype('category')
+	for column in ['depth', 'frame']:
+		latency_dataframe[column] = pd.to_numeric(latency_dataframe[column]).astype(np.int32)
+	for column in latency_dataframe.columns:
+		if column.startswith('latency_'):
+			latency_dataframe[column] = pd.to_numeric(latency_dataframe[column]).astype(np.float32)
+	return latency_dataframe
\ No newline at end of file
@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 from get_full_latency_dataframe import get_full_latency_dataframe
 from get_all_cortical_regions import get_all_cortical_regions
 from get_depth_thresh_dict import get_depth_thresh_dict
+from latency_dataset import LatencyDataset
 
 selected_frame = ''
 
@@ -23,9 +24,14 @@ else:
 split_layers = False
 save_outputs = False
 
-full_latency_dataframe = get_full_latency_dataframe(stim_type)
+latency_dataset = LatencyDataset(get_full_latency_dataframe(stim_type), stim_type)
 
-cortex_depth = get_depth_thresh_dict(stim_type)
+cortex_depth = get_depth_thresh_dict(stim_type, latency_dataset)
+
+# Only filter by frame when one is selected
+frame_query = {}
+if len(selected_frame) > 0:
+    frame_query['frame'] = selected_frame
 
 
 fig, ax = plt.subplots(2,1,figsize=(12,6))
@@ -33,36 +39,26 @@ for c_v_ind, current_version in enumerate(latency_versions):
     latencies_across_region = []
     mean_per_region = []
     all_region_names = []
-    all_regions = np.unique(full_latency_dataframe['region'])
+    all_regions = latency_dataset.unique('region')
     for region in all_regions:
-        if split_layers and region in get_all_crotical_regions():
-            if len(selected_frame) == 0:
-                region_units = full_latency_dataframe[(full_latency_dataframe['region'] == region)]
-            else:
-                region_units = full_latency_dataframe[(full_latency_dataframe['region'] == region) & (full_latency_dataframe['frame'] == selected_frame)]
-            all_top_latencies = []
-            all_bottom_latencies = []
-            for index, row in region_units.iterrows():
-                if not np.isnan(row[current_version]):
-                    depth_thresh = cortex_depth[row['experiment'] + '_' + row['probe']]
-                    if int(row['depth']) > depth_thresh:
-                        all_top_latencies.append(row[current_version])
-                    else:
-                        all_bottom_latencies.append(row[current_version])
-            latencies_across_region.append(np.asarray(all_top_latencies))
+        if split_layers and region in get_all_cortical_regions():
+            region_rows = latency_dataset.query(region=region, **frame_query)
+            region_units = latency_dataset.dataframe.iloc[region_rows]
+            all_latencies = region_units[current_version].values.astype(float)
+            region_depths = latency_dataset.values('depth', region=region, **frame_query)
+            depth_thresh = np.asarray([cortex_depth[exp + '_' + probe] for exp, probe in zip(region_units['experiment'], region_units['probe'])])
+            is_top = region_depths > depth_thresh
+            all_top_latencies = all_latencies[is_top & ~np.isnan(all_latencies)]
+            all_bottom_latencies = all_latencies[~is_top & ~np.isnan(all_latencies)]
+            latencies_across_region.append(all_top_latencies)
             mean_per_region.append(np.median(all_top_latencies))
             all_region_names.append(region + '_T')
 
-            latencies_across_region.append(np.asarray(all_bottom_latencies))
+            latencies_across_region.append(all_bottom_latencies)
             mean_per_region.append(np.median(all_bottom_latencies))
             all_region_names.append(region + '_B')
         else:
-            if len(selected_frame) == 0:
-                region_units = full_latency_dataframe[(full_latency_dataframe['region'] == region)]
-            else:
-                region_units = full_latency_dataframe[(full_latency_dataframe['region'] == region) & (full_latency_dataframe['frame'] == selected_frame)]
-
-            all_latencies = region_units[current_version].values.astype(float)
+            all_latencies = latency_dataset.values(current_version, region=region, **frame_query).astype(float)
             all_latencies = all_latencies[~np.isnan(all_latencies)]
             latencies_across_region.append(all_latencies)
             mean_per_region.append(np.median(all_latencies))
@@ -2,8 +2,9 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from get_full_latency_dataframe import get_full_latency_dataframe
-from get_all_crotical_regions import get_all_crotical_regions
+from get_all_cortical_regions import get_all_cortical_regions
 from get_depth_thresh_dict import get_depth_thresh_dict
+from latency_dataset import LatencyDataset
 
 selected_frame = ''
 
@@ -23,12 +24,17 @@ display_plot = True
 split_layers = False
 save_outputs = False
 
-cortex_depth = get_depth_thresh_dict(stim_type)
+latency_dataset = LatencyDataset(get_full_latency_dataframe(stim_type), stim_type)
 
-full_latency_dataframe = get_full_latency_dataframe(stim_type)
+cortex_depth = get_depth_thresh_dict(stim_type, latency_dataset)
 
-all_exps = np.unique(full_latency_dataframe.experiment)
-regions_in_all_exps = np.unique(full_latency_dataframe.region)
+all_exps = latency_dataset.unique('experiment')
+regions_in_all_exps = latency_dataset.unique('region')
+
+# Only filter by frame when one is selected
+frame_query = {}
+if len(selected_frame) > 0:
+    frame_query['frame'] = selected_frame
 
 if display_plot:
     fig, ax = plt.subplots(1,1,figsize=(12,6))
@@ -36,18 +42,12 @@ else:
     fig, ax = plt.subplots(4,1,figsize=(12,6))
 
 for c_v_ind, exp in enumerate(all_exps):
-    current_latency_dataframe = full_latency_dataframe[(full_latency_dataframe['experiment'] == exp)]
     latencies_across_region = []
     mean_per_region = []
     all_region_names = []
-    all_regions = np.unique(current_latency_dataframe['region'])
+    all_regions = latency_dataset.unique('region', experiment=exp)
     for region in all_regions:
-        if len(selected_frame) == 0:
-            region_units = current_latency_dataframe[(current_latency_dataframe['region'] == region)]
-        else:
-            region_units = current_latency_dataframe[(current_latency_dataframe['region'] == region) & (current_latency_dataframe['frame'] == selected_frame)]
-
-        all_latencies = region_units[current_version].values.astype(float)
+        all_latencies = latency_dataset.values(current_version, experiment=exp, region=region, **frame_query).astype(float)
         all_latencies = all_latencies[~np.isnan(all_latencies)]
         if len(all_latencies) == 0:
             all_latencies = np.zeros(1)
@@ -6,10 +6,10 @@ def plot_raster_sdf(unit_key, spike_times, probe_spikes_images, mean_sdf, st_val
     pre_mean_val = pre_stim_dict['mean']
     pre_std_val = pre_stim_dict['std']
     pre_std_num = pre_stim_dict['std_num']
-    sdf_latency = st_vals['latency_sdf']
-    response_type = st_vals['response_type']
-    sdf_latency_v2 = st_vals['latency_sdf_v2']
-    response_type_v2 = st_vals['response_type_v2']
+    sdf_latency = st_vals.get('latency_sdf', np.nan)
+    response_type = st_vals.get('response_type', np.nan)
+    sdf_latency_v2 = st_vals.get('latency_sdf_v2', np.nan)
+    response_type_v2 = st_vals.get('response_type_v2', np.nan)
     fig,ax = plt.subplots(1,1,figsize=(12,6))
     color_list = get_color_list()
 
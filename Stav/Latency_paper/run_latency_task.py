@@ -0,0 +1,59 @@
+from get_run_on_server import get_run_on_server
+import os
+import sys
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from task_queue import register_analysis, create_tasks, run_local, get_pending_tasks
+
+# Latency analysis as a task of the file queue (Shared/task_queue.py): one
+# experiment x probe x stimulus type per task, so the experiments of main_loop
+# can be spread over the analysis nodes. On every node (with
+# NEUROPIXEL_RUN_ON_SERVER=1):
+#   python ../../Shared/task_queue.py worker QUEUE_DIR --module run_latency_task
+# and once, from anywhere, create_latency_tasks(QUEUE_DIR). On a single
+# machine run_latency_tasks_local shares each experiment's spikes with all the
+# workers instead
+
+def get_drive_path():
+	# As in main_loop
+	if get_run_on_server():
+		return '/data/dynamic-brain-workshop/visual_coding_neuropixels'
+	return 'F:\\visual_coding_neuropixels'
+
+def create_latency_tasks(queue_dir, stim_types=('natural_scenes', 'flash_250ms'), probes=None, params=None, drive_path=None):
+	# One task per multi probe experiment of the manifest (x probe if given),
+	# params: keyword arguments of get_experiment_latency_dataframe
+	if drive_path is None:
+		drive_path = get_drive_path()
+	expt_info_df = pd.read_csv(os.path.join(drive_path, 'ephys_manifest.csv'))
+	multi_probe_experiments = expt_info_df[expt_info_df.experiment_type == 'multi_probe']
+	experiments = [nwb_filename[:-4] for nwb_filename in multi_probe_experiments['nwb_filename']]
+	latency_params = dict(params or {}, drive_path=drive_path)
+	return create_tasks(queue_dir, {'experiments': experiments, 'probes': probes, 'stim_types': list(stim_types),
+		'analyses': ['latency'], 'params': {'latency': latency_params}})
+
+def run_latency_tasks_local(queue_dir, processes=4, drive_path=None):
+	# run_local over the pending experiments, opened once here and shared
+	# (shared_spikes) rather than opened again by every worker
+	from load_exp_file import get_cached_experiment, NWB_adapter
+	if drive_path is None:
+		drive_path = get_drive_path()
+	experiments = sorted(set(task['experiment'] for task in get_pending_tasks(queue_dir)))
+	shared_datasets = dict((experiment, get_cached_experiment(os.path.join(drive_path, experiment + '.nwb'), NWB_adapter)) for experiment in experiments)
+	return run_local(queue_dir, processes=processes, module_names=['run_latency_task'], shared_datasets=shared_datasets)
+
+@register_analysis('latency')
+def run_latency_task(task):
+	from shared_spikes import get_worker_dataset
+	from get_experiment_latency_dataframe import get_experiment_latency_dataframe
+	params = dict(task['params'])
+	drive_path = params.pop('drive_path', None) or get_drive_path()
+	params.setdefault('split_frames', True)
+	# Spikes shared by run_latency_tasks_local, else this worker opens the file
+	data_set = get_worker_dataset(task['experiment'], required=False)
+	if data_set is None:
+		# Imported here so the NWB adapter is only needed on the workers
+		from load_exp_file import get_cached_experiment, NWB_adapter
+		data_set = get_cached_experiment(os.path.join(drive_path, task['experiment'] + '.nwb'), NWB_adapter)
+	probes = [task['probe']] if task['probe'] is not None else None
+	return get_experiment_latency_dataframe(data_set, task['experiment'], stim_type=task['stim_type'], probes=probes, **params)
@@ -1,5 +1,10 @@
 import pickle
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from stage_profiler import profile_stage
 
+@profile_stage('save')
 def save_exp_dataframe(latency_dataframe, multi_probe_filename, resource_path):
 	with open(resource_path + multi_probe_filename + '_latency_table.pkl', 'w') as f:
 		pickle.dump(latency_dataframe, f)
\ No newline at end of file
@@ -18,8 +18,10 @@ from get_latency_from_sdf_v11 import get_latency_from_sdf_v11
 from plot_raster_sdf import plot_raster_sdf
 from get_resource_path import get_resource_path
 from load_exp_file import load_exp_file
+from latency_dataset import LatencyDataset
 
-full_latency_dataframe = get_full_latency_dataframe()
+stim_type = 'natural_scenes'
+latency_dataset = LatencyDataset(get_full_latency_dataframe(stim_type), stim_type)
 
 manifest_file = os.path.join(drive_path,'ephys_manifest.csv')
 expt_info_df = pd.read_csv(manifest_file)
@@ -27,7 +29,8 @@ multi_probe_experiments = expt_info_df[expt_info_df.experiment_type == 'multi_pr
 
 for multi_probe_id in range(len(multi_probe_experiments)):    
     data_set, multi_probe_filename = load_exp_file(multi_probe_experiments, multi_probe_id, drive_path)
-    low_latency_units = full_latency_dataframe[(full_latency_dataframe.latency_sdf < 50) & (full_latency_dataframe.experiment == multi_probe_filename)]
+    exp_units = latency_dataset.select(experiment=multi_probe_filename)
+    low_latency_units = exp_units[exp_units.latency_sdf < 50]
 
     for index, row in low_latency_units.iterrows():
     	spike_trains = get_spike_trains_from_unit_id(data_set, row['probe'], row['unit_id'])
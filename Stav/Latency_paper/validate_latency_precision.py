@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import os
+import sys
+from latency_engine import LatencyEngine
+from get_prestimulus_time import get_prestimulus_time
+from get_time_window_buffer import get_time_window_buffer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Shared'))
+from precision import use_precision
+
+def get_unit_spike_trains(unit_spike_train, stim_table):
+    # Same window as get_experiment_latency_dataframe
+    pre_stimulus_time = float(get_prestimulus_time())/1000
+    time_window_buffer = float(get_time_window_buffer())/1000
+    spike_trains = []
+    for start, end in zip(stim_table['start'].values, stim_table['end'].values):
+        spike_trains.append(unit_spike_train[(unit_spike_train > start - pre_stimulus_time) & (unit_spike_train < end + time_window_buffer)] - start)
+    return spike_trains
+
+def validate_latency_precision(data_set, stim_type='natural_scenes', latency_methods=None, method_params=None, output_path=None):
+    # Runs every unit through the latency engine in float64 and in float32 and
+    # reports how far the latencies move. Returns the per unit report (both
+    # values and their difference per latency column) and a summary per column:
+    # units where both agree exactly, where only one is nan, and the max / mean
+    # absolute difference (ms) where both found a latency
+    stim_table = data_set.get_stimulus_table(stim_type)
+    latency_engine = LatencyEngine(latency_methods, method_params)
+    latency_columns = [column for column in latency_engine.columns if column.startswith('latency_')]
+
+    rows = []
+    for probe in np.unique(data_set.unit_df['probe']):
+        probe_units = data_set.unit_df[data_set.unit_df['probe'] == probe]
+        for unit_id in probe_units['unit_id']:
+            spike_trains = get_unit_spike_trains(data_set.spike_times[probe][unit_id], stim_table)
+            row = {'probe': probe, 'unit_id': unit_id}
+            for precision in ['float64', 'float32']:
+                with use_precision(precision):
+                    latency_values, _ = latency_engine.run(spike_trains)
+                for column in latency_columns:
+                    row[column + '_' + precision] = float(latency_values[column])
+            for column in latency_columns:
+                row[column + '_diff'] = row[column + '_float32'] - row[column + '_float64']
+            rows.append(row)
+    report_columns = ['probe', 'unit_id']
+    for column in latency_columns:
+        report_columns += [column + '_float64', column + '_float32', column + '_diff']
+    report = pd.DataFrame(rows, columns=report_columns)
+
+    summary_rows = []
+    for column in latency_columns:
+        latency_64 = report[column + '_float64'].values
+        latency_32 = report[column + '_float32'].values
+        both = ~np.isnan(latency_64) & ~np.isnan(latency_32)
+        abs_diff = np.abs(latency_32[both] - latency_64[both])
+        summary_rows.append({'column': column, 'units': len(report),
+            'equal': int(np.sum((latency_64 == latency_32) | (np.isnan(latency_64) & np.isnan(latency_32)))),
+            'nan_mismatch': int(np.sum(np.isnan(latency_64) != np.isnan(latency_32))),
+            'max_abs_diff': abs_diff.max() if len(abs_diff) > 0 else np.nan,
+            'mean_abs_diff': abs_diff.mean() if len(abs_diff) > 0 else np.nan})
+    summary = pd.DataFrame(summary_rows, columns=['column', 'units', 'equal', 'nan_mismatch', 'max_abs_diff', 'mean_abs_diff'])
+
+    if output_path is not None:
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+        report.to_csv(os.path.join(output_path, 'latency_precision_' + stim_type + '.csv'), index=False)
+        summary.to_csv(os.path.join(output_path, 'latency_precision_summary_' + stim_type + '.csv'), index=False)
+    return report, summary